@@ -0,0 +1,244 @@
+"""Async HTTP API over core.py, for pipelines that don't want a browser.
+
+    python api.py                      (or: uvicorn api:app --port 8503)
+
+    GET    /info?url=...               metadata, quality tiers and subtitle languages
+    POST   /jobs                       {"url", "type": "video"|"audio", "tier", "container", "codec", "kbps",
+                                        "start", "end", "accurate"}; start/end (seconds or "h:mm:ss") fetch
+                                        only that clip, cut on keyframes unless accurate is true. A cached
+                                        output comes back without a job, an identical one in flight as that job
+    GET    /jobs/{id}                  job state, progress and result
+    DELETE /jobs/{id}                  cancel; a job other requests joined keeps running for them
+    GET    /jobs/{id}/events           progress as server-sent events, ending with the final state (also for
+                                        jobs another replica of a shared queue runs)
+    GET    /jobs/{id}/file             the finished file
+    GET    /files/{cache_key}          a file from the artifact cache
+    GET    /metrics                    Prometheus metrics of this process
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from jobs import DONE, RUNNING, FINISHED_STATES
+from job_queue import StoredJob
+from scratch import InsufficientSpace
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from core import (
+    VIDEO_TIERS, VIDEO_CONTAINERS, AUDIO_CODECS, AUDIO_BITRATES, DEFAULT_TIER, DEFAULT_AUDIO_BITRATE,
+    PROGRESS_UPDATE_RATE, detect_platform, get_info, describe, get_artifact_cache, get_job_manager,
+    get_progress_bus, parse_clip, video_preview, video_download, audio_download, submit_download, cached_artifact,
+    download_quality, METRICS,
+)
+
+logger = logging.getLogger("UniversalDownloader")
+
+API_HOST = os.environ.get('API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('API_PORT', 8503))
+
+# Seconds between keep-alive comments on an idle event stream
+EVENTS_KEEPALIVE = 15
+
+
+def error(status, message):
+    return JSONResponse({'error': message}, status_code=status)
+
+
+def public_result(result):
+    """A job result without local paths"""
+    if result is None:
+        return None
+    return {k: v for k, v in result.items() if k != 'path'}
+
+
+def job_view(snapshot):
+    view = dict(snapshot, result=public_result(snapshot['result']))
+    if snapshot['state'] == DONE:
+        view['file'] = f"/jobs/{snapshot['id']}/file"
+    return view
+
+
+async def info_endpoint(request):
+    url = request.query_params.get('url')
+    if not url:
+        return error(400, "missing url")
+    try:
+        info = await run_in_threadpool(get_info, url)
+    except Exception as e:
+        logger.info(f"API metadata extraction failed for {url}: {str(e)}")
+        return error(422, str(e))
+    return JSONResponse(await run_in_threadpool(describe, url, info))
+
+
+def plan_request(body, info):
+    """(ydl options, artifact key, mime, media type) for a /jobs body. Raises ValueError on bad choices"""
+    media_type = body.get('type', 'video')
+    clip = parse_clip(body.get('start'), body.get('end'), body.get('accurate', False), info.get('duration'))
+    if media_type == 'video':
+        tier, container = str(body.get('tier', DEFAULT_TIER)), body.get('container', 'auto')
+        if tier not in VIDEO_TIERS or container not in VIDEO_CONTAINERS:
+            raise ValueError(f"tier must be one of {list(VIDEO_TIERS)}, container one of {list(VIDEO_CONTAINERS)}")
+        preview = video_preview(info.get('formats'), tier, container, info.get('duration'))
+        ydl_opts, cache_key, mime, _ = video_download(info, tier, preview=preview, clip=clip)
+    elif media_type == 'audio':
+        codec, kbps = body.get('codec', 'mp3'), str(body.get('kbps', DEFAULT_AUDIO_BITRATE))
+        if codec not in AUDIO_CODECS or kbps not in AUDIO_BITRATES:
+            raise ValueError(f"codec must be one of {list(AUDIO_CODECS)}, kbps one of {list(AUDIO_BITRATES)}")
+        ydl_opts, cache_key, mime, _ = audio_download(info, codec, kbps, clip=clip)
+    else:
+        raise ValueError("type must be 'video' or 'audio'")
+    return ydl_opts, cache_key, mime, media_type
+
+
+def start_job(body):
+    """Blocking part of POST /jobs: extract, plan, then reuse a cached output or queue a job"""
+    url = body['url']
+    info = get_info(url)
+    ydl_opts, cache_key, mime, media_type = plan_request(body, info)
+    platform_id = detect_platform(url)[0]
+    cached = cached_artifact(cache_key, mime, False, platform_id, download_quality(ydl_opts))
+    if cached:
+        return 200, {'job': None, 'cached': True, 'cache_key': cache_key, 'file': f"/files/{cache_key}"}
+    job_id = submit_download(url, ydl_opts, cache_key, mime, info, media_type, platform_id, delivery=False)
+    return 202, {'job': job_id, 'cached': False, 'cache_key': cache_key, 'events': f"/jobs/{job_id}/events"}
+
+
+async def submit_endpoint(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return error(400, "body must be JSON")
+    if not isinstance(body, dict) or not body.get('url'):
+        return error(400, "missing url")
+    try:
+        status, payload = await run_in_threadpool(start_job, body)
+    except ValueError as e:
+        return error(400, str(e))
+    except InsufficientSpace as e:
+        return error(507, str(e))
+    except Exception as e:
+        return error(422, str(e))
+    return JSONResponse(payload, status_code=status)
+
+
+async def job_endpoint(request):
+    job = get_job_manager().get(request.path_params['job_id'])
+    if job is None:
+        return error(404, "no such job")
+    if request.method == 'DELETE':
+        get_job_manager().cancel(job.id)
+    return JSONResponse(job_view(job.snapshot()))
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stored_progress(job):
+    """A progress event built from a job's last recorded status"""
+    status = job.status
+    return {
+        'status': 'downloading' if status.get('phase') == 'downloading' else status.get('phase') or 'queued',
+        'fraction': job.progress,
+        'downloaded': status.get('downloaded'),
+        'total': status.get('total'),
+        'speed': status.get('speed'),
+        'eta': status.get('eta'),
+    }
+
+
+async def events_endpoint(request):
+    job = get_job_manager().get(request.path_params['job_id'])
+    if job is None:
+        return error(404, "no such job")
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    # Bus callbacks run on download threads; hand their events to this connection's loop
+    subscription = get_progress_bus().subscribe(
+        job.id, lambda event: loop.call_soon_threadsafe(queue.put_nowait, event), max_rate=PROGRESS_UPDATE_RATE
+    )
+
+    async def stream():
+        idle, current, last = 0.0, job, None
+        try:
+            while current.state not in FINISHED_STATES:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    current = await run_in_threadpool(get_job_manager().get, job.id) or current
+                    if isinstance(current, StoredJob) and current.state == RUNNING:
+                        # Running in another replica, whose events never reach this bus: relay its stored progress
+                        progress = (current.progress, current.status)
+                        if progress != last:
+                            last, idle = progress, 0.0
+                            yield sse('progress', stored_progress(current))
+                            continue
+                    idle += 1.0
+                    if idle >= EVENTS_KEEPALIVE:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+                    continue
+                idle = 0.0
+                # Scratch paths stay on the server
+                yield sse('progress', {k: v for k, v in event.items() if k != 'filename'})
+            yield sse('state', job_view(current.snapshot()))
+        finally:
+            subscription.unsubscribe()
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+async def job_file_endpoint(request):
+    job = get_job_manager().get(request.path_params['job_id'])
+    if job is None:
+        return error(404, "no such job")
+    snapshot = job.snapshot()
+    if snapshot['state'] != DONE:
+        return error(409, f"job is {snapshot['state']}")
+    result = snapshot['result']
+    if not os.path.exists(result['path']):
+        return error(410, "file no longer available")
+    return FileResponse(result['path'], media_type=result['mime'], filename=result.get('file_name'))
+
+
+async def artifact_file_endpoint(request):
+    path = get_artifact_cache().lookup(request.path_params['cache_key'])
+    if not path:
+        return error(404, "not in the artifact cache")
+    return FileResponse(path, filename=os.path.basename(path))
+
+
+async def metrics_endpoint(request):
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+app = Starlette(routes=[
+    Route('/info', info_endpoint),
+    Route('/jobs', submit_endpoint, methods=['POST']),
+    Route('/jobs/{job_id}', job_endpoint, methods=['GET', 'DELETE']),
+    Route('/jobs/{job_id}/events', events_endpoint),
+    Route('/jobs/{job_id}/file', job_file_endpoint),
+    Route('/files/{cache_key}', artifact_file_endpoint),
+    Route('/metrics', metrics_endpoint),
+])
+
+
+def main(host=API_HOST, port=API_PORT):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    logger.info(f"API listening on {host}:{port}")
+    uvicorn.run(app, host=host, port=port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
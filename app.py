@@ -1,30 +1,31 @@
 import streamlit as st
-import yt_dlp
+import io
 import logging
 import os
 import sys
-import time
-import tempfile
-import base64
 from datetime import datetime
-import streamlit.components.v1 as components
-import re
-from pathlib import Path
+from metadata_cache import canonical_video_key
+from jobs import QUEUED, RUNNING, DONE, ERROR, FINISHED_STATES
+from scratch import InsufficientSpace
+from session_memory import MediaSummary, SessionBudget
+from thumbnails import MAX_SOURCE_BYTES
+from batch import parse_urls, extract_batch, group_by_platform, write_zip
+from format_planner import preview_audio
+from core import (
+    PLATFORMS, BATCH_INFO_WORKERS, DEFAULT_TIER, REPLICA_ID, SPECULATIVE_PREFETCH,
+    log_message, detect_platform, format_duration, format_filesize,
+    get_metadata_cache, get_info_reuse, get_artifact_cache, get_thumbnail_cache, get_selector_evaluator,
+    get_file_server, get_ydl_pool, get_job_manager, get_prefetcher, fetch_info, get_info,
+    summary_formats, fetch_url, available_subtitles, fetch_subtitle_bundle,
+    video_preview, video_download, audio_download, default_video_download, parse_clip, planned_size, download_task,
+    submit_download, local_result, cached_artifact, download_quality, batch_item, start_batch_downloads,
+    batch_video_plan, batch_audio_plan,
+)
 
 # --- 1. Configuration & Constants ---
+# Download settings, services and the download engine itself live in core.py; these are the UI's
 
-PLATFORMS = {
-    'youtube': {'name': 'YouTube', 'icon': '🔴', 'pattern': r'(youtube\.com|youtu\.be)'},
-    'tiktok': {'name': 'TikTok', 'icon': '🎵', 'pattern': r'tiktok\.com'},
-    'instagram': {'name': 'Instagram', 'icon': '📸', 'pattern': r'instagram\.com'},
-    'twitter': {'name': 'X/Twitter', 'icon': '🐦', 'pattern': r'(twitter\.com|x\.com)'},
-    'facebook': {'name': 'Facebook', 'icon': '📘', 'pattern': r'facebook\.com'},
-    'vimeo': {'name': 'Vimeo', 'icon': '🎬', 'pattern': r'vimeo\.com'},
-    'twitch': {'name': 'Twitch', 'icon': '💜', 'pattern': r'twitch\.tv'},
-    'reddit': {'name': 'Reddit', 'icon': '🟠', 'pattern': r'reddit\.com'},
-    'dailymotion': {'name': 'Dailymotion', 'icon': '🌐', 'pattern': r'dailymotion\.com'},
-    'other': {'name': 'אחר', 'icon': '🌍', 'pattern': r'.*'}
-}
+JOB_POLL_INTERVAL = 1.0
 
 AUDIO_QUALITIES = {
     '🎵 320kbps (הכי טוב)': '320',
@@ -32,6 +33,40 @@ AUDIO_QUALITIES = {
     '🔊 128kbps (בסיסי)': '128'
 }
 
+RESOLUTION_MAP = {
+    "🌟 הכי טוב (Best)": 'best',
+    "📺 4K (2160p)": '2160',
+    "🖥️ Full HD (1080p)": '1080',
+    "📹 HD (720p)": '720',
+    "📱 SD (480p)": '480',
+    "📟 Low (360p)": '360',
+}
+DEFAULT_RESOLUTION = next(label for label, tier in RESOLUTION_MAP.items() if tier == DEFAULT_TIER)
+
+# Output containers for video. "Auto" picks whichever one needs no conversion
+VIDEO_CONTAINERS = {
+    "✨ אוטומטי (ללא המרה)": 'auto',
+    "📼 MP4 בלבד (תאימות מרבית)": 'mp4',
+}
+
+AUDIO_FORMATS = {"MP3": "mp3", "M4A": "m4a", "WAV": "wav"}
+
+AUDIO_PATH_LABELS = {
+    'copy': "⚡ ללא המרה: הזרם המקורי מועתק כמו שהוא",
+    'transcode': "🔄 נדרשת המרה (קידוד מחדש)",
+}
+
+# Subtitles-only downloads: output formats and languages per request
+SUBTITLE_FORMATS = {"SRT": 'srt', "VTT": 'vtt', "📄 טקסט (TXT)": 'txt'}
+SUBTITLE_MAX_LANGUAGES = 10
+
+# What one session may hold in memory (current video summary, history, batch); older history goes first
+SESSION_MEMORY_BUDGET = int(os.environ.get('SESSION_MEMORY_BUDGET', 256 * 1024))
+HISTORY_MAX = 50
+
+# Batch mode
+BATCH_MAX_URLS = 50
+
 # --- 2. Logging Setup ---
 
 logging.basicConfig(
@@ -41,9 +76,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger("UniversalDownloader")
 
-def log_message(msg):
-    logger.info(msg)
-
 # --- 3. Page Config ---
 
 st.set_page_config(
@@ -55,481 +87,347 @@ st.set_page_config(
 
 # --- 4. Premium CSS Styles ---
 
-st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Heebo:wght@300;400;500;600;700;800&family=Rubik:wght@400;500;600;700&display=swap');
-
-    :root {
-        --bg-primary: #0a0a0f;
-        --bg-secondary: #12121a;
-        --bg-card: rgba(25, 25, 35, 0.8);
-        --text-primary: #ffffff;
-        --text-secondary: #a0a0b0;
-        --accent-1: #ff3366;
-        --accent-2: #8b5cf6;
-        --accent-3: #00d4ff;
-        --glass-border: rgba(255, 255, 255, 0.1);
-        --glow-1: rgba(255, 51, 102, 0.4);
-        --glow-2: rgba(139, 92, 246, 0.4);
-    }
-
-    .stApp {
-        direction: rtl;
-        text-align: right;
-        font-family: 'Heebo', sans-serif;
-        background: linear-gradient(135deg, var(--bg-primary) 0%, #1a1a2e 50%, #0f0f1a 100%);
-        min-height: 100vh;
-    }
-    
-    /* Animated background */
-    .stApp::before {
-        content: '';
-        position: fixed;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background: 
-            radial-gradient(circle at 20% 80%, var(--glow-1) 0%, transparent 50%),
-            radial-gradient(circle at 80% 20%, var(--glow-2) 0%, transparent 50%),
-            radial-gradient(circle at 50% 50%, rgba(0, 212, 255, 0.1) 0%, transparent 50%);
-        pointer-events: none;
-        z-index: -1;
-        animation: pulse 8s ease-in-out infinite;
-    }
-    
-    @keyframes pulse {
-        0%, 100% { opacity: 0.6; }
-        50% { opacity: 1; }
-    }
-
-    /* Typography */
-    h1, h2, h3, h4, h5, h6 {
-        font-family: 'Rubik', sans-serif;
-        font-weight: 700;
-        color: var(--text-primary) !important;
-        text-align: right !important;
-    }
-    
-    /* Main Title */
-    .main-title {
-        font-size: 2.5rem;
-        font-weight: 800;
-        background: linear-gradient(135deg, var(--accent-1), var(--accent-2), var(--accent-3));
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-        text-align: center !important;
-        margin-bottom: 0.5rem;
-        animation: shimmer 3s ease-in-out infinite;
-    }
-    
-    @keyframes shimmer {
-        0%, 100% { filter: brightness(1); }
-        50% { filter: brightness(1.2); }
-    }
-    
-    .subtitle {
-        text-align: center !important;
-        color: var(--text-secondary);
-        font-size: 1rem;
-        margin-bottom: 2rem;
-    }
-
-    /* Glass Card */
-    .glass-card {
-        background: var(--bg-card);
-        backdrop-filter: blur(20px);
-        -webkit-backdrop-filter: blur(20px);
-        border: 1px solid var(--glass-border);
-        border-radius: 20px;
-        padding: 1.5rem;
-        margin: 1rem 0;
-        box-shadow: 
-            0 8px 32px rgba(0, 0, 0, 0.3),
-            inset 0 1px 0 rgba(255, 255, 255, 0.1);
-        transition: all 0.3s ease;
-    }
-    
-    .glass-card:hover {
-        transform: translateY(-2px);
-        box-shadow: 
-            0 12px 40px rgba(0, 0, 0, 0.4),
-            0 0 30px var(--glow-1),
-            inset 0 1px 0 rgba(255, 255, 255, 0.15);
-    }
-
-    /* Platform Badge */
-    .platform-badge {
-        display: inline-flex;
-        align-items: center;
-        gap: 8px;
-        background: linear-gradient(135deg, var(--accent-2), var(--accent-1));
-        padding: 8px 16px;
-        border-radius: 50px;
-        font-size: 0.9rem;
-        font-weight: 600;
-        color: white;
-        margin-bottom: 1rem;
-    }
-
-    /* Inputs */
-    .stTextInput > div > div > input {
-        direction: rtl; 
-        text-align: right;
-        border-radius: 15px !important;
-        border: 2px solid var(--glass-border) !important;
-        background: var(--bg-secondary) !important;
-        color: var(--text-primary) !important;
-        padding: 15px 20px !important;
-        font-size: 16px !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: var(--accent-1) !important;
-        box-shadow: 0 0 20px var(--glow-1) !important;
-    }
-    
-    .stTextInput > div > div > input::placeholder {
-        color: var(--text-secondary) !important;
-    }
-
-    /* Buttons */
-    .stButton > button {
-        width: 100%;
-        border-radius: 15px !important;
-        background: linear-gradient(135deg, var(--accent-1) 0%, var(--accent-2) 100%) !important;
-        color: white !important;
-        border: none !important;
-        padding: 0.9rem 2rem !important;
-        font-size: 18px !important;
-        font-weight: 600 !important;
-        font-family: 'Heebo', sans-serif !important;
-        transition: all 0.3s ease !important;
-        box-shadow: 0 4px 20px var(--glow-1) !important;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-3px) !important;
-        box-shadow: 0 8px 30px var(--glow-1) !important;
-    }
-    
-    .stButton > button:active {
-        transform: translateY(0) !important;
-    }
-    
-    /* Download Button - Special Green */
-    .stDownloadButton > button {
-        width: 100%;
-        border-radius: 15px !important;
-        background: linear-gradient(135deg, #00c853 0%, #00bfa5 100%) !important;
-        color: white !important;
-        border: none !important;
-        padding: 1rem 2rem !important;
-        font-size: 20px !important;
-        font-weight: 700 !important;
-        font-family: 'Heebo', sans-serif !important;
-        box-shadow: 0 4px 20px rgba(0, 200, 83, 0.4) !important;
-    }
-    
-    .stDownloadButton > button:hover {
-        transform: translateY(-3px) !important;
-        box-shadow: 0 8px 30px rgba(0, 200, 83, 0.5) !important;
-    }
-
-    /* Selectbox & Radio */
-    .stSelectbox > div > div, .stRadio > div {
-        direction: rtl;
-        text-align: right;
-    }
-    
-    .stSelectbox > div > div > div {
-        background: var(--bg-secondary) !important;
-        border: 2px solid var(--glass-border) !important;
-        border-radius: 12px !important;
-        color: var(--text-primary) !important;
-    }
-    
-    .stRadio > div > label {
-        background: var(--bg-card) !important;
-        border: 1px solid var(--glass-border) !important;
-        border-radius: 10px !important;
-        padding: 10px 15px !important;
-        margin: 5px !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .stRadio > div > label:hover {
-        border-color: var(--accent-1) !important;
-        box-shadow: 0 0 15px var(--glow-1) !important;
-    }
-    
-    label {
-        font-weight: 500 !important;
-        font-size: 1rem !important;
-        color: var(--text-primary) !important;
-    }
-
-    /* Progress Bar */
-    .stProgress > div > div > div > div {
-        background: linear-gradient(90deg, var(--accent-1), var(--accent-2), var(--accent-3)) !important;
-        animation: progressGlow 2s ease-in-out infinite;
-    }
-    
-    @keyframes progressGlow {
-        0%, 100% { filter: brightness(1); }
-        50% { filter: brightness(1.3); }
-    }
-
-    /* Success/Error/Warning Messages */
-    .stSuccess, .stError, .stWarning, .stInfo {
-        border-radius: 12px !important;
-        backdrop-filter: blur(10px) !important;
-    }
-
-    /* Thumbnail */
-    .stImage img {
-        border-radius: 15px !important;
-        box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3) !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .stImage img:hover {
-        transform: scale(1.02) !important;
-    }
-
-    /* Metrics */
-    .metric-card {
-        background: var(--bg-card);
-        border: 1px solid var(--glass-border);
-        border-radius: 12px;
-        padding: 15px;
-        text-align: center;
-    }
-    
-    .metric-value {
-        font-size: 1.3rem;
-        font-weight: 700;
-        color: var(--accent-3);
-    }
-    
-    .metric-label {
-        font-size: 0.8rem;
-        color: var(--text-secondary);
-        margin-top: 5px;
-    }
+@st.cache_resource
+def load_css():
+    """Read the stylesheet once per process"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'style.css'), encoding='utf-8') as f:
+        return f"<style>\n{f.read()}</style>"
 
-    /* Section Header */
-    .section-header {
-        display: flex;
-        align-items: center;
-        gap: 10px;
-        margin: 1.5rem 0 1rem 0;
-        padding-bottom: 0.5rem;
-        border-bottom: 1px solid var(--glass-border);
-    }
-    
-    .section-header h3 {
-        margin: 0;
-        font-size: 1.2rem;
-    }
-
-    /* Generic Fixes */
-    p, .stMarkdown {
-        text-align: right !important;
-        color: var(--text-secondary);
-    }
-    
-    div[data-testid="stVerticalBlock"] > div {
-        align-items: flex-end;
-    }
-    
-    /* Divider */
-    hr {
-        border: none;
-        height: 1px;
-        background: linear-gradient(90deg, transparent, var(--glass-border), transparent);
-        margin: 2rem 0;
-    }
-    
-    /* Tabs */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        background: var(--bg-card) !important;
-        border: 1px solid var(--glass-border) !important;
-        border-radius: 10px !important;
-        color: var(--text-secondary) !important;
-        padding: 10px 20px !important;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background: linear-gradient(135deg, var(--accent-1), var(--accent-2)) !important;
-        color: white !important;
-        border: none !important;
-    }
-    
-    /* Sidebar Fixes */
-    [data-testid="stSidebar"] {
-        direction: rtl;
-        text-align: right;
-        background: var(--bg-secondary) !important;
-        border-left: 1px solid var(--glass-border) !important;
-        min-width: 0 !important;
-    }
-    
-    [data-testid="stSidebar"] > div:first-child {
-        background: var(--bg-secondary) !important;
-        padding-top: 2rem;
-    }
-    
-    [data-testid="stSidebar"][aria-expanded="false"] {
-        min-width: 0 !important;
-        width: 0 !important;
-        overflow: hidden !important;
-    }
-    
-    [data-testid="stSidebar"][aria-expanded="false"] > div {
-        display: none !important;
-    }
-    
-    [data-testid="stSidebar"][aria-expanded="true"] {
-        min-width: 280px !important;
-    }
-    
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    </style>
-    """, unsafe_allow_html=True)
+# Only full reruns re-send the stylesheet; fragment reruns skip it
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # --- 5. Helper Functions ---
 
-def detect_platform(url):
-    """Detect the platform from URL"""
-    for platform_id, platform_info in PLATFORMS.items():
-        if re.search(platform_info['pattern'], url, re.IGNORECASE):
-            return platform_id, platform_info
-    return 'other', PLATFORMS['other']
-
-def format_duration(seconds):
-    """Format duration in human readable format"""
-    if not seconds or not isinstance(seconds, (int, float)):
-        return "לא ידוע"
-    hours, remainder = divmod(int(seconds), 3600)
-    minutes, secs = divmod(remainder, 60)
-    if hours > 0:
-        return f"{hours}:{minutes:02d}:{secs:02d}"
-    return f"{minutes}:{secs:02d}"
-
-def format_filesize(bytes_size):
-    """Format file size in human readable format"""
-    if not bytes_size:
-        return "לא ידוע"
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes_size < 1024:
-            return f"{bytes_size:.1f} {unit}"
-        bytes_size /= 1024
-    return f"{bytes_size:.1f} TB"
-
-def get_available_subtitles(info):
-    """Get available subtitles"""
-    subtitles = info.get('subtitles', {})
-    auto_captions = info.get('automatic_captions', {})
-    all_subs = {}
-    
-    for lang, subs in subtitles.items():
-        all_subs[f"📝 {lang}"] = lang
-    for lang, subs in auto_captions.items():
-        all_subs[f"🤖 {lang} (אוטומטי)"] = lang
-    
-    return all_subs
-
-# --- 6. Core Functions ---
-
-def get_info(url):
-    log_message(f"Starting metadata extraction for URL: {url}")
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': False,
-        'noplaylist': True,
-    }
+def get_available_subtitles(summary):
+    """Get available subtitles as {label: (language, automatic)}"""
+    return {
+        f"🤖 {lang} (אוטומטי)" if automatic else f"📝 {lang}": (lang, automatic)
+        for lang, automatic in available_subtitles(summary)
+    }
+
+def quality_label(name, height=None, codec=None, size=None, kbps=None):
+    """Option label with what the choice costs; parts that aren't known are left out"""
+    parts = []
+    if height:
+        parts.append(f"{height}p")
+    if codec:
+        parts.append(codec.split('.')[0])
+    if size:
+        parts.append(f"~{format_filesize(size)}")
+    if kbps:
+        parts.append(f"{kbps / 1000:.1f} Mbps" if kbps >= 1000 else f"{kbps:.0f} kbps")
+    return f"{name} — {' • '.join(parts)}" if parts else name
+
+def video_tier_label(tier, preview):
+    if not preview:
+        return tier
+    return quality_label(tier, preview['height'], preview['vcodec'], preview['size'], preview['kbps'])
+
+# --- 6. Session Functions ---
+# Shared services and the download engine are in core.py; these tie them to a Streamlit session
+
+@st.cache_resource
+def get_session_budget():
+    """Per-session memory budget, enforced on every session"""
+    return SessionBudget(SESSION_MEMORY_BUDGET, HISTORY_MAX)
+
+def card_thumbnail(summary):
+    """The video's thumbnail from the local cache, or its upstream URL if it can't be fetched"""
+    # One byte over the limit is enough for ThumbnailCache to refuse it
+    fetch = lambda url: fetch_url(url, MAX_SOURCE_BYTES + 1)
+    return get_thumbnail_cache().get(summary.key, summary.thumbnail, fetch) or summary.thumbnail
+
+def load_info(url):
+    """get_info(), reporting errors in the page"""
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            log_message(f"Metadata extracted successfully. Title: {info.get('title')}")
-            return info
+        return get_info(url)
     except Exception as e:
         log_message(f"Error extracting metadata: {str(e)}")
         st.error(f"❌ שגיאה בחילוץ מידע: {str(e)}")
         return None
 
-def download_media(url, options, progress_bar, status_text, temp_dir):
-    """Download media to temp directory and return file path"""
-    log_message(f"Download started. Options: {list(options.keys())}")
-    options['noplaylist'] = True
-    
-    downloaded_file = None
-    
-    def progress_hook(d):
-        nonlocal downloaded_file
-        if d['status'] == 'downloading':
-            try:
-                p = d.get('_percent_str', '0%').replace('%', '').strip()
-                progress = min(float(p) / 100, 1.0)
-                progress_bar.progress(progress)
-                speed = d.get('_speed_str', 'N/A')
-                eta = d.get('_eta_str', 'N/A')
-                status_text.markdown(f"""
-                <div style="text-align: center; color: #a0a0b0;">
-                    <span style="font-size: 1.5rem; color: #00d4ff;">{d.get('_percent_str', '0%')}</span>
-                    <br/>
-                    <span>⚡ מהירות: {speed} | ⏱️ נותר: {eta}</span>
-                </div>
-                """, unsafe_allow_html=True)
-            except:
-                pass
-        elif d['status'] == 'finished':
-            downloaded_file = d.get('filename')
-            progress_bar.progress(1.0)
-            status_text.markdown("""
-            <div style="text-align: center; color: #00d4ff; font-size: 1.2rem;">
-                ✨ ההורדה הושלמה! מעבד קובץ סופי...
-            </div>
-            """, unsafe_allow_html=True)
-            log_message(f"Download finished: {downloaded_file}")
+def start_download_job(url, ydl_opts, cache_key, mime, info, icon, media_type):
+    """Queue a download in the background and attach this session to it. Returns False if it can't fit on disk"""
+    try:
+        job_id = submit_download(
+            url, ydl_opts, cache_key, mime, info, media_type, st.session_state.get('platform_id', 'other')
+        )
+    except InsufficientSpace as e:
+        log_message(f"Download rejected: {str(e)}")
+        estimated_size = planned_size(info, ydl_opts)
+        st.error(f"❌ אין מספיק מקום פנוי בשרת להורדה הזו (~{format_filesize(estimated_size)})")
+        return False
+    attach_job(job_id, info, icon, media_type)
+    return True
+
+def attach_job(job_id, info, icon, media_type):
+    """Show job_id as this session's download"""
+    st.session_state.active_job = {
+        'id': job_id,
+        'title': info.get('title', 'Unknown')[:40],
+        'icon': icon,
+        'type': media_type,
+        'announced': False,
+        'result': None,
+    }
+    # Keep the job id in the URL so a reconnecting browser can re-attach to it
+    st.query_params['job'] = job_id
+
+def speculate(url):
+    """Start extracting (and maybe downloading) a pasted link of a known platform before it's checked"""
+    platform_id, _ = detect_platform(url)
+    if SPECULATIVE_PREFETCH == 'off' or platform_id == 'other':
+        return
+    prefetcher = get_prefetcher()
+    key = canonical_video_key(url)
+    previous = st.session_state.get('speculated_key')
+    if previous and previous != key:
+        prefetcher.abandon(previous)
+    st.session_state.speculated_key = key
+    # Collected here: the prefetch thread has no Streamlit context
+    cache, pool, evaluator, manager, artifact_cache = (
+        get_metadata_cache(), get_ydl_pool(), get_selector_evaluator(), get_job_manager(), get_artifact_cache()
+    )
+    
+    def plan_download(info):
+        planned = default_video_download(info, evaluator)
+        if planned is None or artifact_cache.entry(planned[1]):
+            return None
+        ydl_opts, cache_key, mime, estimated_size = planned
+        
+        def start():
+            return manager.submit(
+                download_task, url, ydl_opts, cache_key, mime, 'video', estimated_size,
+                platform=platform_id, label=f"(speculative) {info.get('title', 'Unknown')}", key=cache_key,
+            )
+        return cache_key, estimated_size, start
+    
+    prefetcher.prefetch(key, lambda: fetch_info(url, cache, pool), plan_download)
 
-    options['progress_hooks'] = [progress_hook]
-    options['outtmpl'] = os.path.join(temp_dir, '%(title)s.%(ext)s')
+def claim_speculative_download(cache_key, info, icon, media_type):
+    """Attach the session to a speculative download of exactly this output, if one is running"""
+    prefetcher = get_prefetcher.peek()
+    job_id = prefetcher.claim(info.key, cache_key) if prefetcher else None
+    if not job_id:
+        return False
+    attach_job(job_id, info, icon, media_type)
+    return True
 
-    try:
-        with yt_dlp.YoutubeDL(options) as ydl:
-            result_info = ydl.extract_info(url, download=True)
-            
-        # Find the downloaded file
-        if downloaded_file and os.path.exists(downloaded_file):
-            return downloaded_file, result_info
+def offer_file(file_path, mime, link=None, file_name=None):
+    """Show the download button for a finished file"""
+    file_name = file_name or os.path.basename(file_path)
+    file_size = os.path.getsize(file_path)
+    
+    st.info(f"📁 **גודל קובץ:** {format_filesize(file_size)}")
+    
+    # Download button
+    if link:
+        st.link_button("📥 לחץ כאן להורדה למחשב", link, use_container_width=True)
+    else:
+        with open(file_path, 'rb') as f:
+            file_data = f.read()
+        st.download_button(
+            label="📥 לחץ כאן להורדה למחשב",
+            data=file_data,
+            file_name=file_name,
+            mime=mime,
+            use_container_width=True
+        )
+
+def add_to_history(title, icon, media_type):
+    st.session_state.download_history.append({
+        'title': title[:40],
+        'icon': icon,
+        'time': datetime.now().strftime('%H:%M'),
+        'type': media_type
+    })
+    enforce_session_budget()
+
+def enforce_session_budget():
+    get_session_budget().enforce(st.session_state, SESSION_KEYS, SESSION_DISPOSABLE_KEYS)
+
+def offer_cached_artifact(cache_key, mime, info, icon, media_type, quality='custom'):
+    """Attach the session to a previously finished download from the artifact cache"""
+    result = cached_artifact(cache_key, mime, platform_id=st.session_state.get('platform_id', 'other'), quality=quality)
+    if not result:
+        return False
+    # The cached file replaces whatever job this session was showing
+    st.session_state.active_job = {
+        'id': None,
+        'title': info.get('title', 'Unknown')[:40],
+        'icon': icon,
+        'type': media_type,
+        'announced': False,
+        'result': result,
+    }
+    st.query_params.pop('job', None)
+    return True
+
+def active_job_running():
+    """Whether the session's download is still queued or running"""
+    active = st.session_state.active_job
+    if not active or active['result'] is not None:
+        return False
+    job = get_job_manager().get(active['id'])
+    return job is not None and job.state not in FINISHED_STATES
+
+def render_active_job():
+    """Progress / result panel for the download this session is attached to. Returns True while it runs"""
+    active = st.session_state.active_job
+    if active['result'] is not None:
+        state, progress, status, result, error = DONE, 1.0, {}, active['result'], None
+    else:
+        job = get_job_manager().get(active['id'])
+        if job is None:
+            st.session_state.active_job = None
+            st.query_params.pop('job', None)
+            return False
+        snap = job.snapshot()
+        state, progress, status, result, error = (
+            snap['state'], snap['progress'], snap['status'], snap['result'], snap['error']
+        )
+    
+    st.markdown(f'<div class="section-header"><span>{active["icon"]}</span><h3>{active["title"]}</h3></div>', unsafe_allow_html=True)
+    
+    if state in (QUEUED, RUNNING):
+        st.progress(progress)
+        if state == QUEUED:
+            message = "⏳ ממתין בתור..."
+        elif status.get('phase') == 'waiting_space':
+            message = "💾 ממתין לפינוי מקום בדיסק..."
+        elif status.get('phase') == 'retrying':
+            message = f"🔁 החיבור נותק, מנסה שוב (ניסיון {status.get('attempt')})..."
+        elif status.get('phase') == 'processing':
+            message = "✨ ההורדה הושלמה! מעבד קובץ סופי..."
+        else:
+            speed = f"{format_filesize(status['speed'])}/s" if status.get('speed') else "N/A"
+            message = f"⚡ מהירות: {speed} | ⏱️ נותר: {format_duration(status.get('eta'))}"
+        st.markdown(f"""
+        <div style="text-align: center; color: #a0a0b0;">
+            <span style="font-size: 1.5rem; color: #00d4ff;">{progress * 100:.1f}%</span>
+            <br/>
+            <span>{message}</span>
+        </div>
+        """, unsafe_allow_html=True)
+        if st.button("⏹️ בטל הורדה", key="cancel_job", use_container_width=True):
+            manager = get_job_manager()
+            manager.cancel(active['id'])
+            if not manager.get(active['id']).cancel_requested:
+                # Other sessions still wait for this download; only this one lets go of it
+                st.session_state.active_job = None
+                st.query_params.pop('job', None)
+            st.rerun()
+        return True
+    elif state == DONE:
+        if active['result'] is None and result.get('replica') != REPLICA_ID:
+            # Ran in another replica: serve it from here, once
+            result = active['result'] = local_result(result)
+        if not active['announced']:
+            active['announced'] = True
+            st.balloons()
+            add_to_history(active['title'], active['icon'], active['type'])
+        st.success("✅ הקובץ מוכן (מהמטמון)!" if result.get('cached') else "✅ ההורדה הושלמה בהצלחה!")
+        if result.get('throughput'):
+            st.caption(f"⚡ מהירות הורדה ממוצעת: {format_filesize(result['throughput'])}/s")
+        if result.get('audio_path'):
+            st.caption(AUDIO_PATH_LABELS[result['audio_path']])
+        if result.get('resumed_bytes'):
+            st.caption(f"♻️ ההורדה חודשה מנקודת העצירה, נחסכו {format_filesize(result['resumed_bytes'])}")
+        if os.path.exists(result['path']):
+            offer_file(result['path'], result['mime'], result['link'], result.get('file_name'))
+        elif result['link']:
+            st.link_button("📥 לחץ כאן להורדה למחשב", result['link'], use_container_width=True)
+    elif state == ERROR:
+        st.error(f"❌ שגיאה בהורדה: {error}")
+    else:
+        st.warning("⏹️ ההורדה בוטלה")
+    return False
+
+def batch_zip_entries(batch):
+    """(files [(path, arcname)], errors) of the batch ZIP"""
+    files, errors = [], []
+    for item in batch['items']:
+        if item['path']:
+            files.append((item['path'], os.path.basename(item['path'])))
+        else:
+            errors.append(f"{item['url']}: {item['error'] or 'לא הורד'}")
+    return files, errors
+
+def batch_zip_name():
+    return f"batch-{datetime.now().strftime('%Y%m%d-%H%M')}.zip"
+
+def batch_zip_link(batch):
+    """Register a link that builds the batch ZIP on the fly from the finished files"""
+    files, errors = batch_zip_entries(batch)
+    return get_file_server().register_stream(
+        lambda out: write_zip(out, files, errors), batch_zip_name(), 'application/zip',
+    )
+
+def batch_zip_data(batch):
+    """The batch ZIP in memory, for Streamlit's download button when there is no file server"""
+    files, errors = batch_zip_entries(batch)
+    out = io.BytesIO()
+    write_zip(out, files, errors)
+    return out.getvalue()
+
+def batch_running():
+    """Whether any job of the session's batch is still queued or running"""
+    batch = st.session_state.batch
+    if not batch:
+        return False
+    manager = get_job_manager()
+    for item in batch['items']:
+        job = manager.get(item['job_id']) if item['job_id'] else None
+        if job is not None and job.state not in FINISHED_STATES:
+            return True
+    return False
+
+def render_batch():
+    """Per-platform status of a batch. Returns True while any of its jobs runs"""
+    batch = st.session_state.batch
+    manager = get_job_manager()
+    pending = 0
+    
+    for platform_id, items in group_by_platform(batch['items']).items():
+        platform = PLATFORMS.get(platform_id, PLATFORMS['other'])
+        st.markdown(f"**{platform['icon']} {platform['name']}** ({len(items)})")
+        for item in items:
+            job = manager.get(item['job_id']) if item['job_id'] else None
+            if item['job_id'] and job is None:
+                item['error'] = "ההורדה אבדה"
+                item['job_id'] = None
+            elif job is not None:
+                snap = job.snapshot()
+                if snap['state'] == DONE:
+                    item['path'] = snap['result']['path']
+                    item['job_id'] = None
+                elif snap['state'] in FINISHED_STATES:
+                    item['error'] = snap['error'] or "ההורדה בוטלה"
+                    item['job_id'] = None
+                else:
+                    pending += 1
             
-        # Fallback: search in temp dir
-        for file in os.listdir(temp_dir):
-            file_path = os.path.join(temp_dir, file)
-            if os.path.isfile(file_path):
-                return file_path, result_info
-                
-        log_message("Processing complete.")
-        return None, result_info
-    except Exception as e:
-        log_message(f"Download failed: {str(e)}")
-        st.error(f"❌ שגיאה בהורדה: {str(e)}")
-        return None, None
+            if item['error']:
+                status = f"❌ {item['error'][:80]}"
+            elif item['path']:
+                status = "✅"
+            elif item['job_id']:
+                status = f"⏳ {int(snap['progress'] * 100)}%"
+            else:
+                status = "🔍"
+            st.markdown(f"{status} {item['title'][:60]}")
+    
+    if batch['started'] and not pending and any(item['path'] for item in batch['items']):
+        if get_file_server():
+            if not batch['zip_link']:
+                batch['zip_link'] = batch_zip_link(batch)
+            st.link_button("📦 הורד הכל כ-ZIP", batch['zip_link'], use_container_width=True)
+        else:
+            st.download_button(
+                "📦 הורד הכל כ-ZIP", batch_zip_data(batch), file_name=batch_zip_name(), mime='application/zip',
+                use_container_width=True,
+            )
+    return pending > 0
 
 # --- 7. Initialize Session State ---
 
@@ -539,62 +437,74 @@ if 'url_input' not in st.session_state:
     st.session_state.url_input = ""
 if 'download_history' not in st.session_state:
     st.session_state.download_history = []
+if 'batch' not in st.session_state:
+    st.session_state.batch = None
+if 'active_job' not in st.session_state:
+    st.session_state.active_job = None
+    # Re-attach to a job started before a reconnect
+    if 'job' in st.query_params:
+        st.session_state.active_job = {
+            'id': st.query_params['job'],
+            'title': 'הורדה',
+            'icon': '⬇️',
+            'type': 'video',
+            'announced': True,
+            'result': None,
+        }
 
-# --- 8. Main UI ---
-
-# Header
-st.markdown('<h1 class="main-title">🚀 מוריד המדיה האוניברסלי</h1>', unsafe_allow_html=True)
-st.markdown('<p class="subtitle">הורד וידאו ואודיו מכל פלטפורמה באיכות הגבוהה ביותר</p>', unsafe_allow_html=True)
-
-# Supported platforms info
-with st.expander("📱 פלטפורמות נתמכות"):
-    st.markdown("""
-    **YouTube** • **TikTok** • **Instagram** • **Twitter/X** • **Facebook** • **Vimeo** • **Twitch** • **Reddit** • **Dailymotion** ומאות אתרים נוספים!
-    """)
-
-# Main content
-st.markdown('<div class="section-header"><span>🔗</span><h3>הדבק קישור</h3></div>', unsafe_allow_html=True)
-
-url = st.text_input(
-    "URL", 
-    value=st.session_state.url_input, 
-    label_visibility="collapsed", 
-    placeholder="הדבק כאן קישור מ-YouTube, TikTok, Instagram ועוד..."
-)
-
-col1, col2 = st.columns([3, 1])
-with col1:
-    check_button = st.button("🔍 בדוק קישור", use_container_width=True)
-with col2:
-    if st.button("🗑️", use_container_width=True, help="נקה"):
-        st.session_state.url_input = ""
-        st.session_state.video_info = None
-        st.rerun()
-
-if check_button:
-    if url:
-        st.session_state.url_input = url
-        st.session_state.video_info = None
-        log_message(f"User check URL: {url}")
-        
-        # Detect platform
-        platform_id, platform_info = detect_platform(url)
-        
-        with st.spinner("⏳ מחלץ מידע..."):
-            info = get_info(url)
-            if info:
-                st.session_state.video_info = info
-                st.session_state.platform = platform_info
-    else:
-        st.warning("⚠️ אנא הדבק קישור תקין")
-
-# Results Area
-if st.session_state.video_info:
-    info = st.session_state.video_info
-    platform_info = st.session_state.get('platform', PLATFORMS['other'])
-    
-    st.markdown("---")
-    
+# Session keys counted against SESSION_MEMORY_BUDGET
+SESSION_KEYS = ('video_info', 'download_history', 'batch', 'active_job')
+# ...and results that are dropped first when the session is over budget
+SESSION_DISPOSABLE_KEYS = ('subtitle_result',)
+
+# --- 8. UI Sections ---
+# Each section is a fragment, so interacting with it reruns only that section.
+# Anything that changes another section (new video, new download) triggers a full rerun.
+
+@st.fragment
+def input_section():
+    url = st.text_input(
+        "URL", 
+        value=st.session_state.url_input, 
+        label_visibility="collapsed", 
+        placeholder="הדבק כאן קישור מ-YouTube, TikTok, Instagram ועוד..."
+    )
+    if url and url != st.session_state.url_input:
+        speculate(url)
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        check_button = st.button("🔍 בדוק קישור", use_container_width=True)
+    with col2:
+        if st.button("🗑️", use_container_width=True, help="נקה"):
+            prefetcher = get_prefetcher.peek()
+            if prefetcher and st.session_state.get('speculated_key'):
+                prefetcher.abandon(st.session_state.speculated_key)
+            st.session_state.url_input = ""
+            st.session_state.video_info = None
+            st.rerun()
+    
+    if check_button:
+        if url:
+            st.session_state.url_input = url
+            st.session_state.video_info = None
+            log_message(f"User check URL: {url}")
+            
+            # Detect platform
+            platform_id, platform_info = detect_platform(url)
+            
+            with st.spinner("⏳ מחלץ מידע..."):
+                info = load_info(url)
+                if info:
+                    # The session keeps a compact summary; the full dict stays in the shared metadata cache
+                    st.session_state.video_info = MediaSummary(canonical_video_key(url), info)
+                    st.session_state.platform = platform_info
+                    st.session_state.platform_id = platform_id
+                    st.rerun()
+        else:
+            st.warning("⚠️ אנא הדבק קישור תקין")
+
+def info_card(info, platform_info):
     # Platform badge
     st.markdown(f"""
     <div class="platform-badge">
@@ -609,8 +519,9 @@ if st.session_state.video_info:
     col_img, col_txt = st.columns([1, 1.5])
     
     with col_img:
-        if info.get('thumbnail'):
-            st.image(info['thumbnail'], use_container_width=True)
+        thumbnail = card_thumbnail(info)
+        if thumbnail:
+            st.image(thumbnail, use_container_width=True)
     
     with col_txt:
         st.markdown(f"### {info.get('title', 'ללא כותרת')}")
@@ -645,172 +556,305 @@ if st.session_state.video_info:
             """, unsafe_allow_html=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
+
+def clip_inputs(info, key):
+    """Time range inputs of a tab: (parse_clip() range or None for the whole video, error message or None)"""
+    duration = info.get('duration')
+    with st.expander("✂️ רק קטע מהסרטון"):
+        col_start, col_end = st.columns(2)
+        with col_start:
+            start = st.text_input("⏱️ התחלה", placeholder="0:00", key=f"{key}_clip_start")
+        with col_end:
+            end = st.text_input("⏱️ סיום", placeholder=format_duration(duration) if duration else "", key=f"{key}_clip_end")
+        accurate = st.checkbox("🎯 חיתוך מדויק לפריים (קידוד מחדש של הקטע, איטי יותר)", key=f"{key}_clip_accurate")
+        st.caption("⚡ רק החלק הנדרש יורד. בלי חיתוך מדויק הקטע מועתק כמו שהוא ומתחיל בפריים המפתח שלפני ההתחלה")
+    try:
+        return parse_clip(start, end, accurate, duration), None
+    except ValueError as e:
+        return None, str(e)
+
+@st.fragment
+def video_tab(info):
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
     
-    # Download Settings
-    st.markdown('<div class="section-header"><span>⚙️</span><h3>הגדרות הורדה</h3></div>', unsafe_allow_html=True)
+    selected_container = st.radio("📦 פורמט קובץ:", list(VIDEO_CONTAINERS.keys()), horizontal=True)
+    
+    # What every tier would download (streams that merge by copy only), resolved locally
+    formats = summary_formats(info)
+    evaluator = get_selector_evaluator()
+    previews = {
+        tier: video_preview(formats, RESOLUTION_MAP[tier], VIDEO_CONTAINERS[selected_container], info.get('duration'), evaluator)
+        for tier in RESOLUTION_MAP
+    } if formats else {}
+    tiers = [tier for tier in RESOLUTION_MAP if not formats or previews[tier]] or list(RESOLUTION_MAP)
+    
+    selected_res = st.selectbox(
+        "📐 בחר איכות וידאו:",
+        tiers,
+        index=tiers.index(DEFAULT_RESOLUTION) if DEFAULT_RESOLUTION in tiers else 0,
+        format_func=lambda tier: video_tier_label(tier, previews.get(tier)),
+        key="video_res",
+    )
+    unavailable = [tier for tier in RESOLUTION_MAP if tier not in tiers]
+    if unavailable:
+        st.caption(f"🚫 לא זמין בסרטון הזה: {', '.join(unavailable)}")
+    
+    plan = previews[selected_res]['plan'] if previews.get(selected_res) else None
+    if plan:
+        size = f"~{format_filesize(plan['size'])}" if plan['size'] else "גודל לא ידוע"
+        work = "⚡ קובץ יחיד, ללא ffmpeg" if plan['work'] == 'none' else "🔗 מיזוג בהעתקה בלבד, ללא קידוד מחדש"
+        st.caption(
+            f"{plan['container'].upper()} • {plan['height']}p • {plan['vcodec']} / {plan['acodec']} • {size} • {work}"
+        )
     
-    tabs = st.tabs(["🎬 וידאו", "🎵 אודיו"])
+    # Subtitles option
+    available_subs = get_available_subtitles(info)
+    download_subs = st.checkbox("📝 הורד כתוביות", value=False)
     
-    with tabs[0]:  # Video tab
-        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-        
-        resolution_map = {
-            "🌟 הכי טוב (Best)": "bestvideo+bestaudio/best",
-            "📺 4K (2160p)": "bestvideo[height<=2160]+bestaudio/best[height<=2160]",
-            "🖥️ Full HD (1080p)": "bestvideo[height<=1080]+bestaudio/best[height<=1080]",
-            "📹 HD (720p)": "bestvideo[height<=720]+bestaudio/best[height<=720]",
-            "📱 SD (480p)": "bestvideo[height<=480]+bestaudio/best[height<=480]",
-            "📟 Low (360p)": "bestvideo[height<=360]+bestaudio/best[height<=360]",
-        }
-        
-        selected_res = st.selectbox(
-            "📐 בחר איכות וידאו:",
-            list(resolution_map.keys()),
-            index=2
+    selected_sub_lang = None
+    if download_subs and available_subs:
+        selected_sub_lang = st.selectbox(
+            "בחר שפת כתוביות:",
+            list(available_subs.keys())
+        )
+    elif download_subs:
+        st.info("אין כתוביות זמינות לסרטון זה")
+    
+    clip, clip_error = clip_inputs(info, "video")
+    if clip_error:
+        st.warning(f"⚠️ טווח הזמן לא תקין: {clip_error}")
+    
+    if st.button("⬇️ הורד וידאו", key="download_video", use_container_width=True, disabled=bool(clip_error)):
+        lang_code = None
+        if download_subs and selected_sub_lang and available_subs:
+            lang_code = available_subs[selected_sub_lang][0]
+        ydl_opts, cache_key, video_mime, _ = video_download(
+            info, RESOLUTION_MAP[selected_res], lang_code, previews.get(selected_res), clip
         )
         
-        # Subtitles option
-        available_subs = get_available_subtitles(info)
-        download_subs = st.checkbox("📝 הורד כתוביות", value=False)
-        
-        selected_sub_lang = None
-        if download_subs and available_subs:
-            selected_sub_lang = st.selectbox(
-                "בחר שפת כתוביות:",
-                list(available_subs.keys())
-            )
-        elif download_subs:
-            st.info("אין כתוביות זמינות לסרטון זה")
-        
-        if st.button("⬇️ הורד וידאו", key="download_video", use_container_width=True):
-            ydl_opts = {
-                'format': resolution_map[selected_res],
-                'merge_output_format': 'mp4',
-            }
-            
-            if download_subs and selected_sub_lang and available_subs:
-                lang_code = available_subs[selected_sub_lang]
-                ydl_opts['writesubtitles'] = True
-                ydl_opts['subtitleslangs'] = [lang_code]
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            with tempfile.TemporaryDirectory() as temp_dir:
-                file_path, result = download_media(url, ydl_opts, progress_bar, status_text, temp_dir)
-                
-                if file_path and os.path.exists(file_path):
-                    st.balloons()
-                    st.success("✅ ההורדה הושלמה בהצלחה!")
-                    
-                    # Read file for download
-                    with open(file_path, 'rb') as f:
-                        file_data = f.read()
-                    
-                    file_name = os.path.basename(file_path)
-                    file_size = len(file_data)
-                    
-                    st.info(f"📁 **גודל קובץ:** {format_filesize(file_size)}")
-                    
-                    # Download button
-                    st.download_button(
-                        label="📥 לחץ כאן להורדה למחשב",
-                        data=file_data,
-                        file_name=file_name,
-                        mime="video/mp4",
-                        use_container_width=True
-                    )
-                    
-                    # Add to history
-                    st.session_state.download_history.append({
-                        'title': info.get('title', 'Unknown')[:40],
-                        'icon': '🎬',
-                        'time': datetime.now().strftime('%H:%M'),
-                        'type': 'video'
-                    })
-        
-        st.markdown('</div>', unsafe_allow_html=True)
+        if claim_speculative_download(cache_key, info, '🎬', 'video') \
+                or offer_cached_artifact(cache_key, video_mime, info, '🎬', 'video', download_quality(ydl_opts)) or start_download_job(
+            st.session_state.url_input, ydl_opts, cache_key, video_mime, info, '🎬', 'video'
+        ):
+            st.rerun()
     
-    with tabs[1]:  # Audio tab
-        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-        
-        col_fmt, col_quality = st.columns(2)
-        
-        with col_fmt:
-            format_map = {"MP3": "mp3", "M4A": "m4a", "WAV": "wav"}
-            selected_fmt = st.selectbox("🎵 פורמט:", list(format_map.keys()))
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@st.fragment
+def audio_tab(info):
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+    
+    col_fmt, col_quality = st.columns(2)
+    
+    with col_fmt:
+        selected_fmt = st.selectbox("🎵 פורמט:", list(AUDIO_FORMATS.keys()))
+    
+    # Prefer a source stream that can be copied instead of transcoded; every quality shows what it costs
+    formats = summary_formats(info)
+    previews = {
+        quality: preview_audio(formats, AUDIO_FORMATS[selected_fmt], kbps, info.get('duration'))
+        for quality, kbps in AUDIO_QUALITIES.items()
+    }
+    
+    with col_quality:
+        selected_quality = st.selectbox(
+            "🔊 איכות:", list(AUDIO_QUALITIES.keys()), index=1,
+            format_func=lambda quality: quality_label(
+                quality, size=previews[quality]['size'], kbps=previews[quality]['kbps']
+            ),
+        )
+    plan = previews[selected_quality]
+    if plan['path'] == 'copy':
+        source = plan['source']
+        st.caption(f"{AUDIO_PATH_LABELS['copy']} ({source['acodec']}, {source['abr']:.0f}kbps)")
+    elif plan['path']:
+        st.caption(AUDIO_PATH_LABELS['transcode'])
+    
+    clip, clip_error = clip_inputs(info, "audio")
+    if clip_error:
+        st.warning(f"⚠️ טווח הזמן לא תקין: {clip_error}")
+    
+    if st.button("⬇️ הורד אודיו", key="download_audio", use_container_width=True, disabled=bool(clip_error)):
+        ydl_opts, cache_key, audio_mime, _ = audio_download(
+            info, AUDIO_FORMATS[selected_fmt], AUDIO_QUALITIES[selected_quality], plan, clip
+        )
         
-        with col_quality:
-            selected_quality = st.selectbox("🔊 איכות:", list(AUDIO_QUALITIES.keys()), index=1)
+        if claim_speculative_download(cache_key, info, '🎵', 'audio') \
+                or offer_cached_artifact(cache_key, audio_mime, info, '🎵', 'audio', download_quality(ydl_opts)) or start_download_job(
+            st.session_state.url_input, ydl_opts, cache_key, audio_mime, info, '🎵', 'audio'
+        ):
+            st.rerun()
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@st.fragment
+def subtitles_tab(info):
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+    
+    available_subs = get_available_subtitles(info)
+    if not available_subs:
+        st.info("אין כתוביות זמינות לסרטון זה")
+    else:
+        selected_langs = st.multiselect(
+            "🌐 בחר שפות:", list(available_subs.keys()), max_selections=SUBTITLE_MAX_LANGUAGES, key="subtitle_langs"
+        )
+        selected_fmt = st.radio("📄 פורמט:", list(SUBTITLE_FORMATS.keys()), horizontal=True, key="subtitle_fmt")
+        st.caption("⚡ רק הכתוביות יורדו, בלי הווידאו")
         
-        if st.button("⬇️ הורד אודיו", key="download_audio", use_container_width=True):
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': format_map[selected_fmt],
-                    'preferredquality': AUDIO_QUALITIES[selected_quality],
-                }]
-            }
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            with tempfile.TemporaryDirectory() as temp_dir:
-                file_path, result = download_media(url, ydl_opts, progress_bar, status_text, temp_dir)
-                
-                if file_path and os.path.exists(file_path):
-                    st.balloons()
-                    st.success("✅ ההורדה הושלמה בהצלחה!")
-                    
-                    # Find the converted audio file
-                    audio_extensions = ['.mp3', '.m4a', '.wav', '.ogg']
-                    final_file = None
-                    
-                    for f in os.listdir(temp_dir):
-                        if any(f.endswith(ext) for ext in audio_extensions):
-                            final_file = os.path.join(temp_dir, f)
-                            break
-                    
-                    if not final_file:
-                        final_file = file_path
-                    
-                    if os.path.exists(final_file):
-                        with open(final_file, 'rb') as f:
-                            file_data = f.read()
-                        
-                        file_name = os.path.basename(final_file)
-                        file_size = len(file_data)
-                        
-                        st.info(f"📁 **גודל קובץ:** {format_filesize(file_size)}")
-                        
-                        # Download button
-                        st.download_button(
-                            label="📥 לחץ כאן להורדה למחשב",
-                            data=file_data,
-                            file_name=file_name,
-                            mime=f"audio/{format_map[selected_fmt]}",
-                            use_container_width=True
-                        )
-                        
-                        # Add to history
-                        st.session_state.download_history.append({
-                            'title': info.get('title', 'Unknown')[:40],
-                            'icon': '🎵',
-                            'time': datetime.now().strftime('%H:%M'),
-                            'type': 'audio'
-                        })
+        if st.button("⬇️ הורד כתוביות", key="download_subtitles", use_container_width=True, disabled=not selected_langs):
+            with st.spinner("⏳ מוריד כתוביות..."):
+                st.session_state.subtitle_result = fetch_subtitle_bundle(
+                    st.session_state.url_input, [available_subs[label] for label in selected_langs], SUBTITLE_FORMATS[selected_fmt]
+                )
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        result = st.session_state.get('subtitle_result')
+        if result and result['key'] == info.key:
+            for error in result['errors']:
+                st.warning(f"⚠️ {error}")
+            if result['data']:
+                st.download_button(
+                    label="📥 לחץ כאן להורדה למחשב",
+                    data=result['data'],
+                    file_name=result['file_name'],
+                    mime=result['mime'],
+                    use_container_width=True
+                )
+    
+    st.markdown('</div>', unsafe_allow_html=True)
 
-# Download History (in sidebar)
-with st.sidebar:
+def active_job_section(polling):
+    """Fragment body; polls on a timer while the job runs and hands back to a full rerun when it ends"""
+    if st.session_state.active_job is None:
+        return
+    if not render_active_job() and polling:
+        st.rerun()
+
+@st.fragment
+def batch_input_section():
+    batch_text = st.text_area(
+        "קישורים",
+        height=150,
+        label_visibility="collapsed",
+        placeholder="הדבק כאן קישורים, אחד בכל שורה..."
+    )
+    batch_type = st.radio("סוג הורדה:", ["🎬 וידאו", "🎵 אודיו"], horizontal=True, key="batch_type")
+    if batch_type == "🎬 וידאו":
+        batch_res = st.selectbox("📐 איכות וידאו:", list(RESOLUTION_MAP.keys()), index=2, key="batch_res")
+    else:
+        col_bfmt, col_bquality = st.columns(2)
+        with col_bfmt:
+            batch_fmt = st.selectbox("🎵 פורמט:", list(AUDIO_FORMATS.keys()), key="batch_fmt")
+        with col_bquality:
+            batch_quality = st.selectbox("🔊 איכות:", list(AUDIO_QUALITIES.keys()), index=1, key="batch_quality")
+    
+    col_bcheck, col_bdownload = st.columns(2)
+    with col_bcheck:
+        batch_check = st.button("🔍 בדוק את כל הקישורים", key="batch_check", use_container_width=True)
+    with col_bdownload:
+        batch_download = st.button(
+            "⬇️ הורד הכל", key="batch_download", use_container_width=True,
+            disabled=not st.session_state.batch
+        )
+    
+    if batch_check:
+        batch_urls = parse_urls(batch_text)
+        if not batch_urls:
+            st.warning("⚠️ לא נמצאו קישורים")
+        else:
+            if len(batch_urls) > BATCH_MAX_URLS:
+                st.warning(f"⚠️ מעובדים רק {BATCH_MAX_URLS} הקישורים הראשונים")
+                batch_urls = batch_urls[:BATCH_MAX_URLS]
+            log_message(f"Batch check of {len(batch_urls)} URLs")
+            cache, pool = get_metadata_cache(), get_ydl_pool()
+            with st.spinner(f"⏳ מחלץ מידע עבור {len(batch_urls)} קישורים..."):
+                raw_items = extract_batch(batch_urls, lambda u: fetch_info(u, cache, pool), detect_platform, BATCH_INFO_WORKERS)
+            st.session_state.batch = {'items': [batch_item(raw) for raw in raw_items], 'started': False, 'zip_link': None}
+            st.rerun()
+    
+    if batch_download and st.session_state.batch:
+        if batch_type == "🎬 וידאו":
+            start_batch_downloads(st.session_state.batch, 'video', batch_video_plan(RESOLUTION_MAP[batch_res]))
+        else:
+            start_batch_downloads(
+                st.session_state.batch, 'audio', batch_audio_plan(AUDIO_FORMATS[batch_fmt], AUDIO_QUALITIES[batch_quality])
+            )
+        st.rerun()
+
+def batch_status_section(polling):
+    """Fragment body; polls on a timer while batch jobs run"""
+    if st.session_state.batch is None:
+        return
+    if not render_batch() and polling:
+        st.rerun()
+
+def history_section():
     st.markdown("### 📋 היסטוריית הורדות")
     if st.session_state.download_history:
         for item in reversed(st.session_state.download_history[-10:]):
             st.markdown(f"{item['icon']} {item['title']}... ({item['time']})")
     else:
         st.info("אין הורדות עדיין")
+    reuse = get_info_reuse().stats()
+    if reuse['reused']:
+        st.caption(f"⚡ {reuse['fast_path_rate'] * 100:.0f}% מההורדות התחילו בלי לחלץ מחדש את המידע")
+
+# --- 9. Main UI ---
+
+# Header
+st.markdown('<h1 class="main-title">🚀 מוריד המדיה האוניברסלי</h1>', unsafe_allow_html=True)
+st.markdown('<p class="subtitle">הורד וידאו ואודיו מכל פלטפורמה באיכות הגבוהה ביותר</p>', unsafe_allow_html=True)
+
+# Supported platforms info
+with st.expander("📱 פלטפורמות נתמכות"):
+    st.markdown("""
+    **YouTube** • **TikTok** • **Instagram** • **Twitter/X** • **Facebook** • **Vimeo** • **Twitch** • **Reddit** • **Dailymotion** ומאות אתרים נוספים!
+    """)
+
+# Main content
+st.markdown('<div class="section-header"><span>🔗</span><h3>הדבק קישור</h3></div>', unsafe_allow_html=True)
+
+input_section()
+
+# Results Area
+if st.session_state.video_info:
+    info = st.session_state.video_info
+    platform_info = st.session_state.get('platform', PLATFORMS['other'])
+    
+    st.markdown("---")
+    
+    info_card(info, platform_info)
+    
+    # Download Settings
+    st.markdown('<div class="section-header"><span>⚙️</span><h3>הגדרות הורדה</h3></div>', unsafe_allow_html=True)
+    
+    tabs = st.tabs(["🎬 וידאו", "🎵 אודיו", "📝 כתוביות"])
+    
+    with tabs[0]:  # Video tab
+        video_tab(info)
+    
+    with tabs[1]:  # Audio tab
+        audio_tab(info)
+    
+    with tabs[2]:  # Subtitles tab
+        subtitles_tab(info)
+
+# Background download attached to this session; only polls while it runs
+job_polling = active_job_running()
+st.fragment(active_job_section, run_every=JOB_POLL_INTERVAL if job_polling else None)(job_polling)
+
+# Batch mode
+st.markdown("---")
+with st.expander("📚 הורדה מרובה (אצווה)", expanded=bool(st.session_state.batch)):
+    batch_input_section()
+    batch_polling = batch_running()
+    st.fragment(batch_status_section, run_every=JOB_POLL_INTERVAL if batch_polling else None)(batch_polling)
+
+# Keep this session's state within its memory budget
+enforce_session_budget()
+
+# Download History (in sidebar)
+with st.sidebar:
+    history_section()
 
 # Footer
 st.markdown("---")
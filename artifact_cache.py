@@ -0,0 +1,263 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger("UniversalDownloader")
+
+# yt-dlp options that change the bytes of the finished file
+OUTPUT_OPTIONS = ('format', 'merge_output_format', 'postprocessors', 'writesubtitles', 'subtitleslangs', 'clip')
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Seconds after which an entry directory without metadata is taken for an abandoned store, when
+# other processes may be storing into the same cache
+INCOMPLETE_STORE_AGE = 3600
+
+# Seconds between re-reads of a shared cache's index before a store makes room
+SHARED_RESCAN_INTERVAL = 30
+
+
+def artifact_key(info, options):
+    """Content address of a finished output: video identity plus output-shaping options"""
+    relevant = {k: options.get(k) for k in OUTPUT_OPTIONS if options.get(k) is not None}
+    payload = json.dumps([info.get('extractor_key'), info.get('id'), relevant], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ArtifactCache:
+    """Size-capped disk cache of finished downloads with LRU or LFU eviction.
+
+    With shared=True several processes use one root (e.g. on a shared
+    volume): lookups that miss the in-memory index check the disk for
+    entries other processes stored, and eviction re-reads the index first
+    (at most every SHARED_RESCAN_INTERVAL seconds). The first hit on an entry
+    this process didn't store re-hashes the file against its checksum.
+    """
+
+    def __init__(self, root, max_bytes, policy='lru', shared=False):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.shared = shared
+        self._lock = threading.RLock()
+        self._index = {}
+        # Bytes of stores in progress, already made room for
+        self._reserved = 0
+        self._verified = set()
+        self._scanned = 0.0
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'corrupt': 0}
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _meta_path(self, key):
+        return os.path.join(self._entry_dir(key), 'meta.json')
+
+    def _read_meta(self, key):
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_index(self):
+        index = {}
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = self._read_meta(key)
+                if entry is None:
+                    # Interrupted store: no metadata means the entry was never published.
+                    # Another process may still be writing it when the cache is shared
+                    entry_dir = os.path.join(prefix_dir, key)
+                    try:
+                        abandoned = not self.shared or time.time() - os.path.getmtime(entry_dir) > INCOMPLETE_STORE_AGE
+                    except OSError:
+                        abandoned = False
+                    if abandoned:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                index[key] = entry
+        with self._lock:
+            self._index = index
+            self._scanned = time.time()
+        logger.info(f"Artifact cache loaded {len(index)} entries ({self.total_bytes()} bytes)")
+
+    def _indexed(self, key):
+        """key's index entry, picking up one another process stored when the cache is shared"""
+        with self._lock:
+            entry = self._index.get(key)
+        if entry is None and self.shared:
+            entry = self._read_meta(key)
+            if entry is not None:
+                with self._lock:
+                    entry = self._index.setdefault(key, entry)
+        return entry
+
+    def _write_meta(self, key, entry):
+        path = self._meta_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry['size'] for entry in self._index.values())
+
+    def path_for(self, key):
+        entry = self._indexed(key)
+        return os.path.join(self._entry_dir(key), entry['filename']) if entry else None
+
+    def lookup(self, key):
+        """Return the cached file path for key, or None"""
+        self._indexed(key)
+        with self._lock:
+            unverified = key in self._index and key not in self._verified
+        if unverified and not self.verify(key):
+            with self._lock:
+                self.counters['corrupt'] += 1
+        with self._lock:
+            entry = self._index.get(key)
+            path = self.path_for(key)
+            if entry is None or not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+                if entry is not None:
+                    self._drop(key)
+                self.counters['misses'] += 1
+                return None
+            entry['hits'] += 1
+            entry['last_access'] = time.time()
+            self.counters['hits'] += 1
+        try:
+            self._write_meta(key, entry)
+        except OSError:
+            pass
+        return path
+
+    def entry(self, key):
+        entry = self._indexed(key)
+        with self._lock:
+            return dict(entry) if entry else None
+
+    def store(self, key, src_path, filename=None):
+        """Copy a finished file into the cache, hashing it as it is written. Returns the cached path or None"""
+        filename = filename or os.path.basename(src_path)
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            logger.info(f"Artifact {key[:12]} ({size} bytes) exceeds cache size, not cached")
+            return None
+        # A replaced entry goes first, so a file under its old name doesn't linger uncounted
+        self._drop(key)
+        if not self._make_room(size):
+            logger.info(f"Artifact {key[:12]} ({size} bytes) doesn't fit next to the stores in progress, not cached")
+            return None
+        try:
+            return self._write(key, src_path, filename, size)
+        finally:
+            with self._lock:
+                self._reserved -= size
+
+    def _write(self, key, src_path, filename, size):
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        dest = os.path.join(entry_dir, filename)
+        tmp_dest = f"{dest}.{threading.get_ident()}.part"
+        digest = hashlib.sha256()
+        try:
+            with open(src_path, 'rb') as src, open(tmp_dest, 'wb') as dst:
+                while True:
+                    chunk = src.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dst.write(chunk)
+            os.replace(tmp_dest, dest)
+            now = time.time()
+            entry = {
+                'filename': filename,
+                'size': size,
+                'sha256': digest.hexdigest(),
+                'hits': 0,
+                'created': now,
+                'last_access': now,
+            }
+            self._write_meta(key, entry)
+        except OSError as e:
+            logger.info(f"Artifact cache store failed for {key[:12]}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        with self._lock:
+            self._index[key] = entry
+            self._verified.add(key)
+            self.counters['stores'] += 1
+        logger.info(f"Artifact {key[:12]} cached: {filename} ({size} bytes, sha256 {entry['sha256'][:12]})")
+        return dest
+
+    def verify(self, key):
+        """Re-hash a cached file and drop it if it no longer matches its checksum"""
+        entry = self.entry(key)
+        path = self.path_for(key)
+        if entry is None:
+            return False
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        except OSError:
+            self._drop(key)
+            return False
+        if digest.hexdigest() != entry['sha256']:
+            logger.info(f"Artifact {key[:12]} failed checksum verification, dropping")
+            self._drop(key)
+            return False
+        with self._lock:
+            self._verified.add(key)
+        return True
+
+    def _eviction_order(self):
+        if self.policy == 'lfu':
+            return sorted(self._index, key=lambda k: (self._index[k]['hits'], self._index[k]['last_access']))
+        return sorted(self._index, key=lambda k: self._index[k]['last_access'])
+
+    def _make_room(self, incoming):
+        """Evict until incoming bytes fit next to the stores in progress and reserve them; False if they can't"""
+        if self.shared and time.time() - self._scanned > SHARED_RESCAN_INTERVAL:
+            # Other processes stored and evicted entries since this one last looked
+            self._load_index()
+        with self._lock:
+            total = self.total_bytes() + self._reserved
+            for key in self._eviction_order():
+                if total + incoming <= self.max_bytes:
+                    break
+                total -= self._index[key]['size']
+                self._drop(key)
+                self.counters['evictions'] += 1
+            if total + incoming > self.max_bytes:
+                return False
+            self._reserved += incoming
+            return True
+
+    def _drop(self, key):
+        with self._lock:
+            self._index.pop(key, None)
+            self._verified.discard(key)
+        # Readers that already opened the file keep a valid handle on POSIX
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._index)
+        stats['bytes'] = self.total_bytes()
+        return stats
@@ -0,0 +1,92 @@
+import logging
+import os
+import re
+import shutil
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger("UniversalDownloader")
+
+URL_RE = re.compile(r'https?://[^\s<>"\']+')
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_urls(text):
+    """Pull every http(s) link out of free text, de-duplicated, in order"""
+    seen = OrderedDict()
+    for match in URL_RE.findall(text or ''):
+        seen.setdefault(match.rstrip('.,;)'), None)
+    return list(seen)
+
+
+def group_by_platform(items):
+    """Group batch items by their 'platform' id, preserving first-seen order"""
+    groups = OrderedDict()
+    for item in items:
+        groups.setdefault(item['platform'], []).append(item)
+    return groups
+
+
+def interleave(groups):
+    """Round-robin across platform groups so no single platform fills the pool first"""
+    queues = [list(items) for items in groups.values()]
+    ordered = []
+    while any(queues):
+        for queue in queues:
+            if queue:
+                ordered.append(queue.pop(0))
+    return ordered
+
+
+def extract_batch(urls, extract, detect_platform, max_workers=4):
+    """Extract metadata for many URLs in parallel with bounded concurrency.
+
+    extract(url) returns an info dict or raises; failures are recorded per item
+    and never abort the batch.
+    """
+    items = [{'url': url, 'platform': detect_platform(url)[0], 'info': None, 'error': None} for url in urls]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-info") as executor:
+        futures = {executor.submit(extract, item['url']): item for item in interleave(group_by_platform(items))}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                item['info'] = future.result()
+            except Exception as e:
+                item['error'] = str(e)
+    failed = sum(1 for item in items if item['error'])
+    logger.info(f"Batch metadata for {len(items)} URLs in {time.time() - start:.1f}s ({failed} failed)")
+    return items
+
+
+def unique_arcname(name, used):
+    """Return name, or 'name (2).ext' etc. if it is already in the archive"""
+    base, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{base} ({n}){ext}"
+    used.add(candidate)
+    return candidate
+
+
+def write_zip(out, files, errors=None):
+    """Stream files [(path, arcname)] into a ZIP written to out, which may be non-seekable.
+
+    Media is already compressed, so entries are stored; each file is copied in
+    chunks and the archive is never held in memory or on disk.
+    """
+    used = set()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for path, arcname in files:
+            try:
+                info = zipfile.ZipInfo.from_file(path, unique_arcname(arcname, used))
+                with open(path, 'rb') as src, zf.open(info, 'w', force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, ZIP_CHUNK_SIZE)
+            except OSError as e:
+                errors = list(errors or []) + [f"{arcname}: {e}"]
+        if errors:
+            zf.writestr(unique_arcname('errors.txt', used), '\n'.join(errors) + '\n')
@@ -0,0 +1,196 @@
+"""Time-range clips against locally served MP4 and HLS fixtures: bytes and time should follow the clip, not the source.
+
+Runs fully offline, on the fixtures and stand-in extractor of bench_pipeline.py,
+with the server paced to --bandwidth-mbit per connection like a real link.
+Each source is downloaded whole once, then as clips of growing length from the
+middle of it, with keyframe cuts (stream copy) and with frame-accurate cuts:
+
+    python benchmarks/bench_clips.py --duration 60 --clips 5,15,30
+
+Reports the media bytes the server sent, their share of the source's files,
+the job time and the duration of the file that came out. Exits 1 if a clip
+read more than --max-overhead times its share of the source plus
+--slack-seconds of media and --slack-kb, or came out with the wrong length.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_pipeline import FixtureHandler, BenchYoutubeDL, make_fixtures  # noqa: E402
+from artifact_cache import ArtifactCache  # noqa: E402
+from jobs import DONE, FINISHED_STATES, JobManager  # noqa: E402
+from metadata_cache import InfoReuse, MetadataCache  # noqa: E402
+from progress_bus import ProgressBus  # noqa: E402
+from scratch import ScratchStorage  # noqa: E402
+from ydl_pool import YoutubeDLPool  # noqa: E402
+from core import (  # noqa: E402
+    fetch_info, parse_clip, video_preview, video_download, audio_download, run_download_job,
+)
+
+
+def plan_video(info, clip):
+    preview = video_preview(info.get('formats'), '720', 'auto', info.get('duration'))
+    return video_download(info, '720', preview=preview, clip=clip)
+
+
+def plan_audio(info, clip):
+    return audio_download(info, 'm4a', '128', clip=clip)
+
+
+# (name, page id prefix, planner, fixture files it reads, tools besides ffmpeg the whole download needs)
+SOURCES = (
+    ('mp4', 'p', plan_video, ('v720.mp4', 'a128.m4a'), ()),
+    # yt-dlp probes whole HLS downloads for the MPEG-TS fixup; clips go through ffmpeg and skip it
+    ('hls', 'h', plan_video, ('hls/',), ('ffprobe',)),
+    ('audio', 'p', plan_audio, ('a128.m4a',), ()),
+)
+
+
+def media_duration(path):
+    """Seconds of media in path, from ffmpeg's header dump (ffprobe may not be installed)"""
+    probe = subprocess.run(['ffmpeg', '-hide_banner', '-i', path], capture_output=True, text=True)
+    match = re.search(r'Duration: (\d+):(\d+):([\d.]+)', probe.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def reads_hls(path):
+    """Whether this ffmpeg can demux the HLS fixture (some static builds crash on MPEG-TS)"""
+    return subprocess.run(['ffmpeg', '-v', 'quiet', '-i', path, '-t', '1', '-f', 'null', '-'],
+                          capture_output=True).returncode == 0
+
+
+def download(url, planner, clip, cache, services, manager):
+    """(media bytes served, job seconds, output path or error) of one download"""
+    info = fetch_info(url, cache, services['ydl_pool'])
+    ydl_opts, cache_key, mime, estimated_size = planner(info, clip)
+    media_type = 'audio' if mime.startswith('audio/') else 'video'
+    served = FixtureHandler.served
+    job_id = manager.submit(
+        run_download_job, url, ydl_opts, cache_key, mime, media_type, services, estimated_size,
+        platform='other', label=info['title'],
+    )
+    while manager.get(job_id).state not in FINISHED_STATES:
+        time.sleep(0.02)
+    job = manager.get(job_id)
+    output = job.result['path'] if job.state == DONE else (job.error or job.state)
+    return FixtureHandler.served - served, job.finished - job.started, job.state == DONE, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=int, default=60, help="seconds of fixture media")
+    parser.add_argument('--clips', default='5,15,30', help="clip lengths in seconds, comma separated")
+    parser.add_argument('--max-overhead', type=float, default=1.5,
+                        help="allowed ratio of a clip's byte share to its length share")
+    parser.add_argument('--slack-seconds', type=float, default=6.0,
+                        help="media a clip may read beyond that (keyframe interval, HLS segments, buffering)")
+    parser.add_argument('--slack-kb', type=float, default=512,
+                        help="bytes a clip may read on top, for the requests that find the header and index")
+    parser.add_argument('--bandwidth-mbit', type=float, default=100, help="per-connection pace of the server")
+    args = parser.parse_args()
+    if not shutil.which('ffmpeg'):
+        parser.error("ffmpeg is required on PATH")
+    lengths = [float(length) for length in args.clips.split(',')]
+    if max(lengths) >= args.duration:
+        parser.error("clips must be shorter than --duration")
+
+    work = tempfile.mkdtemp(prefix='bench-clips-')
+    server = None
+    failures = []
+    try:
+        fixtures = os.path.join(work, 'fixtures')
+        os.makedirs(fixtures)
+        start = time.perf_counter()
+        for name in make_fixtures(fixtures, args.duration):
+            with open(os.path.join(fixtures, name), 'rb') as f:
+                FixtureHandler.files[name] = f.read()
+        FixtureHandler.duration = args.duration
+        FixtureHandler.bandwidth = args.bandwidth_mbit * 1000 ** 2 / 8
+        print(f"fixtures: {len(FixtureHandler.files)} files, "
+              f"{sum(map(len, FixtureHandler.files.values())) / 1024 ** 2:.1f} MB in {time.perf_counter() - start:.1f} s\n")
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        cache = MetadataCache(os.path.join(work, 'metadata'))
+        services = {
+            'artifact_cache': ArtifactCache(os.path.join(work, 'artifacts'), 20 * 1024 ** 3),
+            'file_server': None,
+            'bus': ProgressBus(),
+            'ydl_pool': YoutubeDLPool(max_per_profile=1, ydl_class=BenchYoutubeDL),
+            'info_reuse': InfoReuse(cache),
+            'scratch': ScratchStorage(os.path.join(work, 'scratch'), reserve_bytes=0),
+        }
+        # One job at a time, so the server's byte count belongs to it
+        manager = JobManager(1, platform_limits={'other': 1})
+
+        print(f"{'source':<7}{'range':>16}{'cut':>10}{'served MB':>11}{'share':>8}{'job s':>8}{'output s':>10}")
+        hls_ok = reads_hls(os.path.join(fixtures, 'hls', 'index.m3u8'))
+        for name, prefix, planner, files, tools in SOURCES:
+            if name == 'hls' and not hls_ok:
+                print(f"{name:<7}  skipped, this ffmpeg can't read the MPEG-TS fixture")
+                continue
+            source_bytes = sum(len(data) for path, data in FixtureHandler.files.items() if path.startswith(files))
+            # The first download of a kind also builds its pooled YoutubeDL; keep that out of the timings
+            download(f"{base}/watch/{prefix}-{name}-warmup", planner, parse_clip(0, 1), cache, services, manager)
+            missing = [tool for tool in tools if not shutil.which(tool)]
+            if missing:
+                print(f"{name:<7}{'whole':>16}  skipped, needs {', '.join(missing)}")
+            else:
+                served, seconds, ok, output = download(
+                    f"{base}/watch/{prefix}-{name}-whole", planner, None, cache, services, manager
+                )
+                if not ok:
+                    failures.append(f"{name} whole: {output}")
+                    continue
+                print(f"{name:<7}{'whole':>16}{'':>10}{served / 1024 ** 2:11.1f}{served / source_bytes:8.1%}"
+                      f"{seconds:8.2f}{media_duration(output) or 0:10.1f}")
+            for length in lengths:
+                for accurate in (False, True):
+                    clip_start = (args.duration - length) / 2
+                    clip = parse_clip(clip_start, clip_start + length, accurate, args.duration)
+                    cut = 'frame' if accurate else 'keyframe'
+                    served, seconds, ok, output = download(
+                        f"{base}/watch/{prefix}-{name}-{length:g}-{cut}", planner, clip, cache, services, manager
+                    )
+                    label = f"{clip_start:g}-{clip_start + length:g} s"
+                    if not ok:
+                        failures.append(f"{name} {label} {cut}: {output}")
+                        continue
+                    share, produced = served / source_bytes, media_duration(output) or 0
+                    print(f"{'':<7}{label:>16}{cut:>10}{served / 1024 ** 2:11.1f}{share:8.1%}{seconds:8.2f}"
+                          f"{produced:10.1f}")
+                    allowed = ((length * args.max_overhead + args.slack_seconds) / args.duration
+                               + args.slack_kb * 1024 / source_bytes)
+                    if share > allowed:
+                        failures.append(f"{name} {label} {cut}: read {share:.1%} of the source, allowed {allowed:.1%}")
+                    # Keyframe cuts may start up to a GOP early; frame cuts should be within a frame or two
+                    if not length - 0.2 <= produced <= length + (0.2 if accurate else args.slack_seconds):
+                        failures.append(f"{name} {label} {cut}: came out {produced:.2f} s long")
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"\n{len(failures)} failures")
+    for line in failures:
+        print(f"    {line}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Download engine throughput against a local server that throttles every connection.
+
+Runs fully offline. The server caps each connection at --rate KB/s, like a CDN
+throttling per connection, and serves a progressive file with Range support
+and an HLS playlist of segments:
+
+    python benchmarks/bench_download_engine.py --size-mb 16 --rate 2048
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from download_engine import EngineYoutubeDL, ThroughputMeter, engine_options  # noqa: E402
+
+OPTS = {'quiet': True, 'no_warnings': True, 'noplaylist': True, 'fixup': 'never', 'noprogress': True}
+BLOCK = 16 * 1024
+SEGMENTS = 16
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    payload = b''
+    rate = 1024 * 1024
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with ThrottledHandler.lock:
+            ThrottledHandler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # Clients drop idle keep-alive connections when they close
+            pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        path = self.path.split('?', 1)[0]
+        if path == '/stream.m3u8':
+            body = self._playlist().encode()
+            self._send(200, body, 'application/vnd.apple.mpegurl', send_body)
+            return
+        match = re.match(r'^/seg(\d+)\.ts$', path)
+        if match:
+            seg_size = len(self.payload) // SEGMENTS
+            index = int(match.group(1))
+            self._send(200, self.payload[index * seg_size:(index + 1) * seg_size], 'video/mp2t', send_body)
+            return
+        if path != '/video.mp4':
+            self.send_error(404)
+            return
+        size = len(self.payload)
+        match = re.match(r'^bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            self._send(206, self.payload[start:end + 1], 'video/mp4', send_body,
+                       {'Content-Range': f"bytes {start}-{end}/{size}"})
+        else:
+            self._send(200, self.payload, 'video/mp4', send_body)
+
+    def _playlist(self):
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(SEGMENTS):
+            lines += ['#EXTINF:4.0,', f'seg{i}.ts']
+        return '\n'.join(lines + ['#EXT-X-ENDLIST', ''])
+
+    def _send(self, status, body, mime, send_body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', mime)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Accept-Ranges', 'bytes')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not send_body:
+            return
+        start = time.monotonic()
+        for offset in range(0, len(body), BLOCK):
+            try:
+                self.wfile.write(body[offset:offset + BLOCK])
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            # Per-connection throttle
+            delay = start + (offset + BLOCK) / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def run(url, options, expected_sha):
+    out_dir = tempfile.mkdtemp(prefix='bench-engine-')
+    meter = ThroughputMeter()
+    ThrottledHandler.connections = 0
+    try:
+        opts = dict(OPTS, **options, outtmpl=os.path.join(out_dir, 'out.%(ext)s'), progress_hooks=[meter.hook])
+        start = time.perf_counter()
+        with EngineYoutubeDL(opts) as ydl:
+            ydl.extract_info(url, download=True)
+        elapsed = time.perf_counter() - start
+        files = [os.path.join(out_dir, f) for f in os.listdir(out_dir)]
+        with open(files[0], 'rb') as f:
+            ok = hashlib.sha256(f.read()).hexdigest() == expected_sha
+        return elapsed, meter.rate, ThrottledHandler.connections, ok
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=16)
+    parser.add_argument('--rate', type=int, default=2048, help="per-connection limit in KB/s")
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--chunk-mb', type=int, default=2)
+    parser.add_argument('--fragments', type=int, default=8)
+    args = parser.parse_args()
+
+    ThrottledHandler.payload = os.urandom(args.size_mb * 1024 ** 2)
+    ThrottledHandler.rate = args.rate * 1024
+    sha = hashlib.sha256(ThrottledHandler.payload).hexdigest()
+    hls_sha = hashlib.sha256(
+        ThrottledHandler.payload[:len(ThrottledHandler.payload) // SEGMENTS * SEGMENTS]
+    ).hexdigest()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottledHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    chunk_size = args.chunk_mb * 1024 ** 2
+
+    cases = (
+        ("progressive: native", f"{base}/video.mp4", sha, engine_options('native')),
+        ("progressive: parallel", f"{base}/video.mp4", sha,
+         engine_options('parallel', connections=args.connections, chunk_size=chunk_size)),
+        ("hls: 1 fragment", f"{base}/stream.m3u8", hls_sha, engine_options('native', fragments=1)),
+        (f"hls: {args.fragments} fragments", f"{base}/stream.m3u8", hls_sha,
+         engine_options('native', fragments=args.fragments)),
+    )
+    print(f"{args.size_mb} MB payload, {args.rate} KB/s per connection\n")
+    for name, url, expected, options in cases:
+        elapsed, rate, connections, ok = run(url, options, expected)
+        print(
+            f"{name:<24} {elapsed:7.2f} s  {(rate or 0) / 1024 ** 2:7.2f} MB/s  "
+            f"connections={connections:<3} {'ok' if ok else 'CORRUPT'}"
+        )
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Several processes sharing one SQLite job queue, with a worker killed mid-run.
+
+Runs fully offline. Worker processes claim jobs from the shared queue, one of
+them is killed with SIGKILL partway through, and its jobs are taken over once
+their leases lapse. Every job is submitted twice under the same key from the
+submitting process, so each should run once:
+
+    python benchmarks/bench_job_queue.py --workers 3 --jobs 30 --job-seconds 0.5
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import DONE, FINISHED_STATES  # noqa: E402
+from job_queue import SharedJobManager  # noqa: E402
+
+LEASE = 2.0
+HEARTBEAT = 0.2
+
+
+def work(job, seconds):
+    """Stand-in for a download: progress in steps, honouring cancellation"""
+    steps = 10
+    for step in range(steps):
+        job.check_cancelled()
+        time.sleep(seconds / steps)
+        job.update((step + 1) / steps, phase='downloading')
+    return {'worker': os.getpid(), 'seconds': seconds}
+
+
+def run_worker(url, slots, name):
+    manager = SharedJobManager(url, {'work': work}, slots, default_platform_limit=slots * 8, lease=LEASE,
+                               heartbeat=HEARTBEAT, worker_id=name)
+    signal.signal(signal.SIGTERM, lambda *_: manager.close() or sys.exit(0))
+    while True:
+        time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=3, help="worker processes")
+    parser.add_argument('--slots', type=int, default=2, help="jobs each worker runs at once")
+    parser.add_argument('--jobs', type=int, default=30)
+    parser.add_argument('--job-seconds', type=float, default=0.5)
+    parser.add_argument('--kill-after', type=float, default=1.5, help="seconds before one worker is killed")
+    parser.add_argument('--worker', nargs=3, metavar=('URL', 'SLOTS', 'NAME'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]), args.worker[2])
+        return 0
+
+    url = f"sqlite:///{tempfile.mkdtemp(prefix='bench-queue-')}/queue.db"
+    front = SharedJobManager(url, {'work': work}, 0, lease=LEASE, heartbeat=HEARTBEAT, worker_id='front')
+    workers = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', url, str(args.slots), f"w{i}"])
+        for i in range(args.workers)
+    ]
+    start = time.perf_counter()
+    job_ids = []
+    for i in range(args.jobs):
+        first = front.submit(work, args.job_seconds, platform='bench', key=f"job-{i}")
+        again = front.submit(work, args.job_seconds, platform='bench', key=f"job-{i}")
+        assert first == again, "same key, different jobs"
+        job_ids.append(first)
+
+    killed = False
+    while True:
+        jobs = [front.get(job_id) for job_id in job_ids]
+        if all(job.state in FINISHED_STATES for job in jobs):
+            break
+        if not killed and time.perf_counter() - start > args.kill_after:
+            workers[0].send_signal(signal.SIGKILL)
+            killed = True
+        time.sleep(0.1)
+    wall = time.perf_counter() - start
+
+    rows = front.db.rows(
+        "SELECT owner, attempts, created, started, finished FROM jobs WHERE id IN (%s)" % ','.join('?' * len(job_ids)),
+        job_ids,
+    )
+    done = sum(1 for job in jobs if job.state == DONE)
+    per_worker = {}
+    for owner, *_ in rows:
+        per_worker[owner] = per_worker.get(owner, 0) + 1
+    waits = sorted((started - created) * 1000 for _, _, created, started, _ in rows)
+    p99 = waits[min(len(waits) - 1, int(len(waits) * 0.99))]
+    ideal = args.jobs * args.job_seconds / (args.workers * args.slots)
+    print(f"{args.jobs} jobs (each submitted twice), {args.workers} workers x {args.slots} slots, lease {LEASE} s\n")
+    print(f"done              {done}/{args.jobs}  in {wall:.2f} s (ideal {ideal:.2f} s without the kill)")
+    print(f"coalesced         {front.stats()['coalesced']} duplicate submits")
+    print(f"taken over        {sum(1 for _, attempts, *_ in rows if attempts > 1)} jobs after w0 was killed")
+    print(f"finished by       {dict(sorted(per_worker.items()))}")
+    print(f"queue wait        p50={statistics.median(waits):8.1f} ms  p99={p99:8.1f} ms")
+
+    # w0 is still up if the jobs finished before its kill
+    for worker in workers:
+        if worker.poll() is None:
+            worker.terminate()
+    for worker in workers:
+        worker.wait()
+    front.close()
+    return 0 if done == args.jobs else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""End-to-end load test of extraction, download jobs and ffmpeg post-processing, with regression baselines.
+
+Runs fully offline. ffmpeg generates fixture media (separate video and audio
+tracks served progressively, and a muxed HLS rendition in 2 s segments), a
+local server serves them, and a stand-in extractor turns /watch/<id> pages
+into info dicts, so the app's own metadata cache, YoutubeDL pool, format
+planner, download engine and job manager do the rest:
+
+    python benchmarks/bench_pipeline.py --jobs 12 --concurrency 4
+    python benchmarks/bench_pipeline.py --save-baseline       (record this machine's numbers)
+
+Reports p50/p99 job latency, throughput, ffmpeg time (the jobs' postprocess
+phase) and peak RSS of this process and of ffmpeg. When the baseline file
+holds a run with the same parameters, exits 1 if any scenario regressed by
+more than --tolerance. Baselines are machine specific; record one per machine.
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yt_dlp.extractor.common import InfoExtractor  # noqa: E402
+from artifact_cache import ArtifactCache  # noqa: E402
+from download_engine import EngineYoutubeDL  # noqa: E402
+from jobs import DONE, FINISHED_STATES, JobManager  # noqa: E402
+from metadata_cache import InfoReuse, MetadataCache  # noqa: E402
+from progress_bus import ProgressBus  # noqa: E402
+from scratch import ScratchStorage  # noqa: E402
+from ydl_pool import YoutubeDLPool  # noqa: E402
+from core import (  # noqa: E402
+    DOWNLOAD_ENGINE, PHASE_SECONDS, fetch_info, video_preview, video_download, audio_download, run_download_job,
+    download_quality,
+)
+
+# Bytes the fixture server writes at a time
+SEND_CHUNK = 64 * 1024
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'pipeline.json')
+
+# (metric, higher is better, absolute slack): a change inside the slack is noise, not a regression
+CHECKS = (
+    ('p50_ms', False, 25.0),
+    ('p99_ms', False, 50.0),
+    ('throughput_mbs', True, 1.0),
+    ('ffmpeg_s', False, 0.25),
+    ('rss_mb', False, 32.0),
+    ('ffmpeg_rss_mb', False, 32.0),
+)
+
+
+def ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', *args], check=True)
+
+
+def make_fixtures(root, duration):
+    """Generate the fixture files under root; returns their paths relative to root"""
+    lavfi_video = f'testsrc=size=1280x720:rate=30:duration={duration}'
+    x264 = ['-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '3M', '-g', '60', '-pix_fmt', 'yuv420p']
+    ffmpeg('-f', 'lavfi', '-i', lavfi_video, *x264, '-an', os.path.join(root, 'v720.mp4'))
+    ffmpeg('-f', 'lavfi', '-i', lavfi_video, '-vf', 'scale=640:360', *x264, '-an', os.path.join(root, 'v360.mp4'))
+    ffmpeg('-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}', '-c:a', 'aac', '-b:a', '128k',
+           os.path.join(root, 'a128.m4a'))
+    os.makedirs(os.path.join(root, 'hls'))
+    ffmpeg('-i', os.path.join(root, 'v720.mp4'), '-i', os.path.join(root, 'a128.m4a'), '-c', 'copy',
+           '-f', 'hls', '-hls_time', '2', '-hls_playlist_type', 'vod',
+           '-hls_segment_filename', os.path.join(root, 'hls', 'seg%03d.ts'), os.path.join(root, 'hls', 'index.m3u8'))
+    return [os.path.relpath(os.path.join(dirpath, name), root)
+            for dirpath, _, names in os.walk(root) for name in names]
+
+
+def manifest(video_id, base, sizes, duration):
+    """Info dict of a fixture page: 'p-' ids have separate progressive tracks, 'h-' ids one HLS rendition"""
+    def progressive(format_id, name, **fields):
+        return dict(format_id=format_id, url=f"{base}/media/{name}", filesize=sizes[name],
+                    tbr=sizes[name] * 8 / 1000 / duration, protocol='http', **fields)
+
+    if video_id.startswith('h-'):
+        formats = [{
+            'format_id': 'hls-720', 'url': f"{base}/media/hls/index.m3u8", 'protocol': 'm3u8_native', 'ext': 'mp4',
+            'vcodec': 'avc1.64001f', 'acodec': 'mp4a.40.2', 'width': 1280, 'height': 720, 'fps': 30,
+            'tbr': sum(size for name, size in sizes.items() if name.endswith('.ts')) * 8 / 1000 / duration,
+        }]
+    else:
+        formats = [
+            progressive('a128', 'a128.m4a', ext='m4a', vcodec='none', acodec='mp4a.40.2', abr=128),
+            progressive('v360', 'v360.mp4', ext='mp4', vcodec='avc1.64001e', acodec='none', width=640, height=360),
+            progressive('v720', 'v720.mp4', ext='mp4', vcodec='avc1.64001f', acodec='none', width=1280, height=720),
+        ]
+    return {'id': video_id, 'title': f"Fixture {video_id}", 'duration': duration, 'formats': formats,
+            'webpage_url': f"{base}/watch/{video_id}"}
+
+
+class FixtureIE(InfoExtractor):
+    """Stand-in for a site extractor: one JSON request per page, like an API-backed site"""
+
+    IE_NAME = 'fixture'
+    _VALID_URL = r'http://127\.0\.0\.1:\d+/watch/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return self._download_json(url.replace('/watch/', '/api/'), video_id, note=False)
+
+
+class BenchYoutubeDL(EngineYoutubeDL):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_info_extractor(FixtureIE())
+        # Ahead of the generic extractor, which claims every URL
+        self._ies = {FixtureIE.ie_key(): self._ies.pop(FixtureIE.ie_key()), **self._ies}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    files = {}
+    duration = 10
+    latency = 0.0
+    # Bytes per second each connection is paced to, 0 for as fast as possible. Paced with a small send
+    # buffer, what a client reads before hanging up is close to what was sent
+    bandwidth = 0
+    # Media bytes sent, for benchmarks that check how much of a file a download reads
+    served = 0
+    served_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/api/'):
+            base = f"http://{self.headers['Host']}"
+            sizes = {name: len(data) for name, data in self.files.items()}
+            body = json.dumps(manifest(path[len('/api/'):], base, sizes, self.duration)).encode()
+            self._send(200, 'application/json', body, 0, len(body) - 1, send_body)
+            return
+        body = self.files.get(path[len('/media/'):]) if path.startswith('/media/') else None
+        if body is None:
+            self.send_error(404)
+            return
+        match = re.match(r'^bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        start, end = 0, len(body) - 1
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+        self._send(206 if match else 200, 'application/octet-stream', body, start, end, send_body)
+
+    def _send(self, status, content_type, body, start, end, send_body):
+        self.send_response(status)
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(body)}")
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+        if self.bandwidth:
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_CHUNK)
+        began, sent = time.perf_counter(), 0
+        # In chunks, so a client that hangs up after the part it needs is only counted for what it got
+        for offset in range(start, end + 1, SEND_CHUNK):
+            chunk = body[offset:min(offset + SEND_CHUNK, end + 1)]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if content_type != 'application/json':
+                with self.served_lock:
+                    FixtureHandler.served += len(chunk)
+            if self.bandwidth:
+                time.sleep(max(began + sent / self.bandwidth - time.perf_counter(), 0))
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def plan_video(info):
+    preview = video_preview(info.get('formats'), '720', 'auto', info.get('duration'))
+    return video_download(info, '720', preview=preview)
+
+
+def plan_audio(codec):
+    return lambda info: audio_download(info, codec, '192')
+
+
+# (name, page id prefix, planner, tools besides ffmpeg); info scenarios have no planner
+SCENARIOS = (
+    ('info-cold', 'p', None, ()),
+    ('info-warm', 'p', None, ()),
+    ('video-progressive', 'p', plan_video, ()),
+    # yt-dlp probes HLS downloads for the MPEG-TS fixup
+    ('video-hls', 'h', plan_video, ('ffprobe',)),
+    ('audio-mp3', 'p', plan_audio('mp3'), ()),
+    ('audio-m4a', 'p', plan_audio('m4a'), ()),
+)
+
+
+def run_info(urls, cache, pool, concurrency):
+    """Like run_jobs(), for extraction alone"""
+    def timed(url):
+        start = time.perf_counter()
+        fetch_info(url, cache, pool)
+        return time.perf_counter() - start
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(timed, urls)), 0, [], 0.0
+
+
+def run_jobs(urls, planner, cache, services, manager, concurrency):
+    """(job run times of successful jobs, bytes delivered, errors, ffmpeg seconds)"""
+    with ThreadPoolExecutor(concurrency) as executor:
+        infos = list(executor.map(lambda u: fetch_info(u, cache, services['ydl_pool']), urls))
+    job_ids, qualities = [], set()
+    for url, info in zip(urls, infos):
+        ydl_opts, cache_key, mime, estimated_size = planner(info)
+        qualities.add(download_quality(ydl_opts))
+        media_type = 'audio' if mime.startswith('audio/') else 'video'
+        job_ids.append(manager.submit(
+            run_download_job, url, ydl_opts, cache_key, mime, media_type, services, estimated_size,
+            platform='other', label=info['title'],
+        ))
+    ffmpeg_before = sum(PHASE_SECONDS.summary(platform='other', quality=q, phase='postprocess')['sum']
+                        for q in qualities)
+    while any(manager.get(job_id).state not in FINISHED_STATES for job_id in job_ids):
+        time.sleep(0.05)
+    ffmpeg_seconds = sum(PHASE_SECONDS.summary(platform='other', quality=q, phase='postprocess')['sum']
+                         for q in qualities) - ffmpeg_before
+    samples, size, errors = [], 0, []
+    for job_id in job_ids:
+        job = manager.get(job_id)
+        if job.state == DONE:
+            samples.append(job.finished - job.started)
+            size += job.result['file_size']
+        else:
+            errors.append(job.error or job.state)
+    return samples, size, errors, ffmpeg_seconds
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages of results against baseline results"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric, higher_is_better, slack in CHECKS:
+            if metric not in reference or metric not in result:
+                continue
+            old, new = reference[metric], result[metric]
+            worse = old - new if higher_is_better else new - old
+            limit = (old - old / (1 + tolerance)) if higher_is_better else old * tolerance
+            if worse > max(limit, slack):
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=8, help="downloads (and extractions) per scenario")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=int, default=10, help="seconds of fixture media")
+    parser.add_argument('--latency-ms', type=float, default=0, help="delay before every server response")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed relative slowdown")
+    args = parser.parse_args()
+    if not shutil.which('ffmpeg'):
+        parser.error("ffmpeg is required on PATH")
+
+    work = tempfile.mkdtemp(prefix='bench-pipeline-')
+    server = None
+    try:
+        fixtures = os.path.join(work, 'fixtures')
+        os.makedirs(fixtures)
+        start = time.perf_counter()
+        for name in make_fixtures(fixtures, args.duration):
+            with open(os.path.join(fixtures, name), 'rb') as f:
+                FixtureHandler.files[name] = f.read()
+        FixtureHandler.duration = args.duration
+        FixtureHandler.latency = args.latency_ms / 1000
+        print(f"fixtures: {len(FixtureHandler.files)} files, "
+              f"{sum(map(len, FixtureHandler.files.values())) / 1024 ** 2:.1f} MB in {time.perf_counter() - start:.1f} s")
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        cache = MetadataCache(os.path.join(work, 'metadata'))
+        services = {
+            'artifact_cache': ArtifactCache(os.path.join(work, 'artifacts'), 20 * 1024 ** 3),
+            'file_server': None,
+            'bus': ProgressBus(),
+            'ydl_pool': YoutubeDLPool(max_per_profile=args.concurrency, ydl_class=BenchYoutubeDL),
+            'info_reuse': InfoReuse(cache),
+            'scratch': ScratchStorage(os.path.join(work, 'scratch'), reserve_bytes=0),
+        }
+        manager = JobManager(args.concurrency, platform_limits={'other': args.concurrency})
+        params = {'jobs': args.jobs, 'concurrency': args.concurrency, 'duration': args.duration,
+                  'latency_ms': args.latency_ms, 'engine': DOWNLOAD_ENGINE}
+        print(f"{args.jobs} per scenario, concurrency {args.concurrency}, engine {DOWNLOAD_ENGINE}\n")
+        # Load the extractors and fill the pool, so info-cold times extraction rather than start-up
+        run_info([f"{base}/watch/p-warmup-{i}" for i in range(args.concurrency)], cache, services['ydl_pool'],
+                 args.concurrency)
+
+        results, failed = {}, False
+        for name, prefix, planner, tools in SCENARIOS:
+            missing = [tool for tool in tools if not shutil.which(tool)]
+            if missing:
+                print(f"{name:<18} skipped, needs {', '.join(missing)}")
+                continue
+            page = 'info' if planner is None else name
+            urls = [f"{base}/watch/{prefix}-{page}-{i}" for i in range(args.jobs)]
+            start = time.perf_counter()
+            if planner is None:
+                samples, size, errors, ffmpeg_seconds = run_info(urls, cache, services['ydl_pool'], args.concurrency)
+            else:
+                samples, size, errors, ffmpeg_seconds = run_jobs(
+                    urls, planner, cache, services, manager, args.concurrency
+                )
+            wall = time.perf_counter() - start
+            result = {
+                'p50_ms': percentile(samples, 0.5) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+                'rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+            }
+            if planner is not None:
+                result.update(throughput_mbs=size / 1024 ** 2 / wall, ffmpeg_s=ffmpeg_seconds,
+                              ffmpeg_rss_mb=peak_rss_mb(resource.RUSAGE_CHILDREN))
+            results[name] = result = {k: round(v, 2) for k, v in result.items()}
+            extra = (f"  {result['throughput_mbs']:7.1f} MB/s  ffmpeg={ffmpeg_seconds:6.2f} s  "
+                     f"ffmpeg rss={result['ffmpeg_rss_mb']:5.0f} MB") if planner else ""
+            print(f"{name:<18} p50={result['p50_ms']:8.1f} ms  p99={result['p99_ms']:8.1f} ms  "
+                  f"rss={result['rss_mb']:5.0f} MB{extra}  errors={len(errors)}")
+            for error in errors[:3]:
+                print(f"    {error}")
+            failed = failed or bool(errors)
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nbaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print(f"\nbaseline {args.baseline} was recorded with {baseline.get('params')}; not compared")
+        else:
+            regressions = compare(results, baseline['results'], args.tolerance)
+            print(f"\n{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+            for line in regressions:
+                print(f"    {line}")
+            failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Resuming partial downloads against a local server that drops connections partway through.
+
+Runs fully offline. Every response is cut off after --drop-after KB, so a
+download only completes by resuming with range requests:
+
+    python benchmarks/bench_resume.py --size-mb 8 --drop-after 1536
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp  # noqa: E402
+from download_engine import Backoff, EngineYoutubeDL, engine_options, retry_options  # noqa: E402
+
+OPTS = {'quiet': True, 'no_warnings': True, 'noplaylist': True, 'noprogress': True,
+        'logger': logging.getLogger('bench-resume')}
+BLOCK = 16 * 1024
+
+# Failed first attempts are expected here; keep their errors off the report
+OPTS['logger'].addHandler(logging.NullHandler())
+
+
+class DroppingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    payload = b''
+    drop_after = 1024 * 1024
+    bytes_sent = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        if self.path.split('?', 1)[0] != '/video.mp4':
+            self.send_error(404)
+            return
+        size = len(self.payload)
+        match = re.match(r'^bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        start, end = 0, size - 1
+        self.send_response(206 if match else 200)
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+        body = self.payload[start:end + 1]
+        sent = 0
+        for offset in range(0, len(body), BLOCK):
+            if sent >= self.drop_after:
+                # Cut the connection mid-body, like a flaky CDN or proxy
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            block = body[offset:offset + BLOCK]
+            try:
+                self.wfile.write(block)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            sent += len(block)
+            with DroppingHandler.lock:
+                DroppingHandler.bytes_sent += len(block)
+
+
+def download(url, out_dir, options):
+    opts = dict(OPTS, **options, outtmpl=os.path.join(out_dir, 'out.%(ext)s'))
+    with EngineYoutubeDL(opts) as ydl:
+        ydl.extract_info(url, download=True)
+
+
+def check(out_dir, expected_sha):
+    path = os.path.join(out_dir, 'out.mp4')
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest() == expected_sha
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=8)
+    parser.add_argument('--drop-after', type=int, default=1536, help="KB sent before each connection is cut")
+    parser.add_argument('--retries', type=int, default=20)
+    args = parser.parse_args()
+
+    DroppingHandler.payload = os.urandom(args.size_mb * 1024 ** 2)
+    DroppingHandler.drop_after = args.drop_after * 1024
+    sha = hashlib.sha256(DroppingHandler.payload).hexdigest()
+    size = len(DroppingHandler.payload)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DroppingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/video.mp4"
+    retry = retry_options(args.retries, Backoff(0.05, 0.5))
+
+    cases = (
+        ("native, resume", dict(engine_options('native'), **retry)),
+        ("parallel, resume", dict(engine_options('parallel', connections=4, chunk_size=size // 8), **retry)),
+    )
+    print(f"{args.size_mb} MB payload, connections cut after {args.drop_after} KB\n")
+    for name, options in cases:
+        out_dir = tempfile.mkdtemp(prefix='bench-resume-')
+        DroppingHandler.bytes_sent = 0
+        start = time.perf_counter()
+        try:
+            download(url, out_dir, options)
+            outcome = 'ok' if check(out_dir, sha) else 'CORRUPT'
+        except yt_dlp.utils.DownloadError:
+            outcome = 'failed'
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+        print(
+            f"{name:<30} {time.perf_counter() - start:6.2f} s  "
+            f"sent={DroppingHandler.bytes_sent / size:5.2f}x file  {outcome}"
+        )
+
+    # A job whose first attempt gives up: the next attempt either starts over in a
+    # fresh directory (the old behaviour) or picks up the partial file left behind
+    print()
+    for name, options in (("native", engine_options('native')),
+                          ("parallel", engine_options('parallel', connections=4, chunk_size=size // 8))):
+        for keep_partial in (False, True):
+            out_dir = tempfile.mkdtemp(prefix='bench-resume-')
+            try:
+                try:
+                    download(url, out_dir, dict(options, **retry_options(1, Backoff(0.05, 0.5))))
+                except yt_dlp.utils.DownloadError:
+                    pass
+                if not keep_partial:
+                    shutil.rmtree(out_dir)
+                    os.makedirs(out_dir)
+                DroppingHandler.bytes_sent = 0
+                download(url, out_dir, dict(options, **retry))
+                label = f"{name} job retry, {'resume' if keep_partial else 'restart'}"
+                print(
+                    f"{label:<30} attempt 2 sent {DroppingHandler.bytes_sent / size:5.0%} of the file  "
+                    f"{'ok' if check(out_dir, sha) else 'CORRUPT'}"
+                )
+            finally:
+                shutil.rmtree(out_dir, ignore_errors=True)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Per-request YoutubeDL setup cost and connection reuse, with and without the pool.
+
+Runs fully offline against a local keep-alive HTTP server:
+
+    python benchmarks/bench_ydl_pool.py --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp  # noqa: E402
+from ydl_pool import YoutubeDLPool  # noqa: E402
+
+OPTS = {'quiet': True, 'no_warnings': True, 'noplaylist': True}
+BODY = b'x' * 4096
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with CountingHandler.lock:
+            CountingHandler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples, connections=None):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    extra = f"  connections={connections}" if connections is not None else ""
+    print(f"{name:<28} p50={p50:8.3f} ms  p99={p99:8.3f} ms{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    pool = YoutubeDLPool()
+
+    def fresh_setup():
+        with yt_dlp.YoutubeDL(dict(OPTS)):
+            pass
+
+    def pooled_setup():
+        with pool.checkout('bench', OPTS):
+            pass
+
+    def fresh_request():
+        with yt_dlp.YoutubeDL(dict(OPTS)) as ydl:
+            ydl.urlopen(url).read()
+
+    def pooled_request():
+        with pool.checkout('bench', OPTS) as ydl:
+            ydl.urlopen(url).read()
+
+    print(f"{args.requests} requests each\n")
+    report("setup: new YoutubeDL", timed(fresh_setup, args.requests))
+    report("setup: pool checkout", timed(pooled_setup, args.requests))
+
+    for name, fn in (("request: new YoutubeDL", fresh_request), ("request: pool checkout", pooled_request)):
+        CountingHandler.connections = 0
+        samples = timed(fn, args.requests)
+        report(name, samples, CountingHandler.connections)
+
+    print(f"\npool stats: {pool.stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Command line entry point for scripted runs, on the same core as the web UI.
+
+    python cli.py info URL [URL ...]
+    python cli.py download -i urls.txt -o out/ --tier 720
+    python cli.py download --audio --codec m4a URL [URL ...]
+    python cli.py download --start 1:30 --end 2:00 URL
+    python cli.py serve --port 8503
+
+download extracts every link in parallel, queues all downloads on the shared
+job manager (JOB_WORKERS at once, 'max_jobs' per platform), reuses finished
+outputs from the artifact cache and copies each file into the output
+directory. It prints one JSON line per link and exits non-zero if any failed.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import api
+from batch import parse_urls, extract_batch, unique_arcname
+from jobs import DONE, FINISHED_STATES
+from scratch import InsufficientSpace
+from core import (
+    VIDEO_TIERS, VIDEO_CONTAINERS, AUDIO_CODECS, AUDIO_BITRATES, DEFAULT_TIER, DEFAULT_AUDIO_BITRATE,
+    BATCH_INFO_WORKERS, detect_platform, fetch_info, describe, get_metadata_cache, get_ydl_pool, get_job_manager,
+    parse_clip, video_preview, video_download, audio_download, submit_download, cached_artifact, download_quality,
+)
+
+logger = logging.getLogger("UniversalDownloader")
+
+POLL_INTERVAL = 0.5
+
+
+def read_urls(args):
+    urls = list(args.urls)
+    if args.input:
+        with (sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')) as f:
+            urls += parse_urls(f.read())
+    return list(dict.fromkeys(urls))
+
+
+def plan(args, info):
+    """(ydl options, artifact key, mime, media type) of what args ask for, adapted to info's formats"""
+    clip = parse_clip(args.start, args.end, args.accurate, info.get('duration'))
+    if args.audio:
+        ydl_opts, cache_key, mime, _ = audio_download(info, args.codec, args.kbps, clip=clip)
+        return ydl_opts, cache_key, mime, 'audio'
+    preview = video_preview(info.get('formats'), args.tier, args.container, info.get('duration'))
+    ydl_opts, cache_key, mime, _ = video_download(info, args.tier, preview=preview, clip=clip)
+    return ydl_opts, cache_key, mime, 'video'
+
+
+def report(item):
+    print(json.dumps(item, ensure_ascii=False), flush=True)
+
+
+def cmd_info(args):
+    cache, pool = get_metadata_cache(), get_ydl_pool()
+    items = extract_batch(read_urls(args), lambda u: fetch_info(u, cache, pool), detect_platform, BATCH_INFO_WORKERS)
+    failed = 0
+    for item in items:
+        if item['error']:
+            failed += 1
+            print(json.dumps({'url': item['url'], 'error': item['error']}, ensure_ascii=False))
+        else:
+            print(json.dumps(describe(item['url'], item['info']), ensure_ascii=False))
+    return 1 if failed else 0
+
+
+def deliver(item, result, out_dir, used):
+    """Copy a finished file into out_dir under a name no other item of this run took"""
+    name = unique_arcname(result.get('file_name') or os.path.basename(result['path']), used)
+    used.add(name)
+    item['file'] = os.path.join(out_dir, name)
+    shutil.copyfile(result['path'], item['file'])
+
+
+def cmd_download(args):
+    urls = read_urls(args)
+    if not urls:
+        print("no URLs given", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+    cache, pool, manager = get_metadata_cache(), get_ydl_pool(), get_job_manager()
+    start = time.time()
+    raw_items = extract_batch(urls, lambda u: fetch_info(u, cache, pool), detect_platform, BATCH_INFO_WORKERS)
+
+    used, items, running = set(), [], {}
+    for raw in raw_items:
+        item = {'url': raw['url'], 'title': (raw['info'] or {}).get('title'), 'error': raw['error'], 'file': None}
+        items.append(item)
+        if item['error']:
+            report(item)
+            continue
+        try:
+            ydl_opts, cache_key, mime, media_type = plan(args, raw['info'])
+            cached = cached_artifact(cache_key, mime, False, raw['platform'], download_quality(ydl_opts))
+            if cached:
+                deliver(item, cached, args.output, used)
+                report(dict(item, cached=True))
+                continue
+            # Links to the same video share one job
+            running.setdefault(submit_download(
+                raw['url'], ydl_opts, cache_key, mime, raw['info'], media_type, raw['platform'], delivery=False
+            ), []).append(item)
+        except (InsufficientSpace, OSError, ValueError) as e:
+            item['error'] = str(e)
+            report(item)
+
+    try:
+        while running:
+            time.sleep(POLL_INTERVAL)
+            for job_id, job_items in list(running.items()):
+                job = manager.get(job_id)
+                if job is not None and job.state not in FINISHED_STATES:
+                    continue
+                del running[job_id]
+                snapshot = job.snapshot() if job else {'state': 'lost', 'error': None}
+                for item in job_items:
+                    if snapshot['state'] == DONE:
+                        deliver(item, snapshot['result'], args.output, used)
+                    else:
+                        item['error'] = snapshot['error'] or snapshot['state']
+                    report(item)
+    except KeyboardInterrupt:
+        for job_id, job_items in running.items():
+            for _ in job_items:
+                manager.cancel(job_id)
+        print("cancelled", file=sys.stderr)
+        return 130
+
+    failed = sum(1 for item in items if item['error'])
+    print(f"{len(items) - failed}/{len(items)} downloaded in {time.time() - start:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_serve(args):
+    api.main(args.host, args.port)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-v', '--verbose', action='store_true', help="log progress to stderr")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    info = commands.add_parser('info', help="print metadata of each URL as a JSON line")
+    info.add_argument('urls', nargs='*')
+    info.add_argument('-i', '--input', help="file with one URL per line ('-' for stdin)")
+    info.set_defaults(run=cmd_info)
+
+    download = commands.add_parser('download', help="download URLs into a directory")
+    download.add_argument('urls', nargs='*')
+    download.add_argument('-i', '--input', help="file with one URL per line ('-' for stdin)")
+    download.add_argument('-o', '--output', default='.', help="output directory")
+    download.add_argument('--audio', action='store_true', help="extract audio instead of video")
+    download.add_argument('--tier', choices=list(VIDEO_TIERS), default=DEFAULT_TIER)
+    download.add_argument('--container', choices=list(VIDEO_CONTAINERS), default='auto')
+    download.add_argument('--codec', choices=AUDIO_CODECS, default='mp3')
+    download.add_argument('--kbps', choices=AUDIO_BITRATES, default=DEFAULT_AUDIO_BITRATE)
+    download.add_argument('--start', help="download only from here (seconds or h:mm:ss)")
+    download.add_argument('--end', help="download only up to here (seconds or h:mm:ss)")
+    download.add_argument('--accurate', action='store_true', help="cut the clip on exact frames (re-encodes it)")
+    download.set_defaults(run=cmd_download)
+
+    serve = commands.add_parser('serve', help="run the HTTP API")
+    serve.add_argument('--host', default=api.API_HOST)
+    serve.add_argument('--port', type=int, default=api.API_PORT)
+    serve.set_defaults(run=cmd_serve)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
+    )
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
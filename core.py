@@ -0,0 +1,940 @@
+"""The downloader without a UI: configuration, shared services, metadata, option building and download jobs.
+
+app.py (Streamlit), api.py (HTTP) and cli.py are clients of this module.
+Nothing here imports Streamlit; the shared services are created once per
+process on first use.
+"""
+import functools
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+import yt_dlp
+
+from metadata_cache import MetadataCache, InfoReuse, canonical_video_key
+from artifact_cache import ArtifactCache, artifact_key
+from file_server import FileDeliveryServer
+from jobs import JobManager
+from job_queue import SharedJobManager, default_worker_id
+from progress_bus import ProgressBus, SpeedEstimator, ytdlp_event
+from ydl_pool import YoutubeDLPool
+from download_engine import (
+    EngineYoutubeDL, ThroughputMeter, PhaseClock, Backoff, engine_options, retry_options, is_transient
+)
+from format_planner import (
+    audio_selector, audio_processing_path, estimate_download_size, SelectorEvaluator, preview_video, preview_audio
+)
+from scratch import InsufficientSpace, ScratchStorage, directory_size
+from session_memory import trim_formats
+from prefetch import SpeculativePrefetcher
+from thumbnails import ThumbnailCache
+from subtitles import FORMATS as SUBTITLE_MIMES, pick_track, fetch_subtitles, bundle
+from metrics import Registry, Trace, THROUGHPUT_BUCKETS
+
+logger = logging.getLogger("UniversalDownloader")
+
+# --- 1. Configuration & Constants ---
+
+PLATFORMS = {
+    'youtube': {'name': 'YouTube', 'icon': '🔴', 'pattern': r'(youtube\.com|youtu\.be)', 'info_ttl': 3600, 'max_jobs': 4,
+                'fragments': 8, 'connections': 4, 'chunk_mb': 10, 'retries': 10, 'backoff': 1},
+    'tiktok': {'name': 'TikTok', 'icon': '🎵', 'pattern': r'tiktok\.com', 'info_ttl': 900, 'max_jobs': 2,
+                'fragments': 1, 'connections': 2, 'chunk_mb': 4, 'retries': 5, 'backoff': 2},
+    'instagram': {'name': 'Instagram', 'icon': '📸', 'pattern': r'instagram\.com', 'info_ttl': 900, 'max_jobs': 2,
+                'fragments': 4, 'connections': 2, 'chunk_mb': 4, 'retries': 5, 'backoff': 3},
+    'twitter': {'name': 'X/Twitter', 'icon': '🐦', 'pattern': r'(twitter\.com|x\.com)', 'info_ttl': 1800, 'max_jobs': 2,
+                'fragments': 4, 'connections': 2, 'chunk_mb': 4, 'retries': 5, 'backoff': 2},
+    'facebook': {'name': 'Facebook', 'icon': '📘', 'pattern': r'facebook\.com', 'info_ttl': 900, 'max_jobs': 2,
+                'fragments': 4, 'connections': 2, 'chunk_mb': 4, 'retries': 5, 'backoff': 2},
+    'vimeo': {'name': 'Vimeo', 'icon': '🎬', 'pattern': r'vimeo\.com', 'info_ttl': 3600, 'max_jobs': 2,
+                'fragments': 8, 'connections': 4, 'chunk_mb': 8, 'retries': 10, 'backoff': 1},
+    'twitch': {'name': 'Twitch', 'icon': '💜', 'pattern': r'twitch\.tv', 'info_ttl': 600, 'max_jobs': 2,
+                'fragments': 8, 'connections': 2, 'chunk_mb': 8, 'retries': 10, 'backoff': 1},
+    'reddit': {'name': 'Reddit', 'icon': '🟠', 'pattern': r'reddit\.com', 'info_ttl': 1800, 'max_jobs': 2,
+                'fragments': 4, 'connections': 2, 'chunk_mb': 4, 'retries': 5, 'backoff': 2},
+    'dailymotion': {'name': 'Dailymotion', 'icon': '🌐', 'pattern': r'dailymotion\.com', 'info_ttl': 1800, 'max_jobs': 2,
+                'fragments': 8, 'connections': 2, 'chunk_mb': 8, 'retries': 10, 'backoff': 1},
+    'other': {'name': 'אחר', 'icon': '🌍', 'pattern': r'.*', 'info_ttl': 900, 'max_jobs': 2,
+                'fragments': 4, 'connections': 4, 'chunk_mb': 8, 'retries': 10, 'backoff': 1}
+}
+
+# Shared on-disk state (caches etc.) survives restarts of the app process
+DATA_DIR = os.environ.get('DOWNLOADER_DATA_DIR', os.path.join(tempfile.gettempdir(), 'universal_downloader'))
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get('ARTIFACT_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+ARTIFACT_CACHE_POLICY = os.environ.get('ARTIFACT_CACHE_POLICY', 'lru')
+
+# Working directories of running downloads. Jobs up to SCRATCH_RAM_MAX_BYTES use SCRATCH_RAM_DIR
+# (a tmpfs such as /dev/shm) when it is set and has room
+SCRATCH_DIR = os.environ.get('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'universal_downloader_scratch'))
+SCRATCH_RAM_DIR = os.environ.get('SCRATCH_RAM_DIR', '')
+SCRATCH_RAM_MAX_BYTES = int(os.environ.get('SCRATCH_RAM_MAX_BYTES', 512 * 1024 ** 2))
+SCRATCH_RESERVE_BYTES = int(os.environ.get('SCRATCH_RESERVE_BYTES', 1024 ** 3))
+# Seconds a crashed process's partial downloads are kept for the restarted process to resume
+SCRATCH_RESUME_TTL = int(os.environ.get('SCRATCH_RESUME_TTL', 3600))
+
+# Finished files are streamed by a small HTTP server next to Streamlit, at the URL browsers reach it on.
+# Empty: no server, files go through Streamlit's own download buttons (hosts that expose one port)
+FILE_SERVER_HOST = os.environ.get('FILE_SERVER_HOST', '0.0.0.0')
+FILE_SERVER_PORT = int(os.environ.get('FILE_SERVER_PORT', 8502))
+FILE_SERVER_PUBLIC_URL = os.environ.get('FILE_SERVER_PUBLIC_URL', '')
+# 'host:port' where the file server answers /metrics, apart from the public delivery port. Empty: not served
+FILE_SERVER_METRICS_ADDRESS = os.environ.get('FILE_SERVER_METRICS_ADDRESS', '')
+
+# Download engine: 'native' (yt-dlp, one connection), 'parallel' (ranged chunks over several
+# connections) or 'aria2c'. Per-platform tuning is 'fragments'/'connections'/'chunk_mb' in PLATFORMS
+DOWNLOAD_ENGINE = os.environ.get('DOWNLOAD_ENGINE', 'parallel')
+
+# Requests are retried 'retries' times with jittered backoff from 'backoff' seconds (per platform);
+# a job whose download still fails on a transient error is attempted again, resuming its partial files
+JOB_ATTEMPTS = int(os.environ.get('JOB_ATTEMPTS', 3))
+
+# Long-lived YoutubeDL instances kept per option profile
+YDL_POOL_SIZE = int(os.environ.get('YDL_POOL_SIZE', 4))
+
+METADATA_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+    'noplaylist': True,
+}
+
+# Background downloads: total workers (per-platform limits are 'max_jobs' in PLATFORMS)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 6))
+
+# Replicas of the app share one job queue when this is set: 'sqlite:////shared/queue.db' on a volume all of
+# them mount, or 'postgresql://...' (needs psycopg). DATA_DIR must then be shared as well, since any replica
+# serves files from the artifact cache. Empty keeps the queue inside this process
+JOB_QUEUE_URL = os.environ.get('JOB_QUEUE_URL', '')
+# This process's name in the shared queue
+REPLICA_ID = os.environ.get('REPLICA_ID', '') or default_worker_id()
+
+# Progress events are coalesced to at most this many updates per second per consumer
+PROGRESS_UPDATE_RATE = float(os.environ.get('PROGRESS_UPDATE_RATE', 2))
+PROGRESS_LOG_RATE = float(os.environ.get('PROGRESS_LOG_RATE', 0.2))
+
+# Video quality tiers by name; the UI labels map onto these
+VIDEO_TIERS = {
+    'best': "bestvideo+bestaudio/best",
+    '2160': "bestvideo[height<=2160]+bestaudio/best[height<=2160]",
+    '1080': "bestvideo[height<=1080]+bestaudio/best[height<=1080]",
+    '720': "bestvideo[height<=720]+bestaudio/best[height<=720]",
+    '480': "bestvideo[height<=480]+bestaudio/best[height<=480]",
+    '360': "bestvideo[height<=360]+bestaudio/best[height<=360]",
+}
+DEFAULT_TIER = '1080'
+
+# Output containers for video. 'auto' picks whichever one needs no conversion
+VIDEO_CONTAINERS = {
+    'auto': ('mp4', 'webm', 'mkv'),
+    'mp4': ('mp4',),
+}
+
+VIDEO_MIMES = {'mp4': "video/mp4", 'webm': "video/webm", 'mkv': "video/x-matroska"}
+
+AUDIO_CODECS = ('mp3', 'm4a', 'wav')
+AUDIO_BITRATES = ('320', '192', '128')
+DEFAULT_AUDIO_BITRATE = '192'
+
+# Shortest clip a time range may ask for, in seconds
+CLIP_MIN_SECONDS = 1
+
+# Speculative work on a pasted link of a known platform: 'off', 'info' (extract metadata right away) or
+# 'download' (also fetch the default tier in the background). Speculative downloads are capped in size,
+# in how many run at once and in how many bytes nobody used may be thrown away per hour
+SPECULATIVE_PREFETCH = os.environ.get('SPECULATIVE_PREFETCH', 'off')
+SPECULATIVE_MAX_BYTES = int(os.environ.get('SPECULATIVE_MAX_BYTES', 200 * 1024 ** 2))
+SPECULATIVE_MAX_JOBS = int(os.environ.get('SPECULATIVE_MAX_JOBS', 2))
+SPECULATIVE_WASTE_BUDGET = int(os.environ.get('SPECULATIVE_WASTE_BUDGET', 1024 ** 3))
+
+# Subtitle tracks fetched at once for one request
+SUBTITLE_WORKERS = 4
+
+# Thumbnails are served resized to this width (about twice the card's column, for sharp high-DPI screens)
+THUMBNAIL_WIDTH = 480
+
+# Metadata extractions running at once for a batch
+BATCH_INFO_WORKERS = 4
+
+# 'on' keeps a timed trace of every download job (scratch, prepare, transfer, postprocess, delivery)
+# in its result and the log; metrics are always collected
+TRACE_JOBS = os.environ.get('TRACE_JOBS', 'off') == 'on'
+
+# --- 2. Helpers ---
+
+def log_message(msg):
+    logger.info(msg)
+
+def detect_platform(url):
+    """Detect the platform from URL"""
+    for platform_id, platform_info in PLATFORMS.items():
+        if re.search(platform_info['pattern'], url, re.IGNORECASE):
+            return platform_id, platform_info
+    return 'other', PLATFORMS['other']
+
+def format_duration(seconds):
+    """Format duration in human readable format"""
+    if not seconds or not isinstance(seconds, (int, float)):
+        return "לא ידוע"
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+def format_timestamp(seconds):
+    """'m:ss' or 'h:mm:ss' of a position in a video, including 0"""
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+def format_filesize(bytes_size):
+    """Format file size in human readable format"""
+    if not bytes_size:
+        return "לא ידוע"
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if bytes_size < 1024:
+            return f"{bytes_size:.1f} {unit}"
+        bytes_size /= 1024
+    return f"{bytes_size:.1f} TB"
+
+# --- 3. Shared Services ---
+
+_services_lock = threading.RLock()
+
+def shared(factory):
+    """Decorator: create factory()'s object once per process, on first use"""
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with _services_lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+    # The object if it was created already, without creating it
+    get.peek = lambda: instance[0] if instance else None
+    return get
+
+@shared
+def get_metadata_cache():
+    """Metadata cache shared by all sessions"""
+    return MetadataCache(os.path.join(DATA_DIR, 'metadata'))
+
+@shared
+def get_info_reuse():
+    """Downloads driven by cached info dicts instead of a second extraction"""
+    return InfoReuse(get_metadata_cache())
+
+@shared
+def get_artifact_cache():
+    """Cache of finished downloads shared by all sessions"""
+    return ArtifactCache(
+        os.path.join(DATA_DIR, 'artifacts'), ARTIFACT_CACHE_MAX_BYTES, ARTIFACT_CACHE_POLICY, shared=bool(JOB_QUEUE_URL)
+    )
+
+@shared
+def get_thumbnail_cache():
+    """Resized thumbnails shared by all sessions"""
+    return ThumbnailCache(os.path.join(DATA_DIR, 'thumbnails'), THUMBNAIL_WIDTH)
+
+@shared
+def get_scratch():
+    """Working directories for downloads, shared by all jobs"""
+    return ScratchStorage(
+        SCRATCH_DIR,
+        ram_root=SCRATCH_RAM_DIR or None,
+        ram_max_bytes=SCRATCH_RAM_MAX_BYTES,
+        reserve_bytes=SCRATCH_RESERVE_BYTES,
+        resume_ttl=SCRATCH_RESUME_TTL,
+    )
+
+@shared
+def get_selector_evaluator():
+    """Resolves quality tiers against extracted formats without a network call"""
+    return SelectorEvaluator()
+
+def delivery_spool_dir():
+    """Where a replica's delivery server keeps the files it owns; it clears the directory on start"""
+    root = os.path.join(DATA_DIR, 'delivery')
+    # DATA_DIR is shared between replicas, so each one gets its own spool
+    return os.path.join(root, REPLICA_ID) if JOB_QUEUE_URL else root
+
+@shared
+def get_file_server():
+    """Streaming delivery server, or None without FILE_SERVER_PUBLIC_URL or when it can't bind (in-memory buttons)"""
+    if not FILE_SERVER_PUBLIC_URL:
+        return None
+    metrics_address = None
+    if FILE_SERVER_METRICS_ADDRESS:
+        host, _, port = FILE_SERVER_METRICS_ADDRESS.rpartition(':')
+        metrics_address = (host or '127.0.0.1', int(port))
+    try:
+        return FileDeliveryServer(
+            FILE_SERVER_HOST, FILE_SERVER_PORT, FILE_SERVER_PUBLIC_URL, delivery_spool_dir(),
+            metrics=METRICS.render, metrics_address=metrics_address,
+        )
+    except OSError as e:
+        log_message(f"File delivery server unavailable: {str(e)}")
+        return None
+
+@shared
+def get_ydl_pool():
+    """YoutubeDL instances (and their HTTP connections) shared by all sessions"""
+    return YoutubeDLPool(max_per_profile=YDL_POOL_SIZE, ydl_class=EngineYoutubeDL)
+
+@shared
+def get_progress_bus():
+    """Progress events of all background jobs"""
+    return ProgressBus()
+
+@shared
+def get_job_manager():
+    """Background download workers shared by all sessions (and by all replicas with JOB_QUEUE_URL)"""
+    platform_limits = {pid: p['max_jobs'] for pid, p in PLATFORMS.items()}
+    if JOB_QUEUE_URL:
+        return SharedJobManager(
+            JOB_QUEUE_URL, {'download': download_task}, JOB_WORKERS, platform_limits=platform_limits,
+            worker_id=REPLICA_ID,
+        )
+    return JobManager(JOB_WORKERS, platform_limits=platform_limits)
+
+@shared
+def get_prefetcher():
+    """Speculative extraction and download of pasted links, shared by all sessions.
+
+    Only the Streamlit app speculates; the job manager is created only when downloads are speculated too.
+    """
+    return SpeculativePrefetcher(
+        SPECULATIVE_PREFETCH, get_job_manager() if SPECULATIVE_PREFETCH == 'download' else None,
+        max_bytes=SPECULATIVE_MAX_BYTES, max_jobs=SPECULATIVE_MAX_JOBS, waste_budget=SPECULATIVE_WASTE_BUDGET,
+    )
+
+def job_services(delivery=True):
+    """Shared objects handed to background jobs, which run outside the caller's thread.
+
+    Headless clients pass delivery=False: they serve finished files themselves,
+    so the delivery server (and its port) is left alone.
+    """
+    return {
+        'artifact_cache': get_artifact_cache(),
+        'file_server': get_file_server() if delivery else None,
+        'bus': get_progress_bus(),
+        'ydl_pool': get_ydl_pool(),
+        'info_reuse': get_info_reuse(),
+        'scratch': get_scratch(),
+    }
+
+# --- 4. Metrics ---
+# Rendered for Prometheus at /metrics on the API and on the file delivery server
+
+METRICS = Registry()
+INFO_SECONDS = METRICS.histogram(
+    'downloader_info_seconds', "Time to get a video's metadata; source is cache, extract, coalesced or error",
+    ('platform', 'source'),
+)
+PHASE_SECONDS = METRICS.histogram(
+    'downloader_download_phase_seconds', "Time download jobs spent in each phase (prepare, transfer, postprocess, "
+    "retry_wait)", ('platform', 'quality', 'phase'),
+)
+DELIVERY_SECONDS = METRICS.histogram(
+    'downloader_delivery_seconds', "Time to store a finished file in the artifact cache and register its link",
+    ('platform', 'quality'),
+)
+THROUGHPUT = METRICS.histogram(
+    'downloader_throughput_bytes_per_second', "Network throughput of download jobs", ('platform', 'quality'),
+    THROUGHPUT_BUCKETS,
+)
+TRANSFER_BYTES = METRICS.counter(
+    'downloader_transfer_bytes_total', "Bytes downloaded from sites", ('platform', 'quality'),
+)
+RESUMED_BYTES = METRICS.counter(
+    'downloader_resumed_bytes_total', "Bytes of partial files resumed instead of downloaded again",
+    ('platform', 'quality'),
+)
+JOBS = METRICS.counter('downloader_jobs_total', "Finished download jobs by outcome", ('platform', 'quality', 'outcome'))
+ARTIFACT_LOOKUPS = METRICS.counter(
+    'downloader_artifact_lookups_total', "Requested outputs found (hit) or not (miss) in the artifact cache",
+    ('platform', 'quality', 'result'),
+)
+
+def service_stats():
+    """(service, stat) samples from the stats() of every shared service created so far"""
+    services = (
+        ('metadata_cache', get_metadata_cache), ('info_reuse', get_info_reuse), ('artifact_cache', get_artifact_cache),
+        ('thumbnail_cache', get_thumbnail_cache), ('scratch', get_scratch), ('file_server', get_file_server),
+        ('ydl_pool', get_ydl_pool), ('jobs', get_job_manager), ('prefetch', get_prefetcher),
+    )
+    for name, getter in services:
+        service = getter.peek()
+        if service is None:
+            continue
+        for stat, value in service.stats().items():
+            # Nested counts such as jobs per state are flattened into their own stat names
+            values = value.items() if isinstance(value, dict) else [(None, value)]
+            for sub, number in values:
+                if isinstance(number, (int, float)) and not isinstance(number, bool):
+                    yield (name, f"{stat}_{sub}" if sub else stat), number
+
+METRICS.gauge(
+    'downloader_service_stat', "Counters, sizes and rates reported by the shared services", ('service', 'stat'),
+    service_stats,
+)
+
+def download_quality(ydl_opts):
+    """Metrics label of what ydl_opts download: a VIDEO_TIERS name or '<codec>-<kbps>'"""
+    for pp in ydl_opts.get('postprocessors') or ():
+        if pp.get('key') == 'FFmpegExtractAudio':
+            return f"{pp['preferredcodec']}-{pp['preferredquality']}"
+    selector = ydl_opts.get('format') or ''
+    return next(
+        (tier for tier, tier_selector in VIDEO_TIERS.items()
+         if selector == tier_selector or selector.endswith('/' + tier_selector)),
+        'custom',
+    )
+
+# --- 5. Metadata ---
+
+def fetch_info(url, cache, pool):
+    """Metadata for url through the shared cache. Raises on extraction errors"""
+    cache_key = canonical_video_key(url)
+    platform_id, platform_info = detect_platform(url)
+    start = time.time()
+    info = cache.get(cache_key)
+    if info is not None:
+        INFO_SECONDS.observe(time.time() - start, platform=platform_id, source='cache')
+        log_message(f"Metadata cache hit for {cache_key} ({(time.time() - start) * 1000:.1f} ms). Stats: {cache.stats()}")
+        return info
+
+    def extract():
+        log_message(f"Starting metadata extraction for URL: {url}")
+        with pool.checkout('metadata', METADATA_OPTS) as ydl:
+            info = ydl.extract_info(url, download=False)
+            log_message(f"Metadata extracted successfully. Title: {info.get('title')}")
+        return cache.put(cache_key, info, ttl=platform_info['info_ttl'])
+
+    # Sessions asking for the same link at once share one extraction
+    try:
+        info, extracted = cache.coalesce(cache_key, extract)
+    except Exception:
+        INFO_SECONDS.observe(time.time() - start, platform=platform_id, source='error')
+        raise
+    INFO_SECONDS.observe(time.time() - start, platform=platform_id, source='extract' if extracted else 'coalesced')
+    if extracted:
+        log_message(f"Metadata cached as {cache_key} ({time.time() - start:.1f} s). Stats: {cache.stats()}")
+    else:
+        log_message(f"Metadata of {cache_key} shared with a concurrent extraction ({time.time() - start:.1f} s)")
+    return info
+
+def get_info(url):
+    """Metadata for url, after any speculative extraction of it in flight. Raises on extraction errors"""
+    # Processes that never speculated (API, CLI) don't build the prefetcher and its job manager for this
+    prefetcher = get_prefetcher.peek()
+    if prefetcher:
+        prefetcher.wait_info(canonical_video_key(url))
+    return fetch_info(url, get_metadata_cache(), get_ydl_pool())
+
+def summary_formats(summary):
+    """The summary's format table, reloaded from the metadata cache if the session budget spilled it"""
+    if summary.formats is not None:
+        return summary.formats
+    info = get_metadata_cache().get(summary.key)
+    return trim_formats(info.get('formats')) if info else []
+
+def fetch_url(url, max_bytes=-1):
+    """Body of a small resource (thumbnail, subtitle track) through a pooled YoutubeDL"""
+    with get_ydl_pool().checkout('metadata', METADATA_OPTS) as ydl:
+        with ydl.urlopen(url) as response:
+            return response.read(max_bytes)
+
+def available_subtitles(info):
+    """[(language, automatic)] of the video's subtitle tracks, uploaded ones first"""
+    return [(lang, False) for lang in info.get('subtitle_langs') or info.get('subtitles') or ()] + \
+        [(lang, True) for lang in info.get('caption_langs') or info.get('automatic_captions') or ()]
+
+def describe(url, info):
+    """JSON-ready summary of a video for headless clients: its fields plus what each tier and subtitle language offers"""
+    platform_id, platform = detect_platform(url)
+    tiers = {}
+    for tier in VIDEO_TIERS:
+        preview = video_preview(info.get('formats'), tier, 'auto', info.get('duration'))
+        tiers[tier] = preview and {k: preview[k] for k in ('height', 'vcodec', 'size', 'kbps')}
+    return {
+        'key': canonical_video_key(url),
+        'platform': platform_id,
+        'platform_name': platform['name'],
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'uploader': info.get('uploader'),
+        'duration': info.get('duration'),
+        'thumbnail': info.get('thumbnail'),
+        'webpage_url': info.get('webpage_url'),
+        'video_tiers': tiers,
+        'subtitles': [{'lang': lang, 'automatic': automatic} for lang, automatic in available_subtitles(info)],
+    }
+
+def fetch_subtitle_bundle(url, choices, fmt):
+    """Fetch [(language, automatic)] tracks of url's video converted to fmt, without any media.
+
+    One track comes back as a single file, several (or any error) as a ZIP.
+    """
+    info = fetch_info(url, get_metadata_cache(), get_ydl_pool())
+    title = yt_dlp.utils.sanitize_filename(info.get('title') or info.get('id') or 'subtitles')
+    requests, errors = [], []
+    for lang, automatic in choices:
+        name = f"{lang}.auto" if automatic else lang
+        track = pick_track((info.get('automatic_captions' if automatic else 'subtitles') or {}).get(lang))
+        if track:
+            requests.append((f"{title}.{name}.{fmt}", track, automatic))
+        else:
+            errors.append(f"{name}: no VTT or SRT track")
+    files, fetch_errors = fetch_subtitles(requests, fetch_url, fmt, SUBTITLE_WORKERS)
+    errors += fetch_errors
+    result = {'key': canonical_video_key(url), 'errors': errors, 'data': None}
+    if len(files) == 1 and not errors:
+        result.update(data=files[0][1].encode('utf-8'), file_name=files[0][0], mime=SUBTITLE_MIMES[fmt])
+    elif files:
+        result.update(data=bundle(files, errors), file_name=f"{title}.subtitles.zip", mime="application/zip")
+    return result
+
+# --- 6. Download Options ---
+
+def build_video_opts(tier, sub_lang=None, plan=None):
+    """yt-dlp options for a video tier. A plan from plan_video() pins the streams and the container"""
+    ydl_opts = {
+        'format': VIDEO_TIERS[tier],
+        'merge_output_format': 'mp4',
+    }
+    if plan:
+        # The tier's own selector stays as a fallback in case a planned format disappears
+        ydl_opts['format'] = f"{plan['format']}/{VIDEO_TIERS[tier]}"
+        ydl_opts['merge_output_format'] = plan['container']
+    if sub_lang:
+        ydl_opts['writesubtitles'] = True
+        ydl_opts['subtitleslangs'] = [sub_lang]
+    return ydl_opts
+
+def build_audio_opts(codec, kbps, format_selector=None):
+    """yt-dlp options for audio in codec at kbps. Without a planned format_selector, prefer a stream that needs no transcode"""
+    return {
+        'format': format_selector or audio_selector(codec, kbps),
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': codec,
+            'preferredquality': kbps,
+        }]
+    }
+
+def video_preview(formats, tier, container='auto', duration=None, evaluator=None):
+    """preview_video() of a tier in a container choice, or None when the tier can't be downloaded"""
+    return preview_video(
+        formats, VIDEO_TIERS[tier], VIDEO_CONTAINERS[container], duration, evaluator or get_selector_evaluator()
+    )
+
+def parse_clip(start=None, end=None, accurate=False, duration=None):
+    """A time range {'start', 'end', 'accurate'} in seconds, or None for the whole video.
+
+    start and end are seconds or 'h:mm:ss' strings; an empty end means up to the
+    end of the video. accurate asks for frame-accurate cuts instead of cuts on
+    the nearest keyframes. Raises ValueError on a range that can't be cut.
+    """
+    def seconds(value, name):
+        if value is None or value == '':
+            return None
+        if isinstance(value, (int, float)):
+            parsed = value
+        else:
+            parsed = yt_dlp.utils.parse_duration(str(value).strip())
+        if parsed is None or parsed < 0:
+            raise ValueError(f"{name} must be seconds or h:mm:ss, got {value!r}")
+        # parse_duration() gives ints for whole seconds; the range is part of artifact and job keys
+        return float(parsed)
+
+    start, end = seconds(start, 'start') or 0.0, seconds(end, 'end')
+    if duration and end is not None and end >= duration:
+        end = None
+    if duration and start >= duration:
+        raise ValueError(f"start {format_timestamp(start)} is past the end of the video ({format_timestamp(duration)})")
+    if end is not None and end - start < CLIP_MIN_SECONDS:
+        raise ValueError(f"end must be at least {CLIP_MIN_SECONDS} s after start")
+    if not start and end is None:
+        return None
+    return {'start': start, 'end': end, 'accurate': bool(accurate)}
+
+def clip_opts(clip):
+    """yt-dlp options that download only a clip's section.
+
+    ffmpeg seeks the source, so only the byte ranges or segments the clip
+    covers are fetched. Cuts are stream copies that start on the keyframe at
+    or before start; an accurate clip is re-encoded to cut on the exact frames.
+    """
+    if not clip:
+        return {}
+    end = clip['end'] if clip['end'] is not None else float('inf')
+    return {
+        'download_ranges': yt_dlp.utils.download_range_func(None, [(clip['start'], end)]),
+        'force_keyframes_at_cuts': clip['accurate'],
+    }
+
+def planned_size(info, ydl_opts):
+    """Approximate bytes a download with ydl_opts transfers, a clip's share of the whole when it has one"""
+    size = estimate_download_size(info, ydl_opts['format'], get_selector_evaluator())
+    clip, duration = ydl_opts.get('clip'), info.get('duration')
+    if not size or not clip or not duration:
+        return size
+    end = clip['end'] if clip['end'] is not None else duration
+    return int(size * min(max(end - clip['start'], 0) / duration, 1))
+
+def video_download(info, tier=DEFAULT_TIER, sub_lang=None, preview=None, clip=None):
+    """(ydl options, artifact key, mime, estimated size) of a video download.
+
+    preview is video_preview()'s for the tier; without one the tier's own selector is used.
+    clip is a parse_clip() range to download instead of the whole video.
+    """
+    plan = preview['plan'] if preview else None
+    ydl_opts = build_video_opts(tier, sub_lang, plan)
+    if clip:
+        ydl_opts['clip'] = clip
+    mime = VIDEO_MIMES[plan['container']] if plan else "video/mp4"
+    return ydl_opts, artifact_key(info, ydl_opts), mime, planned_size(info, ydl_opts)
+
+def audio_download(info, codec, kbps=DEFAULT_AUDIO_BITRATE, preview=None, clip=None):
+    """(ydl options, artifact key, mime, estimated size) of an audio download, copying the source stream when possible"""
+    preview = preview or preview_audio(info.get('formats'), codec, kbps, info.get('duration'))
+    ydl_opts = build_audio_opts(codec, kbps, preview['format'])
+    if clip:
+        ydl_opts['clip'] = clip
+    return ydl_opts, artifact_key(info, ydl_opts), f"audio/{codec}", planned_size(info, ydl_opts)
+
+def default_video_download(info, evaluator):
+    """video_download() of the default tier and container, or None if that tier is unavailable"""
+    preview = video_preview(info.get('formats'), DEFAULT_TIER, duration=info.get('duration'), evaluator=evaluator)
+    return video_download(info, preview=preview) if preview else None
+
+def download_engine_opts(platform_id):
+    """Download engine options tuned for a platform"""
+    platform = PLATFORMS.get(platform_id, PLATFORMS['other'])
+    options = engine_options(
+        DOWNLOAD_ENGINE,
+        fragments=platform['fragments'],
+        connections=platform['connections'],
+        chunk_size=platform['chunk_mb'] * 1024 ** 2,
+    )
+    options.update(retry_options(platform['retries'], Backoff(platform['backoff'])))
+    return options
+
+# --- 7. Download Jobs ---
+
+def download_media(url, options, temp_dir, pool, profile, on_progress=None, info_reuse=None, platform_id='other',
+                   on_postprocess=None):
+    """Download media into temp_dir and return (file path, info). Raises on failure.
+    Output is named '<video id>.<profile>.<ext>' and its final path is read back from the info dict.
+    With info_reuse the already extracted info dict is downloaded instead of extracting the page again"""
+    log_message(f"Download started. Options: {list(options.keys())}")
+    # Progress is reported through hooks; yt-dlp's console output would only mix into clients' stdout
+    options = dict(options, noplaylist=True, quiet=True, noprogress=True, outtmpl=f'%(id)s.{profile}.%(ext)s')
+    options.update(clip_opts(options.pop('clip', None)))
+    hooks = [on_progress] if on_progress else []
+    pp_hooks = [on_postprocess] if on_postprocess else []
+
+    with pool.checkout(profile, options, paths={'home': temp_dir}, progress_hooks=hooks,
+                       postprocessor_hooks=pp_hooks) as ydl:
+        if info_reuse:
+            result_info = info_reuse.download(ydl, url, PLATFORMS.get(platform_id, PLATFORMS['other'])['info_ttl'])
+        else:
+            result_info = ydl.extract_info(url, download=True)
+
+    # Path after merging / audio extraction
+    downloads = result_info.get('requested_downloads') or [{}]
+    file_path = downloads[0].get('filepath')
+    log_message(f"Download finished: {file_path}")
+    return file_path, result_info
+
+def output_file_name(info, file_path, clip=None):
+    """User-facing name of a downloaded file: its title (and clip range) with the real extension"""
+    title = yt_dlp.utils.sanitize_filename(info.get('title') or info.get('id') or 'download')
+    if clip:
+        # Colons aren't allowed in file names everywhere
+        end = format_timestamp(clip['end']) if clip['end'] is not None else ''
+        title += f" [{format_timestamp(clip['start'])}-{end}]".replace(':', '.')
+    return f"{title}{os.path.splitext(file_path)[1]}"
+
+def job_progress_hook(job, bus):
+    """yt-dlp progress hook that publishes a background job's progress on the bus"""
+    estimator = SpeedEstimator()
+    def hook(d):
+        job.check_cancelled()
+        bus.publish(job.id, ytdlp_event(d, estimator))
+    return hook
+
+def subscribe_job_progress(job, bus):
+    """Mirror a job's progress events into its status and the log, each at a capped rate"""
+    def update_job(event):
+        if event['status'] == 'downloading':
+            job.update(
+                event['fraction'],
+                phase='downloading',
+                downloaded=event['downloaded'],
+                total=event['total'],
+                speed=event['speed'],
+                eta=event['eta'],
+            )
+        elif event['status'] == 'finished':
+            job.update(1.0, phase='processing')
+
+    def log_event(event):
+        speed = f"{format_filesize(event['speed'])}/s" if event['speed'] else "N/A"
+        log_message(f"Job {job.id} {event['status']}: {format_filesize(event['downloaded'])} at {speed}")
+
+    return [
+        bus.subscribe(job.id, update_job, max_rate=PROGRESS_UPDATE_RATE),
+        bus.subscribe(job.id, log_event, max_rate=PROGRESS_LOG_RATE),
+    ]
+
+def run_download_job(job, url, ydl_opts, cache_key, mime, media_type, services, estimated_size=None):
+    """Background job: download, store in the artifact cache and register a delivery link"""
+    artifact_cache, file_server, bus, scratch = (
+        services['artifact_cache'], services['file_server'], services['bus'], services['scratch']
+    )
+    labels = {'platform': job.platform, 'quality': download_quality(ydl_opts)}
+    trace = Trace('download', TRACE_JOBS, job=job.id, **labels)
+    clock = PhaseClock()
+    outcome = 'error'
+
+    def wait_for_space():
+        job.check_cancelled()
+        job.update(phase='waiting_space')
+
+    # Partial files live in a directory keyed by what is downloaded, so a failed or
+    # re-submitted download of the same thing resumes them instead of starting over
+    with trace.span('scratch'):
+        try:
+            temp_dir = scratch.allocate(cache_key[:32], estimated_size, on_wait=wait_for_space)
+        except FileExistsError:
+            temp_dir = scratch.allocate(f"{cache_key[:32]}-{job.id}", estimated_size, on_wait=wait_for_space)
+    clock.enter('prepare')
+    job.update(phase='downloading')
+    keep_temp_dir = False
+    subscriptions = subscribe_job_progress(job, bus)
+    meter = ThroughputMeter()
+    publish_progress = job_progress_hook(job, bus)
+    
+    def on_progress(d):
+        clock.progress_hook(d)
+        meter.hook(d)
+        job.update(transferred=meter.bytes)
+        publish_progress(d)
+    
+    try:
+        options = dict(ydl_opts, **download_engine_opts(job.platform))
+        backoff = options['retry_sleep_functions']['http']
+        resumed_bytes = 0
+        for attempt in range(1, JOB_ATTEMPTS + 1):
+            resumed_bytes += directory_size(temp_dir)
+            clock.enter('prepare')
+            try:
+                file_path, result = download_media(
+                    url, options, temp_dir, services['ydl_pool'], media_type,
+                    on_progress=on_progress, info_reuse=services['info_reuse'], platform_id=job.platform,
+                    on_postprocess=clock.postprocessor_hook,
+                )
+                break
+            except Exception as e:
+                if job.cancel_requested or attempt == JOB_ATTEMPTS or not is_transient(e):
+                    # Keep what was downloaded for a later attempt, unless the user gave up on it
+                    # or the error is permanent and a retry would fail the same way
+                    keep_temp_dir = is_transient(e) and not job.cancel_requested
+                    raise
+                delay = backoff(attempt)
+                log_message(f"Job {job.id} attempt {attempt} failed ({str(e)}), resuming in {delay:.1f}s")
+                job.update(phase='retrying', attempt=attempt + 1)
+                clock.enter('retry_wait')
+                deadline = time.time() + delay
+                while time.time() < deadline:
+                    job.check_cancelled()
+                    time.sleep(min(0.5, max(deadline - time.time(), 0)))
+        clock.enter('delivery')
+        if resumed_bytes:
+            log_message(f"Job {job.id} resumed partial files, {format_filesize(resumed_bytes)} not downloaded again")
+            RESUMED_BYTES.inc(resumed_bytes, **labels)
+        log_message(
+            f"Job {job.id} transferred {format_filesize(meter.bytes)} in {meter.seconds:.1f}s "
+            f"({format_filesize(meter.rate or 0)}/s, engine {DOWNLOAD_ENGINE})"
+        )
+        TRANSFER_BYTES.inc(meter.bytes, **labels)
+        if meter.rate:
+            THROUGHPUT.observe(meter.rate, **labels)
+        job.update(throughput=meter.rate)
+        audio_path = None
+        if media_type == 'audio' and file_path:
+            codec = ydl_opts['postprocessors'][0]['preferredcodec']
+            audio_path = audio_processing_path(result, codec)
+            log_message(f"Job {job.id} audio {result.get('acodec')} -> {codec}: {audio_path}")
+            job.update(audio_path=audio_path)
+        if not file_path or not os.path.exists(file_path):
+            raise RuntimeError("הקובץ שהורד לא נמצא")
+        
+        file_name = output_file_name(result, file_path, ydl_opts.get('clip'))
+        file_size = os.path.getsize(file_path)
+        cached_path = artifact_cache.store(cache_key, file_path, file_name)
+        link = None
+        if file_server:
+            link = file_server.register(cached_path or file_path, file_name, mime, take_ownership=not cached_path)
+            if not cached_path:
+                file_path = file_server.local_path(link)
+        elif not cached_path:
+            # No delivery server: the client reads the file straight from the job's directory
+            keep_temp_dir = True
+        outcome = 'done'
+        response = {
+            'path': cached_path or file_path,
+            'link': link,
+            'cache_key': cache_key,
+            'file_name': file_name,
+            'file_size': file_size,
+            'mime': mime,
+            'throughput': meter.rate,
+            'audio_path': audio_path,
+            'resumed_bytes': resumed_bytes,
+            'replica': REPLICA_ID,
+            'trace': None,
+        }
+        return response
+    finally:
+        for subscription in subscriptions:
+            subscription.unsubscribe()
+        scratch.release(temp_dir, keep=keep_temp_dir)
+        for phase, seconds in clock.stop().items():
+            if phase == 'delivery':
+                DELIVERY_SECONDS.observe(seconds, **labels)
+            else:
+                PHASE_SECONDS.observe(seconds, phase=phase, **labels)
+        for phase, start, end in clock.intervals:
+            trace.add(phase, start, end)
+        if outcome != 'done' and job.cancel_requested:
+            outcome = 'cancelled'
+        JOBS.inc(outcome=outcome, **labels)
+        trace.log()
+        if outcome == 'done' and trace.enabled:
+            # Complete only now that delivery is timed
+            response['trace'] = trace.to_dict()
+
+def download_task(job, url, ydl_opts, cache_key, mime, media_type, estimated_size=None, delivery=True):
+    """run_download_job() with the services of the process that runs it.
+
+    Queued jobs only hold JSON arguments, so a job from the shared queue can run in any replica.
+    """
+    return run_download_job(job, url, ydl_opts, cache_key, mime, media_type, job_services(delivery), estimated_size)
+
+def submit_download(url, ydl_opts, cache_key, mime, info, media_type, platform_id='other', delivery=True, label=None):
+    """Queue a download as a background job and return its id.
+
+    A download of the same cache_key already queued or running is joined
+    instead, so every requester shares one transfer and its progress.
+    delivery=False skips registering a delivery link (see job_services()).
+    Raises InsufficientSpace when it can never fit in scratch storage.
+    """
+    estimated_size = planned_size(info, ydl_opts)
+    get_scratch().check(estimated_size)
+    return get_job_manager().submit(
+        download_task, url, ydl_opts, cache_key, mime, media_type, estimated_size, delivery,
+        platform=platform_id,
+        label=label or info.get('title', 'Unknown'),
+        key=cache_key,
+    )
+
+def local_result(result, delivery=True):
+    """A job result whose link this process serves; jobs from the shared queue may have run in another replica"""
+    if not result or result.get('replica', REPLICA_ID) == REPLICA_ID or not os.path.exists(result['path']):
+        return result
+    server = get_file_server() if delivery else None
+    link = None
+    if server:
+        # Artifact cache files are shared; another replica's spool is deleted when its link expires or it restarts
+        foreign = result['path'].startswith(os.path.join(DATA_DIR, 'delivery') + os.sep)
+        link = server.register(result['path'], result['file_name'], result['mime'], copy=foreign)
+    return dict(result, link=link, replica=REPLICA_ID)
+
+def cached_artifact(cache_key, mime, delivery=True, platform_id='other', quality='custom'):
+    """A finished download from the artifact cache, shaped like run_download_job()'s result, or None.
+
+    platform_id and quality (download_quality()) label the lookup in the metrics.
+    """
+    artifact_cache = get_artifact_cache()
+    cached_path = artifact_cache.lookup(cache_key)
+    ARTIFACT_LOOKUPS.inc(platform=platform_id, quality=quality, result='hit' if cached_path else 'miss')
+    if not cached_path:
+        return None
+    log_message(f"Artifact cache hit {cache_key[:12]}. Stats: {artifact_cache.stats()}")
+    server = get_file_server() if delivery else None
+    link = server.register(cached_path, os.path.basename(cached_path), mime) if server else None
+    return {
+        'path': cached_path,
+        'link': link,
+        'cache_key': cache_key,
+        'file_name': os.path.basename(cached_path),
+        'mime': mime,
+        'cached': True,
+    }
+
+# --- 8. Batches ---
+
+def batch_item(raw):
+    """Keep only what a batch needs from an extract_batch() result"""
+    info = raw['info'] or {}
+    return {
+        'url': raw['url'],
+        'platform': raw['platform'],
+        'title': info.get('title') or raw['url'],
+        'identity': {'extractor_key': info.get('extractor_key'), 'id': info.get('id')},
+        'error': raw['error'],
+        'job_id': None,
+        'path': None,
+    }
+
+def batch_video_plan(tier, container='auto'):
+    """Planner for start_batch_downloads(): what the video tab downloads for tier with default settings"""
+    def plan(info):
+        preview = video_preview(trim_formats(info.get('formats')), tier, container, info.get('duration'))
+        return video_download(info, tier, preview=preview)
+    return plan
+
+def batch_audio_plan(codec, kbps):
+    """Planner for start_batch_downloads(): what the audio tab downloads for codec and kbps"""
+    def plan(info):
+        preview = preview_audio(trim_formats(info.get('formats')), codec, kbps, info.get('duration'))
+        return audio_download(info, codec, kbps, preview=preview)
+    return plan
+
+def start_batch_downloads(batch, media_type, plan):
+    """Queue one background job per extracted item, reusing finished artifacts.
+
+    plan(info) gives (ydl options, artifact key, mime, estimated size) like
+    video_download(); with batch_video_plan() or batch_audio_plan() a batch
+    item shares its artifact and job with the same download from the tabs.
+    A batch is delivered as one ZIP, so its jobs register no links.
+    """
+    cache, pool = get_metadata_cache(), get_ydl_pool()
+    for item in batch['items']:
+        if item['error']:
+            continue
+        item['job_id'], item['path'] = None, None
+        try:
+            # A metadata cache hit since the batch was checked
+            info = fetch_info(item['url'], cache, pool)
+            ydl_opts, cache_key, mime, _ = plan(info)
+            cached = cached_artifact(cache_key, mime, False, item['platform'], download_quality(ydl_opts))
+            if cached:
+                item['path'] = cached['path']
+                continue
+            item['job_id'] = submit_download(
+                item['url'], ydl_opts, cache_key, mime, info, media_type, item['platform'],
+                delivery=False, label=item['title'],
+            )
+        except (yt_dlp.utils.DownloadError, InsufficientSpace, OSError, ValueError) as e:
+            item['error'] = str(e)
+    batch['started'] = True
+    batch['zip_link'] = None
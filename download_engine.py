@@ -0,0 +1,385 @@
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+
+import yt_dlp
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import RequestError
+
+logger = logging.getLogger("UniversalDownloader")
+
+ENGINES = ('native', 'parallel', 'aria2c')
+
+# Private YoutubeDL params read by EngineYoutubeDL; yt-dlp itself ignores unknown params
+PARALLEL_CONNECTIONS = 'parallel_connections'
+PARALLEL_CHUNK_SIZE = 'parallel_chunk_size'
+
+BLOCK_SIZE = 64 * 1024
+PROGRESS_INTERVAL = 0.5
+
+
+# Download errors worth another attempt; anything else (404, geo-block, bad format) fails the job
+TRANSIENT_ERRORS = (
+    'timed out', 'Connection', 'connection', 'IncompleteRead', 'Remote end closed', 'reset by peer',
+    'HTTP Error 429', 'HTTP Error 500', 'HTTP Error 502', 'HTTP Error 503', 'HTTP Error 504',
+)
+
+
+class Backoff:
+    """Exponential backoff with jitter, usable as a yt-dlp retry sleep function.
+
+    Attempt n waits between half and all of min(cap, base * 2**n) seconds, so
+    retries of parallel workers don't hit the server in lockstep. The repr is
+    stable, which keeps pooled YoutubeDL option fingerprints stable too.
+    """
+
+    def __init__(self, base=1.0, cap=30.0):
+        self.base = base
+        self.cap = cap
+
+    def __call__(self, n):
+        delay = min(self.cap, self.base * 2 ** n)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def __repr__(self):
+        return f"Backoff(base={self.base}, cap={self.cap})"
+
+
+def retry_options(retries, backoff):
+    """yt-dlp options retrying requests and fragments with backoff, resuming partial files"""
+    return {
+        'retries': retries,
+        'fragment_retries': retries,
+        'retry_sleep_functions': {'http': backoff, 'fragment': backoff},
+        'continuedl': True,
+    }
+
+
+def is_transient(error):
+    message = str(error)
+    return any(marker in message for marker in TRANSIENT_ERRORS)
+
+
+def engine_options(engine, fragments=1, connections=1, chunk_size=10 * 1024 ** 2):
+    """yt-dlp options selecting a download engine.
+
+    fragments is how many HLS/DASH fragments are fetched at once; connections
+    and chunk_size control how a large progressive file is split into ranged
+    requests. 'native' keeps yt-dlp's single-connection HTTP downloader.
+    """
+    options = {'concurrent_fragment_downloads': max(fragments, 1)}
+    if engine == 'aria2c':
+        if shutil.which('aria2c'):
+            options['external_downloader'] = {'http': 'aria2c'}
+            options['external_downloader_args'] = {'aria2c': [
+                '-x', str(connections), '-s', str(connections),
+                # aria2c refuses split sizes below 1M
+                '-k', f"{max(chunk_size // 1024 ** 2, 1)}M",
+            ]}
+            return options
+        logger.info("aria2c not found, using the parallel engine")
+        engine = 'parallel'
+    if engine == 'parallel' and connections > 1:
+        options[PARALLEL_CONNECTIONS] = connections
+        options[PARALLEL_CHUNK_SIZE] = chunk_size
+    return options
+
+
+class ThroughputMeter:
+    """Network throughput of one download job, from yt-dlp progress hook dicts.
+
+    Counts the bytes of every stream (video and audio are separate files) over
+    the time between the first transfer and the last finished stream, so
+    merging and post-processing don't dilute the figure.
+    """
+
+    def __init__(self):
+        self._bytes = {}
+        self._resumed = {}
+        self._start = None
+        self._end = None
+
+    def hook(self, d):
+        now = time.monotonic()
+        filename = d.get('filename')
+        if d['status'] == 'downloading':
+            if self._start is None:
+                self._start = now
+            if filename not in self._resumed:
+                # A resumed file starts counting at its partial size; only new bytes are transfer
+                self._resumed[filename] = d.get('downloaded_bytes') or 0
+            self._bytes[filename] = d.get('downloaded_bytes') or 0
+        elif d['status'] == 'finished':
+            if self._start is None or filename not in self._resumed:
+                # Already on disk, nothing was transferred
+                return
+            self._bytes[filename] = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            self._end = now
+
+    @property
+    def bytes(self):
+        return sum(size - self._resumed.get(filename, 0) for filename, size in self._bytes.items())
+
+    @property
+    def seconds(self):
+        if self._start is None:
+            return 0.0
+        return (self._end or time.monotonic()) - self._start
+
+    @property
+    def rate(self):
+        return self.bytes / self.seconds if self.seconds > 0 else None
+
+
+class PhaseClock:
+    """Splits a download job's wall time into phases, driven by yt-dlp's hooks.
+
+    'prepare' (extraction, format selection) lasts until the first byte is
+    requested, 'transfer' until a post-processor starts, and 'postprocess'
+    covers ffmpeg merges and conversions. enter() switches phases by hand,
+    e.g. for waiting between attempts. A phase entered again keeps adding up.
+    """
+
+    def __init__(self):
+        self.intervals = []
+        self._phase = None
+        self._since = None
+        self.enter('prepare')
+
+    def enter(self, phase):
+        now = time.time()
+        if phase == self._phase:
+            return
+        if self._phase is not None:
+            self.intervals.append((self._phase, self._since, now))
+        self._phase, self._since = phase, now
+
+    def progress_hook(self, d):
+        if d['status'] == 'downloading':
+            self.enter('transfer')
+
+    def postprocessor_hook(self, d):
+        if d['status'] == 'started':
+            self.enter('postprocess')
+
+    def stop(self):
+        """Close the current phase; returns {phase: seconds}"""
+        self.enter(None)
+        totals = {}
+        for phase, start, end in self.intervals:
+            totals[phase] = totals.get(phase, 0.0) + end - start
+        return totals
+
+
+class ParallelHttpFD(HttpFD):
+    """Downloads a progressive HTTP file as ranged chunks over several connections.
+
+    Servers that don't answer a probe with 206 Partial Content, and files no
+    larger than one chunk, go through yt-dlp's regular HttpFD.
+    """
+
+    FD_NAME = 'parallel'
+
+    def real_download(self, filename, info_dict):
+        connections = self.params.get(PARALLEL_CONNECTIONS) or 1
+        chunk_size = self.params.get(PARALLEL_CHUNK_SIZE) or 0
+        # Sites like YouTube throttle requests larger than their own chunk size
+        site_chunk = (info_dict.get('downloader_options') or {}).get('http_chunk_size')
+        if site_chunk:
+            chunk_size = min(chunk_size, site_chunk) if chunk_size else site_chunk
+        headers = dict(info_dict.get('http_headers') or {}, **{'Accept-Encoding': 'identity'})
+        size = self._probe_size(info_dict['url'], headers) if connections > 1 and chunk_size else None
+        if not size or size <= chunk_size:
+            return super().real_download(filename, info_dict)
+
+        tmpfilename = self.temp_name(filename)
+        done_file = f"{tmpfilename}.chunks"
+        self.report_destination(filename)
+        done = self._completed_chunks(tmpfilename, done_file, size)
+        if not done:
+            with open(tmpfilename, 'wb') as f:
+                f.truncate(size)
+            open(done_file, 'w').close()
+        resumed = sum(end - start + 1 for start, end in done)
+        if resumed:
+            self.report_resuming_byte(resumed)
+
+        chunks = queue.SimpleQueue()
+        pending = 0
+        for start in range(0, size, chunk_size):
+            chunk = (start, min(start + chunk_size, size) - 1)
+            if chunk not in done:
+                chunks.put(chunk)
+                pending += 1
+        workers_count = max(min(connections, pending), 1)
+        state = {'downloaded': resumed, 'error': None, 'running': workers_count}
+        lock = threading.Lock()
+        stop = threading.Event()
+        all_done = threading.Event()
+
+        def worker():
+            try:
+                with open(tmpfilename, 'r+b') as f:
+                    while not stop.is_set():
+                        try:
+                            start, end = chunks.get_nowait()
+                        except queue.Empty:
+                            return
+                        if self._fetch_range(info_dict['url'], headers, f, start, end, state, lock, stop):
+                            f.flush()
+                            with lock, open(done_file, 'a') as done_f:
+                                done_f.write(f"{start}-{end}\n")
+            except Exception as e:
+                with lock:
+                    state['error'] = state['error'] or e
+                stop.set()
+            finally:
+                with lock:
+                    state['running'] -= 1
+                    if not state['running']:
+                        all_done.set()
+
+        workers = [
+            threading.Thread(target=worker, name=f"parallel-fd-{i}", daemon=True)
+            for i in range(workers_count)
+        ]
+        start_time = time.time()
+        for thread in workers:
+            thread.start()
+        try:
+            while True:
+                downloaded = state['downloaded']
+                elapsed = time.time() - start_time
+                speed = downloaded / elapsed if elapsed > 0 else None
+                # Hooks may raise (e.g. a cancelled job); the finally block stops the workers
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': size,
+                    'filename': filename,
+                    'tmpfilename': tmpfilename,
+                    'elapsed': elapsed,
+                    'speed': speed,
+                    'eta': (size - downloaded) / speed if speed else None,
+                }, info_dict)
+                if all_done.wait(PROGRESS_INTERVAL):
+                    break
+        finally:
+            stop.set()
+            for thread in workers:
+                thread.join()
+
+        if state['error'] is not None or state['downloaded'] != size:
+            self.report_error(f"parallel download failed: {state['error'] or 'incomplete'}")
+            return False
+
+        self.try_rename(tmpfilename, filename)
+        os.remove(done_file)
+        elapsed = time.time() - start_time
+        logger.info(
+            f"Parallel download of {size} bytes over {len(workers)} connections "
+            f"in {elapsed:.1f}s ({size / max(elapsed, 1e-6) / 1024 ** 2:.2f} MB/s)"
+        )
+        self._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': size,
+            'total_bytes': size,
+            'filename': filename,
+            'elapsed': elapsed,
+        }, info_dict)
+        return True
+
+    def _completed_chunks(self, tmpfilename, done_file, size):
+        """Chunks finished by an earlier attempt, if its partial file is still there"""
+        if not self.params.get('continuedl', True) or not os.path.isfile(done_file) \
+                or not os.path.isfile(tmpfilename) or os.path.getsize(tmpfilename) != size:
+            return set()
+        done = set()
+        with open(done_file) as f:
+            for line in f:
+                start, _, end = line.strip().partition('-')
+                if start.isdigit() and end.isdigit():
+                    done.add((int(start), int(end)))
+        return done
+
+    def _probe_size(self, url, headers):
+        """Total size if the server honours byte ranges, else None"""
+        try:
+            response = self.ydl.urlopen(Request(url, headers=dict(headers, Range='bytes=0-0')))
+        except RequestError:
+            return None
+        try:
+            content_range = response.headers.get('Content-Range') or ''
+            if response.status != 206 or '/' not in content_range:
+                return None
+            total = content_range.rsplit('/', 1)[1]
+            return int(total) if total.isdigit() else None
+        finally:
+            response.close()
+
+    def _fetch_range(self, url, headers, f, start, end, state, lock, stop):
+        """Write bytes start..end of url into f, retrying from where it broke off. Returns False if stopped"""
+        retries = self.params.get('retries', 10)
+        sleep = self.params.get('retry_sleep_functions', {}).get('http') or Backoff(0.1, 5)
+        attempt = 0
+        while start <= end:
+            try:
+                response = self.ydl.urlopen(Request(url, headers=dict(headers, Range=f'bytes={start}-{end}')))
+                try:
+                    if response.status != 206:
+                        raise yt_dlp.utils.DownloadError(f"server ignored range {start}-{end}")
+                    f.seek(start)
+                    while start <= end and not stop.is_set():
+                        block = response.read(min(BLOCK_SIZE, end - start + 1))
+                        if not block:
+                            break
+                        f.write(block)
+                        start += len(block)
+                        with lock:
+                            state['downloaded'] += len(block)
+                finally:
+                    response.close()
+                if stop.is_set():
+                    return False
+                if start <= end:
+                    raise yt_dlp.utils.DownloadError(f"connection closed at byte {start}")
+            except (RequestError, OSError, yt_dlp.utils.DownloadError) as e:
+                attempt += 1
+                if attempt > retries or stop.is_set():
+                    raise
+                logger.info(f"Range {start}-{end} failed ({str(e)}), retry {attempt}/{retries}")
+                time.sleep(sleep(attempt - 1))
+        return True
+
+
+class EngineYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that sends plain progressive HTTP downloads through ParallelHttpFD when enabled"""
+
+    def dl(self, name, info, subtitle=False, test=False):
+        use_parallel = (
+            not test
+            and not subtitle
+            and name != '-'
+            and (self.params.get(PARALLEL_CONNECTIONS) or 1) > 1
+            and yt_dlp.utils.determine_protocol(info) in ('http', 'https')
+            and not info.get('section_start')
+            and not info.get('section_end')
+            and info.get('impersonate') is None
+            and not info.get('request_data')
+            and not self.params.get('external_downloader')
+        )
+        if not use_parallel:
+            return super().dl(name, info, subtitle=subtitle, test=test)
+        fd = ParallelHttpFD(self, self.params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        self.write_debug(f'Invoking {fd.FD_NAME} downloader on "{info["url"]}"')
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
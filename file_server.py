@@ -0,0 +1,238 @@
+import logging
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+logger = logging.getLogger("UniversalDownloader")
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Links are /files/<token>, tokens from secrets.token_urlsafe()
+FILE_PATH_RE = re.compile(r'^/files/([A-Za-z0-9_-]+)$')
+
+
+def content_disposition(filename):
+    """Attachment header that survives non-ASCII (e.g. Hebrew) titles"""
+    fallback = filename.encode('ascii', 'replace').decode('ascii').replace('?', '_').replace('"', '')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def parse_range(header, size):
+    """Parse a single-range 'Range' header into (start, end) inclusive, or None for the whole file"""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+class _DeliveryHandler(BaseHTTPRequestHandler):
+    server_version = "UniversalDownloader"
+
+    def log_message(self, format, *args):
+        logger.debug("file server: " + format % args)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        delivery = self.server.delivery
+        path = self.path.split('?', 1)[0]
+        if self.server.metrics_only:
+            if path == '/metrics':
+                self._serve_metrics(send_body)
+            else:
+                self.send_error(404)
+            return
+        match = FILE_PATH_RE.match(path)
+        item = delivery.resolve(match.group(1)) if match else None
+        delivery._count('requests')
+        if item is not None and 'producer' in item:
+            self._serve_stream(item, send_body)
+            return
+        if item is None or not os.path.exists(item['path']):
+            delivery._count('not_found')
+            self.send_error(404, "Link expired")
+            return
+
+        size = os.path.getsize(item['path'])
+        try:
+            byte_range = parse_range(self.headers.get('Range'), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        length = max(end - start + 1, 0)
+        self.send_response(206 if byte_range else 200)
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.send_header('Content-Type', item['mime'])
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Disposition', content_disposition(item['filename']))
+        self.end_headers()
+        if not send_body or length == 0:
+            return
+
+        try:
+            with open(item['path'], 'rb') as f:
+                # Zero-copy where the OS supports it; memory use is independent of file size
+                sent = self.connection.sendfile(f, offset=start, count=length)
+            delivery._count('bytes_sent', sent)
+        except (BrokenPipeError, ConnectionResetError):
+            delivery._count('disconnects')
+            logger.info(f"Client disconnected during delivery of {item['filename']}")
+
+    def _serve_metrics(self, send_body):
+        body = self.server.delivery.metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _serve_stream(self, item, send_body):
+        # Generated content has no known length: send it close-delimited, without Range support
+        self.send_response(200)
+        self.send_header('Content-Type', item['mime'])
+        self.send_header('Content-Disposition', content_disposition(item['filename']))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        if not send_body:
+            return
+        self.server.delivery._count('streams')
+        try:
+            item['producer'](self.wfile)
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.delivery._count('disconnects')
+            logger.info(f"Client disconnected during delivery of {item['filename']}")
+
+
+class FileDeliveryServer:
+    """Background HTTP server that streams registered files from disk by unguessable token.
+
+    With metrics (a callable returning Prometheus text) and metrics_address
+    ((host, port), e.g. on loopback) a second listener there answers /metrics;
+    the delivery port itself is public.
+    """
+
+    def __init__(self, host, port, public_url, spool_dir, link_ttl=6 * 3600, metrics=None, metrics_address=None):
+        self.public_url = public_url.rstrip('/')
+        self.spool_dir = spool_dir
+        self.link_ttl = link_ttl
+        self.metrics = metrics
+        self._items = {}
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'streams': 0, 'not_found': 0, 'disconnects': 0, 'bytes_sent': 0}
+        # Tokens live in memory only, so anything spooled by a previous process is unreachable
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        self._servers = [self._listen((host, port), 'file-delivery')]
+        logger.info(f"File delivery server listening on {host}:{port}, public URL {self.public_url}")
+        if metrics and metrics_address:
+            try:
+                self._servers.append(self._listen(metrics_address, 'file-delivery-metrics', metrics_only=True))
+                logger.info(f"Metrics served on {metrics_address[0]}:{metrics_address[1]}/metrics")
+            except OSError as e:
+                logger.info(f"Metrics listener unavailable: {e}")
+
+    def _listen(self, address, name, metrics_only=False):
+        httpd = ThreadingHTTPServer(address, _DeliveryHandler)
+        httpd.daemon_threads = True
+        httpd.delivery = self
+        httpd.metrics_only = metrics_only
+        threading.Thread(target=httpd.serve_forever, name=name, daemon=True).start()
+        return httpd
+
+    def register(self, path, filename, mime, take_ownership=False, copy=False):
+        """Return a download URL for path. With take_ownership the file is moved to the spool and deleted on expiry.
+
+        copy=True spools a copy instead, for a file someone else may delete first.
+        """
+        self.purge_expired()
+        token = secrets.token_urlsafe(24)
+        take_ownership = take_ownership or copy
+        if take_ownership:
+            owned_dir = os.path.join(self.spool_dir, token)
+            os.makedirs(owned_dir)
+            path = (shutil.copy2 if copy else shutil.move)(path, os.path.join(owned_dir, filename))
+        with self._lock:
+            self._items[token] = {
+                'path': path,
+                'filename': filename,
+                'mime': mime,
+                'expires': time.time() + self.link_ttl,
+                'owned': take_ownership,
+            }
+        return f"{self.public_url}/files/{token}"
+
+    def register_stream(self, producer, filename, mime):
+        """Return a download URL whose body is generated on request by producer(writable)"""
+        self.purge_expired()
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._items[token] = {
+                'producer': producer,
+                'filename': filename,
+                'mime': mime,
+                'expires': time.time() + self.link_ttl,
+                'owned': False,
+            }
+        return f"{self.public_url}/files/{token}"
+
+    def local_path(self, url):
+        """Path on disk behind a link returned by register()"""
+        item = self.resolve(url.rsplit('/', 1)[-1])
+        return item.get('path') if item else None
+
+    def resolve(self, token):
+        with self._lock:
+            item = self._items.get(token)
+        if item is None or item['expires'] < time.time():
+            return None
+        return item
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [t for t, item in self._items.items() if item['expires'] < now]
+            items = [self._items.pop(t) for t in expired]
+        for token, item in zip(expired, items):
+            if item['owned']:
+                shutil.rmtree(os.path.join(self.spool_dir, token), ignore_errors=True)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['links'] = len(self._items)
+        return stats
+
+    def shutdown(self):
+        for httpd in self._servers:
+            httpd.shutdown()
+            httpd.server_close()
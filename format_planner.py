@@ -0,0 +1,307 @@
+import re
+import threading
+
+import yt_dlp
+
+# acodec prefixes that ffmpeg can copy into each audio target without re-encoding
+AUDIO_COPY_CODECS = {
+    'mp3': ('mp3',),
+    'm4a': ('mp4a', 'aac'),
+    'wav': ('pcm',),
+}
+
+# Sites label streams with nominal bitrates (e.g. 129.5k for "128k"), so allow some slack
+QUALITY_TOLERANCE = 0.9
+
+
+def has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+
+def is_audio_only(fmt):
+    return has_audio(fmt) and fmt.get('vcodec') == 'none'
+
+
+def audio_bitrate(fmt):
+    """Audio bitrate in kbps, or None if the site doesn't say"""
+    if fmt.get('abr'):
+        return fmt['abr']
+    if is_audio_only(fmt):
+        return fmt.get('tbr')
+    return None
+
+
+def copyable_audio(fmt, codec):
+    """Whether fmt's audio can go into the codec target by stream copy"""
+    acodec = (fmt.get('acodec') or '').lower()
+    return any(acodec.startswith(prefix) for prefix in AUDIO_COPY_CODECS.get(codec, ()))
+
+
+def audio_selector(codec, kbps):
+    """Generic yt-dlp selector preferring a copyable stream of at least kbps, for when formats aren't known yet"""
+    floor = int(float(kbps) * QUALITY_TOLERANCE)
+    preferred = [f"bestaudio[acodec^={prefix}][abr>={floor}]" for prefix in AUDIO_COPY_CODECS.get(codec, ())]
+    return '/'.join(preferred + ['bestaudio', 'best'])
+
+
+def plan_audio(formats, codec, kbps):
+    """Choose the source stream for an audio download in the codec target at kbps.
+
+    A stream whose codec can be copied into the target is used when its bitrate
+    satisfies kbps, or when no other stream has a higher bitrate (transcoding
+    can't add quality that isn't in the source). Audio-only streams are
+    preferred; a muxed stream is only used when the site has no audio-only
+    ones. Returns {'format', 'path': 'copy'|'transcode'|None, 'source'} plus
+    'stream' (the chosen format) for copies; path is None when the site
+    doesn't report audio codecs.
+    """
+    audio = [f for f in formats or [] if has_audio(f) and f.get('format_id')]
+    audio_only = [f for f in audio if is_audio_only(f)]
+    pool = audio_only or audio
+    best_abr = max((audio_bitrate(f) or 0 for f in pool), default=0)
+    floor = float(kbps) * QUALITY_TOLERANCE
+
+    if not pool:
+        return {'format': 'bestaudio/best', 'path': None, 'source': None}
+
+    candidates = []
+    for fmt in pool:
+        abr = audio_bitrate(fmt)
+        if copyable_audio(fmt, codec) and abr and (abr >= floor or abr >= best_abr):
+            candidates.append(fmt)
+    if not candidates:
+        return {'format': 'bestaudio/best', 'path': 'transcode', 'source': None}
+    if audio_only:
+        source = max(candidates, key=audio_bitrate)
+    else:
+        # Muxed streams carry video we throw away: take the smallest one that qualifies
+        source = min(candidates, key=lambda f: f.get('filesize') or f.get('filesize_approx') or f.get('tbr') or 0)
+    return {
+        'format': f"{source['format_id']}/bestaudio/best",
+        'path': 'copy',
+        'source': {'format_id': source['format_id'], 'acodec': source.get('acodec'), 'abr': audio_bitrate(source)},
+        'stream': source,
+    }
+
+
+def audio_processing_path(info, codec):
+    """'copy' or 'transcode': what FFmpegExtractAudio did with a downloaded info dict, None if the codec is unknown"""
+    if not has_audio(info):
+        return None
+    return 'copy' if copyable_audio(info, codec) else 'transcode'
+
+
+# Codecs each container holds natively: (video acodec prefixes, audio acodec prefixes).
+# mkv holds anything.
+CONTAINER_CODECS = {
+    'mp4': (('avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'h265', 'av01'), ('mp4a', 'aac', 'mp3')),
+    'webm': (('vp9', 'vp09', 'vp8', 'av01'), ('opus', 'vorbis')),
+    'mkv': None,
+}
+
+HEIGHT_RE = re.compile(r'height<=(\d+)')
+
+
+def selector_max_height(selector):
+    """The height cap of a RESOLUTION_MAP selector, or None for 'best'"""
+    match = HEIGHT_RE.search(selector)
+    return int(match.group(1)) if match else None
+
+
+def has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none')
+
+
+def fits_container(fmt, container, kind):
+    """Whether fmt's video ('v') or audio ('a') codec goes into container without conversion"""
+    codecs = CONTAINER_CODECS[container]
+    if codecs is None:
+        return True
+    codec = (fmt.get('vcodec' if kind == 'v' else 'acodec') or '').lower()
+    return any(codec.startswith(prefix) for prefix in codecs[0 if kind == 'v' else 1])
+
+
+def estimate_size(formats, duration=None):
+    """Approximate bytes of the given formats, or None if any of them can't be estimated"""
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = fmt['tbr'] * 1000 / 8 * duration
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+def _best(formats, key):
+    return max(formats, key=lambda f: (key(f) or 0, f.get('tbr') or 0), default=None)
+
+
+def _plan_at_height(video_only, audio_only, muxed, height, container):
+    """Best no-conversion option for container at exactly height, as a list of formats"""
+    fitting_muxed = [f for f in muxed if f.get('height') == height
+                     and fits_container(f, container, 'v') and fits_container(f, container, 'a')]
+    video = _best([f for f in video_only if f.get('height') == height and fits_container(f, container, 'v')],
+                  lambda f: f.get('tbr'))
+    audio = _best([f for f in audio_only if fits_container(f, container, 'a')], audio_bitrate)
+    if video and audio:
+        pair = [video, audio]
+        # A single progressive file needs no ffmpeg at all; use it when it's as good as the pair
+        single = _best(fitting_muxed, lambda f: f.get('tbr'))
+        if single and (single.get('tbr') or 0) >= sum(f.get('tbr') or 0 for f in pair):
+            return [single]
+        return pair
+    single = _best(fitting_muxed, lambda f: f.get('tbr'))
+    return [single] if single else None
+
+
+def plan_video(formats, max_height=None, containers=('mp4', 'webm', 'mkv'), duration=None):
+    """Choose streams and an output container so merging is a stream copy.
+
+    Looks at the highest height available under max_height and takes the first
+    container in containers that holds a stream pair (or a single progressive
+    stream) of that height without conversion. With containers=('mp4',) lower
+    heights are tried too. Returns None when the formats don't report codecs
+    and heights; otherwise {'streams', 'format', 'container', 'height',
+    'vcodec', 'acodec', 'size', 'work'} where work is 'none' (one file, no ffmpeg) or
+    'copy' (ffmpeg merges by stream copy).
+    """
+    formats = [f for f in formats or [] if f.get('format_id') and f.get('protocol') != 'mhtml']
+    video_formats = [f for f in formats if has_video(f) and f.get('height')
+                     and (max_height is None or f['height'] <= max_height)]
+    if not video_formats:
+        return None
+    video_only = [f for f in video_formats if not has_audio(f)]
+    muxed = [f for f in video_formats if has_audio(f)]
+    audio_only = [f for f in formats if is_audio_only(f)]
+
+    heights = sorted({f['height'] for f in video_formats}, reverse=True)
+    if len(containers) > 1:
+        heights = heights[:1]
+    for height in heights:
+        for container in containers:
+            chosen = _plan_at_height(video_only, audio_only, muxed, height, container)
+            if chosen:
+                return {
+                    'streams': chosen,
+                    'format': '+'.join(f['format_id'] for f in chosen),
+                    'container': container,
+                    'height': height,
+                    'vcodec': chosen[0].get('vcodec'),
+                    'acodec': chosen[-1].get('acodec'),
+                    'size': estimate_size(chosen, duration),
+                    'work': 'none' if len(chosen) == 1 else 'copy',
+                }
+    return None
+
+
+def is_audio_selector(selector):
+    """Whether selector downloads one audio stream (audio_selector(), plan_audio()) rather than video"""
+    return '+' not in selector and any(part.startswith('bestaudio') for part in selector.split('/'))
+
+
+def estimate_download_size(info, selector, evaluator=None):
+    """Approximate bytes a download of info with selector transfers, or None.
+
+    Uses the pinned format ids of a planned selector ('137+140/...'), or the
+    streams evaluator resolves selector to. Without those, an audio selector
+    is estimated from the best audio-only stream (or the audio bitrate over the
+    duration), and a video selector from the formats yt-dlp picked by default
+    during extraction, which are the largest ones.
+    """
+    formats, duration = info.get('formats') or [], info.get('duration')
+    by_id = {f.get('format_id'): f for f in formats}
+    pinned = selector.split('/', 1)[0].split('+')
+    if all(format_id in by_id for format_id in pinned):
+        return estimate_size([by_id[format_id] for format_id in pinned], duration)
+    streams = evaluator.select(selector, formats) if evaluator else None
+    if streams:
+        return estimate_size(streams, duration)
+    requested = info.get('requested_formats') or []
+    if is_audio_selector(selector):
+        audio = _best([f for f in formats if is_audio_only(f)], audio_bitrate)
+        if audio and estimate_size([audio], duration):
+            return estimate_size([audio], duration)
+        abr = info.get('abr') or next((audio_bitrate(f) for f in requested if is_audio_only(f)), None)
+        return int(abr * 1000 / 8 * duration) if abr and duration else None
+    return estimate_size(requested or [info], duration)
+
+
+# Nominal bitrate of 16-bit 44.1 kHz stereo PCM, what a transcode to wav produces
+WAV_KBPS = 1411
+
+
+class SelectorEvaluator:
+    """Resolves yt-dlp format selectors against a formats list locally, the way a download would.
+
+    Uses yt-dlp's own selector parser and matcher on an idle YoutubeDL, so
+    no network is involved; parsed selectors are kept for reuse.
+    """
+
+    def __init__(self):
+        self._ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+        self._selectors = {}
+        self._lock = threading.Lock()
+
+    def select(self, selector, formats):
+        """The formats a download with selector would fetch (one, or a video+audio pair), or None if none match"""
+        with self._lock:
+            compiled = self._selectors.get(selector)
+            if compiled is None:
+                compiled = self._selectors[selector] = self._ydl.build_format_selector(selector)
+        formats = [f for f in formats or [] if f.get('format_id') and f.get('ext')]
+        if not formats:
+            return None
+        chosen = self._ydl._select_formats(formats, compiled)
+        if not chosen:
+            return None
+        return list(chosen[0].get('requested_formats') or (chosen[0],))
+
+
+def stream_kbps(streams, size=None, duration=None):
+    """Total bitrate of streams in kbps, derived from size and duration when the site doesn't say"""
+    if all(f.get('tbr') for f in streams):
+        return sum(f['tbr'] for f in streams)
+    if size and duration:
+        return size * 8 / duration / 1000
+    return None
+
+
+def preview_video(formats, selector, containers, duration=None, evaluator=None):
+    """What a resolution tier would download, without touching the network.
+
+    The streams are plan_video()'s when it has a plan, otherwise whatever
+    selector resolves to with evaluator. Returns {'plan', 'height', 'vcodec',
+    'size', 'kbps'}, or None when nothing matches and the tier can't be
+    downloaded.
+    """
+    plan = plan_video(formats, selector_max_height(selector), containers, duration)
+    if plan:
+        streams = plan['streams']
+    else:
+        streams = evaluator.select(selector, formats) if evaluator else None
+    if not streams:
+        return None
+    video = next((f for f in streams if has_video(f)), streams[0])
+    size = estimate_size(streams, duration)
+    return {
+        'plan': plan,
+        'height': video.get('height'),
+        'vcodec': video.get('vcodec') if has_video(video) else None,
+        'size': size,
+        'kbps': stream_kbps(streams, size, duration),
+    }
+
+
+def preview_audio(formats, codec, kbps, duration=None):
+    """plan_audio() plus the output's bitrate and approximate size ('kbps', 'size')"""
+    plan = plan_audio(formats, codec, kbps)
+    if plan['path'] == 'copy':
+        size = estimate_size([plan['stream']], duration)
+        out_kbps = plan['source']['abr']
+    else:
+        # A transcode comes out at the target bitrate (wav is uncompressed)
+        out_kbps = WAV_KBPS if codec == 'wav' else float(kbps)
+        size = int(out_kbps * 1000 / 8 * duration) if duration else None
+    return dict(plan, kbps=out_kbps, size=size)
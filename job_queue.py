@@ -0,0 +1,396 @@
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import QUEUED, RUNNING, DONE, ERROR, CANCELLED, FINISHED_STATES, Job, execute
+
+logger = logging.getLogger("UniversalDownloader")
+
+COLUMNS = (
+    'id', 'job_key', 'task', 'args', 'platform', 'label', 'state', 'progress', 'status', 'result', 'error',
+    'created', 'started', 'finished', 'owner', 'lease_expires', 'attempts', 'requesters', 'cancel',
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        job_key TEXT,
+        task TEXT NOT NULL,
+        args TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        label TEXT,
+        state TEXT NOT NULL,
+        progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT '{}',
+        result TEXT,
+        error TEXT,
+        created DOUBLE PRECISION NOT NULL,
+        started DOUBLE PRECISION,
+        finished DOUBLE PRECISION,
+        owner TEXT,
+        lease_expires DOUBLE PRECISION,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        requesters INTEGER NOT NULL DEFAULT 1,
+        cancel INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created)",
+    # At most one live job per key, so concurrent submits from several processes coalesce
+    "CREATE UNIQUE INDEX IF NOT EXISTS jobs_live_key ON jobs (job_key) "
+    "WHERE state IN ('queued', 'running') AND cancel = 0",
+)
+
+# Seconds between deletions of finished jobs older than the retention
+PURGE_INTERVAL = 60
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Database:
+    """One autocommit connection per thread to SQLite (a file, e.g. on a shared volume) or PostgreSQL.
+
+    url is 'sqlite:///relative.db', 'sqlite:////absolute.db', a bare path, or
+    'postgresql://...' (needs psycopg). Statements use '?' placeholders.
+    """
+
+    def __init__(self, url):
+        self._local = threading.local()
+        if url.startswith(('postgres://', 'postgresql://')):
+            try:
+                import psycopg
+            except ImportError:
+                raise RuntimeError("A PostgreSQL job queue needs psycopg (pip install psycopg)")
+            self._connect = lambda: psycopg.connect(url, autocommit=True)
+            self.integrity_error = psycopg.IntegrityError
+            self.placeholder = '%s'
+            self.backend = 'postgresql'
+        else:
+            path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # The default rollback journal, unlike WAL, also locks correctly on network file systems
+            self._connect = lambda: sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            self.integrity_error = sqlite3.IntegrityError
+            self.placeholder = '?'
+            self.backend = 'sqlite'
+
+    def execute(self, sql, params=()):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        if self.placeholder != '?':
+            sql = sql.replace('?', self.placeholder)
+        return connection.execute(sql, params)
+
+    def rows(self, sql, params=()):
+        return self.execute(sql, params).fetchall()
+
+
+class StoredJob:
+    """A job as recorded in the shared queue; it may be running in another process"""
+
+    def __init__(self, row):
+        fields = dict(zip(COLUMNS, row))
+        self.id = fields['id']
+        self.key = fields['job_key']
+        self.platform = fields['platform']
+        self.label = fields['label']
+        self.state = fields['state']
+        self.progress = fields['progress']
+        self.status = json.loads(fields['status'] or '{}')
+        self.result = json.loads(fields['result']) if fields['result'] else None
+        self.error = fields['error']
+        self.created = fields['created']
+        self.started = fields['started']
+        self.finished = fields['finished']
+        self.owner = fields['owner']
+        self.requesters = fields['requesters']
+        self.cancel_requested = bool(fields['cancel'])
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'platform': self.platform,
+            'label': self.label,
+            'state': self.state,
+            'progress': self.progress,
+            'status': dict(self.status),
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'requesters': self.requesters,
+        }
+
+
+class SharedJobManager:
+    """JobManager whose queue lives in a database shared by several app processes.
+
+    Any process can submit, watch or cancel any job, and each one runs up to
+    max_workers of them, within per-platform limits counted across all
+    processes. A process holds a lease on every job it runs and renews it,
+    together with the job's progress, every heartbeat seconds; the job of a
+    process that died is queued again once its lease lapses, up to
+    max_attempts runs in all. Jobs name one of the registered tasks and carry
+    JSON arguments, so whichever process claims a job can run it. A process
+    with max_workers=0 only submits and watches.
+    """
+
+    def __init__(self, url, tasks, max_workers, platform_limits=None, default_platform_limit=2, retention=3600,
+                 lease=30, heartbeat=1.0, max_attempts=3, worker_id=None):
+        self.db = Database(url)
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.tasks = dict(tasks)
+        self._names = {target: name for name, target in self.tasks.items()}
+        self.max_workers = max_workers
+        self.platform_limits = platform_limits or {}
+        self.default_platform_limit = default_platform_limit
+        self.retention = retention
+        self.lease = lease
+        self.heartbeat = heartbeat
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or default_worker_id()
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="job")
+        self._local = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+        self.counters = {'submitted': 0, 'coalesced': 0, 'claimed': 0, 'recovered': 0, 'leases_lost': 0}
+        self._thread = threading.Thread(target=self._loop, name="job-queue", daemon=True)
+        self._thread.start()
+        logger.info(f"Shared job queue ({self.db.backend}) worker {self.worker_id} started")
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def submit(self, target, *args, platform='other', label='', key=None, **kwargs):
+        """Queue target(job, *args, **kwargs) and return the job id; target must be a registered task.
+
+        With a key, a queued or running job of the same key in any process is
+        joined instead and its id returned.
+        """
+        task = self._names.get(target)
+        if task is None:
+            raise ValueError(f"{getattr(target, '__name__', target)} is not a registered task")
+        payload = json.dumps({'args': args, 'kwargs': kwargs})
+        for _ in range(3):
+            if key is not None:
+                joined = self._join(key)
+                if joined:
+                    self._count('coalesced')
+                    logger.info(f"Job {joined} joined by another request: {label}")
+                    return joined
+            job_id = secrets.token_hex(8)
+            try:
+                self.db.execute(
+                    "INSERT INTO jobs (id, job_key, task, args, platform, label, state, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, key, task, payload, platform, label, QUEUED, time.time()),
+                )
+            except self.db.integrity_error:
+                # Another process queued the same key in the meantime; join that one
+                continue
+            self._count('submitted')
+            logger.info(f"Job {job_id} queued ({platform}) in the shared queue: {label}")
+            self._wake.set()
+            return job_id
+        raise RuntimeError(f"Could not queue or join a job for key {key}")
+
+    def _join(self, key):
+        joined = self.db.execute(
+            "UPDATE jobs SET requesters = requesters + 1 "
+            "WHERE job_key = ? AND state IN (?, ?) AND cancel = 0",
+            (key, QUEUED, RUNNING),
+        ).rowcount
+        if not joined:
+            return None
+        # Newest first: if the job finished in between, its result is what the caller wanted anyway
+        rows = self.db.rows("SELECT id FROM jobs WHERE job_key = ? ORDER BY created DESC LIMIT 1", (key,))
+        return rows[0][0] if rows else None
+
+    def get(self, job_id):
+        """The job: a live Job if it runs in this process, else a StoredJob, or None"""
+        with self._lock:
+            job = self._local.get(job_id)
+        if job is not None:
+            return job
+        rows = self.db.rows(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+        return StoredJob(rows[0]) if rows else None
+
+    def cancel(self, job_id):
+        """Withdraw one request for the job; the last one cancels it wherever it runs"""
+        rows = self.db.rows("SELECT state, requesters FROM jobs WHERE id = ?", (job_id,))
+        if not rows or rows[0][0] in FINISHED_STATES:
+            return False
+        if rows[0][1] > 1 and self.db.execute(
+            "UPDATE jobs SET requesters = requesters - 1 WHERE id = ? AND requesters > 1", (job_id,)
+        ).rowcount:
+            logger.info(f"Job {job_id} left by one request")
+            return True
+        self.db.execute(
+            "UPDATE jobs SET cancel = 1, state = CASE WHEN state = ? THEN ? ELSE state END, "
+            "finished = CASE WHEN state = ? THEN ? ELSE finished END WHERE id = ?",
+            (QUEUED, CANCELLED, QUEUED, time.time(), job_id),
+        )
+        with self._lock:
+            job = self._local.get(job_id)
+        if job is not None:
+            job._cancel.set()
+        # A job running elsewhere sees the flag at its owner's next heartbeat
+        return True
+
+    def _limit(self, platform):
+        return self.platform_limits.get(platform, self.default_platform_limit)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._renew()
+                self._dispatch()
+                if time.time() - self._last_purge > PURGE_INTERVAL:
+                    self._purge_finished()
+            except Exception as e:
+                logger.info(f"Shared job queue tick failed: {str(e)}")
+            self._wake.wait(self.heartbeat)
+            self._wake.clear()
+
+    def _renew(self):
+        """Extend the leases of this process's jobs, publish their progress and pick up cancellations"""
+        with self._lock:
+            jobs = list(self._local.values())
+        for job in jobs:
+            with job._lock:
+                progress, status = job.progress, json.dumps(job.status, default=str)
+            renewed = self.db.execute(
+                "UPDATE jobs SET progress = ?, status = ?, lease_expires = ? WHERE id = ? AND owner = ? AND state = ?",
+                (progress, status, time.time() + self.lease, job.id, self.worker_id, RUNNING),
+            ).rowcount
+            rows = self.db.rows("SELECT cancel, requesters FROM jobs WHERE id = ?", (job.id,))
+            if not renewed:
+                # Lapsed and claimed elsewhere (e.g. this process stalled): stop duplicating the work
+                self._count('leases_lost')
+                logger.info(f"Job {job.id} lease lost, stopping it here")
+                job._cancel.set()
+            elif rows:
+                job.requesters = rows[0][1]
+                if rows[0][0]:
+                    job._cancel.set()
+
+    def _dispatch(self):
+        with self._lock:
+            free = self.max_workers - len(self._local)
+        if free <= 0:
+            return
+        now = time.time()
+        running = dict(self.db.rows(
+            "SELECT platform, COUNT(*) FROM jobs WHERE state = ? AND lease_expires >= ? GROUP BY platform",
+            (RUNNING, now),
+        ))
+        candidates = self.db.rows(
+            "SELECT id, platform, state, attempts, cancel FROM jobs "
+            "WHERE state = ? OR (state = ? AND lease_expires < ?) ORDER BY created LIMIT ?",
+            (QUEUED, RUNNING, now, self.max_workers * 16),
+        )
+        for job_id, platform, state, attempts, cancel in candidates:
+            if free <= 0:
+                break
+            if state == RUNNING and (cancel or attempts >= self.max_attempts):
+                # Its worker died: cancelled ones end here, and repeated deaths mean the job kills workers
+                final, error = (CANCELLED, None) if cancel else (ERROR, "worker lost")
+                self.db.execute(
+                    "UPDATE jobs SET state = ?, error = ?, finished = ? WHERE id = ? AND state = ? AND lease_expires < ?",
+                    (final, error, now, job_id, RUNNING, now),
+                )
+                continue
+            if running.get(platform, 0) >= self._limit(platform):
+                continue
+            claimed = self.db.execute(
+                "UPDATE jobs SET state = ?, owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?) WHERE id = ? AND (state = ? OR (state = ? AND lease_expires < ?))",
+                (RUNNING, self.worker_id, now + self.lease, now, job_id, QUEUED, RUNNING, now),
+            ).rowcount
+            if not claimed:
+                continue
+            running[platform] = running.get(platform, 0) + 1
+            free -= 1
+            self._start(job_id, recovered=state == RUNNING)
+
+    def _start(self, job_id, recovered):
+        row = dict(zip(COLUMNS, self.db.rows(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,))[0]))
+        target = self.tasks.get(row['task'])
+        if target is None:
+            self._finish(job_id, None, ERROR, f"unknown task {row['task']}")
+            return
+        payload = json.loads(row['args'])
+        job = Job(job_id, row['platform'], row['label'], target, tuple(payload['args']), payload['kwargs'],
+                  row['job_key'])
+        job.state, job.started, job.requesters = RUNNING, row['started'], row['requesters']
+        with self._lock:
+            self._local[job_id] = job
+        self._count('recovered' if recovered else 'claimed')
+        logger.info(f"Job {job_id} {'taken over' if recovered else 'claimed'} by {self.worker_id}: {row['label']}")
+        self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        result, state, error = execute(job)
+        if state == CANCELLED and not self._owns(job.id):
+            # The lease went to another process, which carries on with the job
+            logger.info(f"Job {job.id} handed over after its lease lapsed")
+        else:
+            self._finish(job.id, result, state, error, job)
+        with self._lock:
+            self._local.pop(job.id, None)
+            job.result, job.error = result, error
+            job.state, job.finished = state, time.time()
+        logger.info(f"Job {job.id} {state} after {time.time() - job.started:.1f}s")
+        self._wake.set()
+
+    def _owns(self, job_id):
+        rows = self.db.rows("SELECT owner, state FROM jobs WHERE id = ?", (job_id,))
+        return bool(rows) and rows[0][0] == self.worker_id and rows[0][1] == RUNNING
+
+    def _finish(self, job_id, result, state, error, job=None):
+        progress, status = (job.progress, json.dumps(job.status, default=str)) if job else (0.0, '{}')
+        self.db.execute(
+            "UPDATE jobs SET state = ?, result = ?, error = ?, finished = ?, progress = ?, status = ? "
+            "WHERE id = ? AND owner = ?",
+            (state, json.dumps(result, default=str) if result is not None else None, error, time.time(),
+             1.0 if state == DONE else progress, status, job_id, self.worker_id),
+        )
+
+    def _purge_finished(self):
+        self._last_purge = time.time()
+        self.db.execute(
+            "DELETE FROM jobs WHERE state IN (?, ?, ?) AND finished < ?",
+            (*FINISHED_STATES, time.time() - self.retention),
+        )
+
+    def close(self):
+        """Stop claiming jobs; running ones finish first"""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        now = time.time()
+        states = dict(self.db.rows("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+        running = dict(self.db.rows(
+            "SELECT platform, COUNT(*) FROM jobs WHERE state = ? AND lease_expires >= ? GROUP BY platform",
+            (RUNNING, now),
+        ))
+        with self._lock:
+            stats = dict(self.counters)
+            stats['running_here'] = len(self._local)
+        return {'states': states, 'running_per_platform': running, 'pending': states.get(QUEUED, 0), **stats}
@@ -0,0 +1,213 @@
+import logging
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("UniversalDownloader")
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, ERROR, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's target when cancellation was requested"""
+
+
+class Job:
+    """A unit of background work. The target receives the job to report progress and check for cancellation"""
+
+    def __init__(self, job_id, platform, label, target, args, kwargs, key=None):
+        self.id = job_id
+        self.platform = platform
+        self.label = label
+        self.key = key
+        # Requesters sharing this job; it is only cancelled when all of them gave up
+        self.requesters = 1
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.state = QUEUED
+        self.progress = 0.0
+        self.status = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, progress=None, **status):
+        """Record progress (0..1) and arbitrary status fields such as speed or eta"""
+        with self._lock:
+            if progress is not None:
+                self.progress = min(max(progress, 0.0), 1.0)
+            self.status.update(status)
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'platform': self.platform,
+                'label': self.label,
+                'state': self.state,
+                'progress': self.progress,
+                'status': dict(self.status),
+                'result': self.result,
+                'error': self.error,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'requesters': self.requesters,
+            }
+
+
+def execute(job):
+    """Run job's target; returns (result, final state, error message)"""
+    try:
+        job.check_cancelled()
+        return job.target(job, *job.args, **job.kwargs), DONE, None
+    except JobCancelled:
+        return None, CANCELLED, None
+    except Exception as e:
+        # Libraries may wrap the JobCancelled raised from a callback in their own error
+        if job.cancel_requested:
+            return None, CANCELLED, None
+        logger.info(f"Job {job.id} failed: {str(e)}")
+        return None, ERROR, str(e)
+
+
+class JobManager:
+    """Bounded worker pool with per-platform concurrency limits.
+
+    Jobs wait in a FIFO queue and are only handed to the pool when both a worker
+    and a slot for their platform are free, so one slow platform can't occupy
+    every worker. Jobs submitted with the key of one still queued or running
+    are coalesced into it, so identical requests do the work once.
+    """
+
+    def __init__(self, max_workers, platform_limits=None, default_platform_limit=2, retention=3600):
+        self.max_workers = max_workers
+        self.platform_limits = platform_limits or {}
+        self.default_platform_limit = default_platform_limit
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._pending = deque()
+        self._running = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counters = {'submitted': 0, 'coalesced': 0}
+
+    def submit(self, target, *args, platform='other', label='', key=None, **kwargs):
+        """Queue target(job, *args, **kwargs) and return the new job id.
+
+        With a key, a queued or running job of the same key is joined instead
+        and its id returned; its progress and result are shared.
+        """
+        with self._lock:
+            shared = self._inflight.get(key) if key is not None else None
+            if shared is not None and not shared.cancel_requested:
+                shared.requesters += 1
+                self.counters['coalesced'] += 1
+                logger.info(f"Job {shared.id} joined by another request ({shared.requesters} waiting): {label}")
+                return shared.id
+            job = Job(secrets.token_hex(8), platform, label, target, args, kwargs, key)
+            self._purge_finished()
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            if key is not None:
+                self._inflight[key] = job
+            self.counters['submitted'] += 1
+        logger.info(f"Job {job.id} queued ({platform}): {label}")
+        self._dispatch()
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Withdraw one request for the job; the last one cancels it.
+
+        Queued jobs are dropped, running ones stop at their next check. A job
+        other requesters still wait for keeps running (cancel_requested stays False).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            if job.requesters > 1:
+                job.requesters -= 1
+                logger.info(f"Job {job.id} left by one request ({job.requesters} waiting)")
+                return True
+            job._cancel.set()
+            if job.state == QUEUED:
+                self._pending.remove(job)
+                self._finish(job, CANCELLED)
+        return True
+
+    def _limit(self, platform):
+        return self.platform_limits.get(platform, self.default_platform_limit)
+
+    def _dispatch(self):
+        with self._lock:
+            busy = sum(self._running.values())
+            for job in list(self._pending):
+                if busy >= self.max_workers:
+                    break
+                if self._running.get(job.platform, 0) >= self._limit(job.platform):
+                    continue
+                self._pending.remove(job)
+                self._running[job.platform] = self._running.get(job.platform, 0) + 1
+                busy += 1
+                job.state = RUNNING
+                job.started = time.time()
+                self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        result, state, error = execute(job)
+        with self._lock:
+            job.result = result
+            job.error = error
+            self._finish(job, state)
+            self._running[job.platform] -= 1
+        logger.info(f"Job {job.id} {state} after {job.finished - job.started:.1f}s")
+        self._dispatch()
+
+    def _finish(self, job, state):
+        if self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+        job.state = state
+        job.finished = time.time()
+        if state == DONE:
+            job.progress = 1.0
+
+    def _purge_finished(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values() if j.state in FINISHED_STATES and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {
+                'states': states, 'running_per_platform': dict(self._running), 'pending': len(self._pending),
+                'running_here': sum(self._running.values()), **self.counters,
+            }
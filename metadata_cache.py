@@ -0,0 +1,298 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import yt_dlp
+
+logger = logging.getLogger("UniversalDownloader")
+
+# Query parameters that never change which video a link points to
+TRACKING_PARAMS = {'si', 'feature', 'fbclid', 'gclid', 'igshid', 'igsh', 'ref', 'ref_src', 's', 'pp'}
+
+# Expiry timestamps of signed media URLs: ?expire=..., /expire/.../ (YouTube), Expires=... (CloudFront)
+EXPIRY_RE = re.compile(r'[?&/](?:expire|expires|Expires)[=/](\d{9,11})')
+
+# Download errors that mean the signed media URLs are no longer valid
+EXPIRED_URL_ERRORS = ('HTTP Error 403', 'HTTP Error 410')
+
+
+def normalize_url(url):
+    """Normalize a URL so trivially different links compare equal"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith('utm_')
+    )
+    return urlunsplit(((parts.scheme or 'https').lower(), host, parts.path.rstrip('/'), urlencode(query), ''))
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical_video_key(url):
+    """Return a stable '<extractor>:<video id>' key for a URL without network access"""
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() == 'Generic':
+            continue
+        if ie.suitable(url):
+            video_id = ie.get_temp_id(url)
+            if video_id:
+                return f"{ie.ie_key()}:{video_id}"
+            break
+    return f"url:{normalize_url(url)}"
+
+
+def info_key(info):
+    """Return the canonical key of an already extracted info dict"""
+    if info.get('extractor_key') and info.get('id'):
+        return f"{info['extractor_key']}:{info['id']}"
+    return f"url:{normalize_url(info.get('webpage_url', ''))}"
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs share its result or error"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """(fn()'s result, whether this caller ran fn)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result(), False
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, True
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class MetadataCache:
+    """Two-tier (memory LRU + disk) cache of yt-dlp info dicts with per-entry TTL"""
+
+    def __init__(self, cache_dir, max_entries=256, max_disk_entries=2000):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._puts_since_prune = 0
+        self._flights = SingleFlight()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'coalesced': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry['expires'] > now:
+                    self._memory.move_to_end(key)
+                    return entry, 'memory_hits'
+                del self._memory[key]
+                self.counters['expired'] += 1
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, 'misses'
+        if entry.get('expires', 0) <= now:
+            self._count('expired')
+            self._remove_file(key)
+            return None, 'misses'
+        self._remember(key, entry)
+        return entry, 'disk_hits'
+
+    def get(self, key):
+        """Return the cached info dict for key, or None"""
+        entry, source = self._lookup(key)
+        if entry is not None and 'alias' in entry:
+            entry, source = self._lookup(entry['alias'])
+        self._count(source)
+        return entry['info'] if entry is not None else None
+
+    def put(self, key, info, ttl):
+        """Store info under its canonical identity and alias the lookup key to it"""
+        info = yt_dlp.YoutubeDL.sanitize_info(info)
+        expires = time.time() + ttl
+        identity = info_key(info)
+        self._store(identity, {'expires': expires, 'info': info})
+        if key != identity:
+            self._store(key, {'expires': expires, 'alias': identity})
+        return info
+
+    def coalesce(self, key, extract):
+        """(info, whether this caller extracted it) after a miss on key.
+
+        extract() extracts and put()s the info; concurrent misses of one key
+        wait for a single extraction instead of each starting their own.
+        """
+        info, extracted = self._flights.do(key, extract)
+        if not extracted:
+            self._count('coalesced')
+        return info, extracted
+
+    def _store(self, key, entry):
+        self._remember(key, entry)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            # The file's mtime records its expiry so prune() never has to parse it
+            os.utime(tmp_path, (entry['expires'], entry['expires']))
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.info(f"Metadata cache disk write failed for {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        with self._lock:
+            self._puts_since_prune += 1
+            should_prune = self._puts_since_prune >= 50
+            if should_prune:
+                self._puts_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, key):
+        """Drop a key (and what it aliases) from both tiers"""
+        entry, _ = self._lookup(key)
+        keys = [key] + ([entry['alias']] if entry and 'alias' in entry else [])
+        for k in keys:
+            with self._lock:
+                self._memory.pop(k, None)
+            self._remove_file(k)
+
+    def prune(self):
+        """Remove expired disk entries and the soonest-expiring ones beyond max_disk_entries"""
+        now = time.time()
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort()
+        excess = len(files) - self.max_disk_entries
+        for i, (expires, path) in enumerate(files):
+            if i >= excess and expires > now:
+                break
+            try:
+                os.remove(path)
+                with self._lock:
+                    self.counters['evictions'] += 1
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+def media_urls_expiry(info):
+    """Earliest expiry timestamp found in the info dict's media URLs, or None if they aren't signed"""
+    expiries = []
+    for fmt in info.get('formats') or [info]:
+        for field in ('url', 'manifest_url', 'fragment_base_url'):
+            match = EXPIRY_RE.search(fmt.get(field) or '')
+            if match:
+                expiries.append(int(match.group(1)))
+    return min(expiries) if expiries else None
+
+
+class InfoReuse:
+    """Drives downloads from cached info dicts instead of extracting the page a second time.
+
+    The cached info is re-extracted only when its signed media URLs expire
+    within expiry_margin seconds, or when the download is refused with an
+    expired-URL error; fresh info replaces the cached entry.
+    """
+
+    def __init__(self, cache, expiry_margin=300):
+        self.cache = cache
+        self.expiry_margin = expiry_margin
+        self._lock = threading.Lock()
+        self.counters = {'reused': 0, 'expired': 0, 'refused': 0, 'missing': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def download(self, ydl, url, ttl):
+        """Download url with ydl and return the processed info dict"""
+        key = canonical_video_key(url)
+        info = self.cache.get(key)
+        if info is None:
+            self._count('missing')
+        elif (media_urls_expiry(info) or float('inf')) - time.time() < self.expiry_margin:
+            self._count('expired')
+            logger.info(f"Cached info for {key} has expired media URLs, re-extracting")
+        else:
+            try:
+                result = ydl.process_ie_result(yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True), download=True)
+                self._count('reused')
+                logger.info(f"Downloaded {key} from cached info. Stats: {self.stats()}")
+                return result
+            except (yt_dlp.utils.DownloadError, yt_dlp.utils.ReExtractInfo) as e:
+                if not any(marker in str(e) for marker in EXPIRED_URL_ERRORS):
+                    raise
+                self._count('refused')
+                logger.info(f"Media URLs of cached info for {key} were refused ({str(e)}), re-extracting")
+
+        fresh = self.cache.put(key, ydl.extract_info(url, download=False), ttl)
+        return ydl.process_ie_result(yt_dlp.YoutubeDL.sanitize_info(fresh, remove_private_keys=True), download=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        downloads = sum(stats.values())
+        stats['fast_path_rate'] = stats['reused'] / downloads if downloads else 0.0
+        return stats
@@ -0,0 +1,195 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger("UniversalDownloader")
+
+# Seconds, from a metadata cache hit to a long download
+LATENCY_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Bytes per second, 100 KB/s to 1 GB/s
+THROUGHPUT_BUCKETS = tuple(100 * 1024 * 2 ** i for i in range(14))
+# Bytes, 1 MB to 16 GB
+SIZE_BUCKETS = tuple(1024 ** 2 * 4 ** i for i in range(8))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in values]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; buckets are upper bounds and +Inf is implied"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def summary(self, **labels):
+        """{'count', 'sum'} of one series"""
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return {'count': series['count'], 'sum': series['sum']} if series else {'count': 0, 'sum': 0.0}
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, dict(s, counts=list(s['counts']))) for key, s in self._values.items())
+        lines = self.header()
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class _Collected(_Metric):
+    """Gauge whose samples come from collect() -> [(label values, value)] at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames, collect):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def render(self):
+        lines = self.header()
+        try:
+            samples = list(self.collect())
+        except Exception as e:
+            logger.info(f"Metrics collector {self.name} failed: {str(e)}")
+            samples = []
+        for key, value in samples:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    """Process-wide metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, labelnames, collect):
+        return self._add(_Collected(name, help, labelnames, collect))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+class Trace:
+    """Timed spans of one job, kept only when enabled.
+
+    A disabled trace costs a clock read per span and records nothing, so
+    instrumented code can always open spans.
+    """
+
+    def __init__(self, name, enabled=False, **attrs):
+        self.name = name
+        self.enabled = enabled
+        self.attrs = attrs
+        self.start = time.time()
+        self.spans = []
+
+    def add(self, name, start, end, **attrs):
+        """Record a span from wall-clock start to end"""
+        if self.enabled:
+            self.spans.append({
+                'name': name, 'start': round(start - self.start, 4), 'duration': round(end - start, 4), **attrs
+            })
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time(), **attrs)
+
+    def to_dict(self):
+        return {'name': self.name, **self.attrs, 'duration': round(time.time() - self.start, 4), 'spans': self.spans}
+
+    def log(self):
+        if self.enabled:
+            logger.info(f"Trace {json.dumps(self.to_dict(), ensure_ascii=False, default=str)}")
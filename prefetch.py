@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import DONE, FINISHED_STATES
+
+logger = logging.getLogger("UniversalDownloader")
+
+MODES = ('off', 'info', 'download')
+
+
+class SpeculativePrefetcher:
+    """Starts work on a pasted URL before the user asks for it.
+
+    In 'info' mode metadata is extracted as soon as a URL is pasted; in
+    'download' mode the default tier is then downloaded as a background job
+    too. A speculative download only starts when it is known to be at most
+    max_bytes, fewer than max_jobs are running, the job manager has idle
+    workers, and less than waste_budget bytes of speculative downloads were
+    thrown away in the last window seconds. Downloads nobody claims are
+    cancelled when the user picks something else or moves to another URL.
+    """
+
+    def __init__(self, mode, job_manager, max_bytes=200 * 1024 ** 2, max_jobs=2, waste_budget=1024 ** 3,
+                 window=3600, max_entries=256):
+        if mode not in MODES:
+            raise ValueError(f"Unknown prefetch mode: {mode}")
+        self.mode = mode
+        self.job_manager = job_manager
+        self.max_bytes = max_bytes
+        self.max_jobs = max_jobs
+        self.waste_budget = waste_budget
+        self.window = window
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+        self._entries = OrderedDict()
+        self._wasted = deque()
+        self._lock = threading.Lock()
+        self.counters = {
+            'info_started': 0, 'info_used': 0,
+            'downloads_started': 0, 'downloads_used': 0, 'downloads_cancelled': 0,
+            'skipped_size': 0, 'skipped_busy': 0, 'skipped_budget': 0,
+            'wasted_bytes': 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def prefetch(self, key, fetch_info, plan_download):
+        """Speculate on the video behind key.
+
+        fetch_info() extracts (and caches) the info dict. plan_download(info)
+        returns (artifact key, estimated size, start) for the default
+        download, or None when it's already cached; start() queues it and
+        returns the job id. Both run on a prefetch thread.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            entry = {'info': None, 'info_used': False, 'job_id': None, 'cache_key': None, 'claimed': False}
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.counters['info_started'] += 1
+        entry['info'] = self._executor.submit(self._run, key, entry, fetch_info, plan_download)
+
+    def _run(self, key, entry, fetch_info, plan_download):
+        info = fetch_info()
+        if self.mode != 'download' or entry['claimed']:
+            return
+        planned = plan_download(info)
+        if planned is None:
+            return
+        cache_key, size, start = planned
+        # Checked and registered under one lock, so concurrent speculations can't overshoot the limits
+        with self._lock:
+            if entry['claimed']:
+                return
+            reason = self._admit(size)
+            if reason:
+                self.counters[f"skipped_{reason}"] += 1
+            else:
+                entry['cache_key'] = cache_key
+                entry['job_id'] = start()
+                self.counters['downloads_started'] += 1
+        if reason:
+            logger.info(f"Speculative download of {key} skipped ({reason})")
+            return
+        logger.info(f"Speculative download of {key} started as job {entry['job_id']}")
+
+    def _admit(self, size):
+        """None if a speculative download of size bytes may start, else why not. Called with the lock held"""
+        if not size or size > self.max_bytes:
+            return 'size'
+        manager = self.job_manager.stats()
+        running = sum(
+            1 for entry in self._entries.values()
+            if entry['job_id'] and not entry['claimed'] and not self._finished(entry['job_id'])
+        )
+        cutoff = time.time() - self.window
+        while self._wasted and self._wasted[0][0] < cutoff:
+            self._wasted.popleft()
+        wasted = sum(n for _, n in self._wasted)
+        # running_per_platform spans every replica of a shared queue; max_workers is this one's
+        if running >= self.max_jobs or manager['pending'] \
+                or manager['running_here'] >= self.job_manager.max_workers - 1:
+            return 'busy'
+        if wasted + size > self.waste_budget:
+            return 'budget'
+        return None
+
+    def _finished(self, job_id):
+        job = self.job_manager.get(job_id)
+        return job is None or job.state in FINISHED_STATES
+
+    def wait_info(self, key, timeout=None):
+        """Wait for a speculative extraction of key still in flight. Returns whether one was started"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['info'] is None:
+                return False
+            if not entry['info_used']:
+                entry['info_used'] = True
+                self.counters['info_used'] += 1
+        try:
+            entry['info'].result(timeout)
+        except Exception:
+            # The user's own extraction reports the error
+            pass
+        return True
+
+    def claim(self, key, cache_key):
+        """The user asked for cache_key of the video behind key.
+
+        Returns the speculative job id when it is that download and still
+        running; a different speculative download is cancelled.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry['job_id'] or entry['claimed']:
+                return None
+            entry['claimed'] = True
+        job = self.job_manager.get(entry['job_id'])
+        if entry['cache_key'] != cache_key:
+            self._cancel(job)
+            return None
+        if job is None or job.state in FINISHED_STATES and job.state != DONE:
+            return None
+        self._count('downloads_used')
+        logger.info(f"Speculative download {job.id} used. Stats: {self.stats()}")
+        # A finished one is served from the artifact cache
+        return job.id if job.state != DONE else None
+
+    def abandon(self, key):
+        """The user moved on from key; cancel its speculative download unless claimed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry['job_id'] or entry['claimed']:
+                return
+            entry['claimed'] = True
+        self._cancel(self.job_manager.get(entry['job_id']))
+
+    def _cancel(self, job):
+        if job is None:
+            return
+        # A finished download still landed in the artifact cache, but nobody asked for it
+        if job.state not in FINISHED_STATES:
+            self.job_manager.cancel(job.id)
+            # A shared queue's jobs are snapshots taken before the cancel
+            job = self.job_manager.get(job.id) or job
+            if not job.cancel_requested:
+                logger.info(f"Speculative download {job.id} not used here, other requests share it")
+                return
+        wasted = job.snapshot()['status'].get('transferred') or 0
+        with self._lock:
+            self._wasted.append((time.time(), wasted))
+            self.counters['wasted_bytes'] += wasted
+            self.counters['downloads_cancelled'] += 1
+        logger.info(f"Speculative download {job.id} not used, {wasted} bytes wasted. Stats: {self.stats()}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['info_use_rate'] = stats['info_used'] / stats['info_started'] if stats['info_started'] else 0.0
+        stats['download_use_rate'] = (
+            stats['downloads_used'] / stats['downloads_started'] if stats['downloads_started'] else 0.0
+        )
+        return stats
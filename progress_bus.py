@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("UniversalDownloader")
+
+# Events with these statuses are never coalesced away
+TERMINAL_STATUSES = ('finished', 'error')
+
+
+class SpeedEstimator:
+    """Exponentially smoothed transfer speed and ETA computed from raw byte counts"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.speed = None
+        self._last = None
+        self._filename = None
+
+    def update(self, downloaded, total=None, filename=None, now=None):
+        """Feed the latest byte count; returns (speed bytes/s or None, eta seconds or None)"""
+        now = now if now is not None else time.monotonic()
+        if filename != self._filename or self._last is None or downloaded < self._last[1]:
+            # New file (e.g. the audio stream after the video stream): restart the baseline
+            self._filename = filename
+            self._last = (now, downloaded)
+            self.speed = None
+            return None, None
+        elapsed = now - self._last[0]
+        if elapsed > 0:
+            sample = (downloaded - self._last[1]) / elapsed
+            self.speed = sample if self.speed is None else self.alpha * sample + (1 - self.alpha) * self.speed
+            self._last = (now, downloaded)
+        eta = None
+        if self.speed and total and total >= downloaded:
+            eta = (total - downloaded) / self.speed
+        return self.speed, eta
+
+
+def ytdlp_event(d, estimator):
+    """Turn a yt-dlp progress hook dict into a bus event"""
+    downloaded = d.get('downloaded_bytes') or 0
+    total = d.get('total_bytes') or d.get('total_bytes_estimate')
+    event = {
+        'status': d['status'],
+        'filename': d.get('filename'),
+        'downloaded': downloaded,
+        'total': total,
+        'fraction': min(downloaded / total, 1.0) if total else None,
+        'speed': None,
+        'eta': None,
+        'time': time.time(),
+    }
+    if d['status'] == 'downloading':
+        event['speed'], event['eta'] = estimator.update(downloaded, total, d.get('filename'))
+    elif d['status'] == 'finished':
+        event['fraction'] = 1.0
+    return event
+
+
+class _Subscription:
+    def __init__(self, bus, topic, callback, max_rate):
+        self.bus = bus
+        self.topic = topic
+        self.callback = callback
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.last_delivery = 0.0
+        self.pending = None
+        self.coalesced = 0
+        self._delivered_seq = 0
+        self._deliver_lock = threading.Lock()
+
+    def due(self):
+        return self.last_delivery + self.min_interval
+
+    def deliver(self, event, now):
+        with self._deliver_lock:
+            # The flusher and a publisher can race; never go back to an older event
+            if event['seq'] <= self._delivered_seq:
+                return
+            self._delivered_seq = event['seq']
+            self.last_delivery = now
+            try:
+                self.callback(event)
+            except Exception as e:
+                logger.info(f"Progress subscriber failed: {str(e)}")
+
+    def unsubscribe(self):
+        self.bus.unsubscribe(self)
+
+
+class ProgressBus:
+    """Publish/subscribe hub for progress events that coalesces bursts per subscriber.
+
+    Each subscriber receives at most max_rate events per second; in-between
+    events replace each other and only the latest is delivered once the
+    subscriber is due again. Terminal events ('finished', 'error') are
+    delivered immediately. Subscribing with topic None receives every topic.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._flusher = threading.Thread(target=self._flush_loop, name="progress-bus", daemon=True)
+        self._flusher.start()
+
+    def subscribe(self, topic, callback, max_rate=None):
+        sub = _Subscription(self, topic, callback, max_rate)
+        with self._cond:
+            self._subscriptions.setdefault(topic, []).append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._cond:
+            subs = self._subscriptions.get(sub.topic, [])
+            if sub in subs:
+                subs.remove(sub)
+            if not subs:
+                self._subscriptions.pop(sub.topic, None)
+
+    def publish(self, topic, event):
+        now = time.monotonic()
+        deliveries = []
+        with self._cond:
+            self._seq += 1
+            event = dict(event, topic=topic, seq=self._seq)
+            for sub in self._subscriptions.get(topic, []) + self._subscriptions.get(None, []):
+                if event['status'] in TERMINAL_STATUSES or now >= sub.due():
+                    sub.pending = None
+                    sub.last_delivery = now
+                    deliveries.append(sub)
+                else:
+                    if sub.pending is not None:
+                        sub.coalesced += 1
+                    sub.pending = event
+                    self._cond.notify()
+        for sub in deliveries:
+            sub.deliver(event, now)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                ready, next_due = [], None
+                for subs in self._subscriptions.values():
+                    for sub in subs:
+                        if sub.pending is None:
+                            continue
+                        if now >= sub.due():
+                            ready.append((sub, sub.pending))
+                            sub.pending = None
+                            sub.last_delivery = now
+                        elif next_due is None or sub.due() < next_due:
+                            next_due = sub.due()
+                if not ready:
+                    self._cond.wait(timeout=None if next_due is None else next_due - now)
+                    continue
+            for sub, event in ready:
+                sub.deliver(event, now)
@@ -0,0 +1,257 @@
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger("UniversalDownloader")
+
+DIR_PREFIX = 'udl-job-'
+GC_INTERVAL = 600
+OWNER_FILE = '.owner'
+# Owner file content of directories kept for a later attempt; they are collected by age only
+RELEASED = 'released'
+# What downloaders leave behind when interrupted: yt-dlp's partial file and the parallel engine's chunk log
+PARTIAL_SUFFIXES = ('.part', '.chunks')
+
+
+class InsufficientSpace(Exception):
+    """The job's estimated size can never fit in scratch storage"""
+
+
+def directory_size(path):
+    """Bytes actually stored under path (sparse, preallocated files count only what was written)"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            if name == OWNER_FILE:
+                continue
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            total += min(st.st_size, st.st_blocks * 512) if hasattr(st, 'st_blocks') else st.st_size
+    return total
+
+
+def partial_mtime(path):
+    """When a partial download under path was last written, or None if it holds none"""
+    newest = None
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            if name.endswith(PARTIAL_SUFFIXES):
+                try:
+                    mtime = os.path.getmtime(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                newest = mtime if newest is None else max(newest, mtime)
+    return newest
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScratchStorage:
+    """Working directories for downloads, with space admission and orphan collection.
+
+    Jobs whose estimated size is at most ram_max_bytes go to ram_root (a tmpfs
+    such as /dev/shm) when it has room, everything else to disk_root. A job
+    needs headroom x its estimate (separate streams plus the merged output);
+    allocation waits while running jobs hold the space and raises
+    InsufficientSpace when the job could not fit even on an idle disk.
+    Directories are named after their owner and carry an owner file, so ones
+    left behind by a crashed process are removed by gc(). A directory released
+    with keep=True is handed back to the next allocation for the same owner,
+    which is how partial downloads are resumed. gc() releases the directories
+    of a crashed process the same way while their partial files are younger
+    than resume_ttl, so a restarted process resumes them too.
+    """
+
+    def __init__(self, disk_root, ram_root=None, ram_max_bytes=512 * 1024 ** 2, reserve_bytes=1024 ** 3,
+                 headroom=2.5, orphan_age=6 * 3600, resume_ttl=3600):
+        self.disk_root = disk_root
+        self.ram_root = ram_root if ram_root and os.path.isdir(ram_root) else None
+        self.ram_max_bytes = ram_max_bytes
+        self.reserve_bytes = reserve_bytes
+        self.headroom = headroom
+        self.orphan_age = orphan_age
+        self.resume_ttl = resume_ttl
+        self._active = {}
+        self._cond = threading.Condition()
+        self.counters = {'ram': 0, 'disk': 0, 'waited': 0, 'rejected': 0, 'orphans_removed': 0, 'orphans_kept': 0}
+        self._last_gc = 0.0
+        os.makedirs(disk_root, exist_ok=True)
+        if ram_root and not self.ram_root:
+            logger.info(f"Scratch RAM directory {ram_root} not found, using disk only")
+        self.gc()
+
+    def _roots(self):
+        return [root for root in (self.ram_root, self.disk_root) if root]
+
+    def _outstanding(self, root):
+        """Space still to be written by active jobs on root"""
+        return sum(
+            max(entry['need'] - directory_size(path), 0)
+            for path, entry in self._active.items() if entry['root'] == root
+        )
+
+    def _available(self, root):
+        reserve = 0 if root == self.ram_root else self.reserve_bytes
+        return shutil.disk_usage(root).free - reserve - self._outstanding(root)
+
+    def _capacity(self, root):
+        """What root could offer if every active job on it finished"""
+        reserve = 0 if root == self.ram_root else self.reserve_bytes
+        used_by_jobs = sum(directory_size(path) for path, entry in self._active.items() if entry['root'] == root)
+        return shutil.disk_usage(root).free + used_by_jobs - reserve
+
+    def need(self, estimated_size):
+        return int(estimated_size * self.headroom) if estimated_size else 0
+
+    def check(self, estimated_size):
+        """Raise InsufficientSpace if a job of this size could never be admitted"""
+        need = self.need(estimated_size)
+        with self._cond:
+            if need and need > self._capacity(self.disk_root):
+                self.counters['rejected'] += 1
+                raise InsufficientSpace(
+                    f"need {need} bytes, disk can offer {max(self._capacity(self.disk_root), 0)}"
+                )
+
+    def _choose_root(self, estimated_size, need):
+        if self.ram_root and estimated_size and estimated_size <= self.ram_max_bytes \
+                and self._available(self.ram_root) >= need:
+            return self.ram_root
+        if self._available(self.disk_root) >= need:
+            return self.disk_root
+        return None
+
+    def allocate(self, owner, estimated_size=None, on_wait=None, poll_interval=1.0):
+        """Create and return the working directory for owner (a job id).
+
+        While space is held by other jobs this blocks, calling on_wait() every
+        poll_interval seconds; on_wait may raise to give up (e.g. on cancel).
+        """
+        if time.time() - self._last_gc > GC_INTERVAL:
+            self.gc()
+        self.check(estimated_size)
+        need = self.need(estimated_size)
+        waited = False
+        with self._cond:
+            while True:
+                kept = self._kept_dir(owner)
+                if kept:
+                    root = os.path.dirname(kept)
+                    break
+                root = self._choose_root(estimated_size, need)
+                if root:
+                    break
+                if not waited:
+                    waited = True
+                    self.counters['waited'] += 1
+                    logger.info(f"Scratch for {owner} waits for {need} bytes of free space")
+                if on_wait:
+                    on_wait()
+                self._cond.wait(poll_interval)
+            path = os.path.join(root, f"{DIR_PREFIX}{owner}")
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, OWNER_FILE), 'w') as f:
+                f.write(str(os.getpid()))
+            self._active[path] = {'root': root, 'need': need}
+            self.counters['ram' if root == self.ram_root else 'disk'] += 1
+        return path
+
+    def _kept_dir(self, owner):
+        """A directory released with keep=True for owner, if one is left"""
+        for root in self._roots():
+            path = os.path.join(root, f"{DIR_PREFIX}{owner}")
+            if path in self._active:
+                raise FileExistsError(f"Scratch directory for {owner} is in use")
+            if os.path.isdir(path):
+                return path
+        return None
+
+    def release(self, path, keep=False):
+        """Stop accounting for path; unless keep, delete it. Kept directories are collected by gc() later"""
+        if keep:
+            try:
+                with open(os.path.join(path, OWNER_FILE), 'w') as f:
+                    f.write(RELEASED)
+            except OSError:
+                pass
+        with self._cond:
+            self._active.pop(path, None)
+            self._cond.notify_all()
+        if not keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _keep_for_resume(self, path, now):
+        """Release a dead process's directory if its partial files are recent enough to resume"""
+        mtime = partial_mtime(path)
+        if mtime is None or now - mtime > self.resume_ttl:
+            return False
+        owner_file = os.path.join(path, OWNER_FILE)
+        try:
+            with open(owner_file, 'w') as f:
+                f.write(RELEASED)
+            # Aged from the last write, not from now
+            os.utime(owner_file, (mtime, mtime))
+        except OSError:
+            return False
+        return True
+
+    def gc(self):
+        """Remove directories of dead processes, and released or abandoned ones older than orphan_age.
+
+        A dead process's directory with recent partial files is released instead of removed.
+        """
+        now = self._last_gc = time.time()
+        removed = kept = 0
+        for root in self._roots():
+            try:
+                names = os.listdir(root)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                if not name.startswith(DIR_PREFIX) or not os.path.isdir(path):
+                    continue
+                with self._cond:
+                    if path in self._active:
+                        continue
+                try:
+                    with open(os.path.join(path, OWNER_FILE)) as f:
+                        owner = f.read().strip()
+                    age = now - os.path.getmtime(os.path.join(path, OWNER_FILE))
+                    pid = None if owner == RELEASED else int(owner or 0)
+                except (OSError, ValueError):
+                    # Not one of ours (or being created right now)
+                    continue
+                dead = pid is not None and pid != os.getpid() and not pid_alive(pid)
+                if dead and self._keep_for_resume(path, now):
+                    kept += 1
+                elif dead or age > self.orphan_age:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        if removed or kept:
+            logger.info(f"Scratch GC removed {removed} orphaned directories, kept {kept} with partial downloads")
+            with self._cond:
+                self.counters['orphans_removed'] += removed
+                self.counters['orphans_kept'] += kept
+        return removed
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats['active'] = len(self._active)
+        stats['disk_free'] = shutil.disk_usage(self.disk_root).free
+        if self.ram_root:
+            stats['ram_free'] = shutil.disk_usage(self.ram_root).free
+        return stats
@@ -0,0 +1,128 @@
+import logging
+import sys
+import threading
+
+logger = logging.getLogger("UniversalDownloader")
+
+# Format fields read by the UI and format_planner; urls, headers, fragments etc. stay in the metadata cache
+FORMAT_FIELDS = (
+    'format_id', 'ext', 'protocol', 'vcodec', 'acodec', 'height', 'tbr', 'abr', 'filesize', 'filesize_approx',
+)
+
+
+def trim_format(fmt):
+    return {name: fmt[name] for name in FORMAT_FIELDS if fmt.get(name) is not None}
+
+
+def trim_formats(formats):
+    return [trim_format(f) for f in formats or [] if f.get('format_id')]
+
+
+class MediaSummary:
+    """What a session keeps of an extracted video: the fields the UI reads and a trimmed format table.
+
+    The full info dict stays in the shared metadata cache under key. get()
+    mirrors dict.get so code written against info dicts (planners,
+    artifact_key) accepts a summary too. formats may be spilled (set to None)
+    to fit the session budget and reloaded from the cache when needed.
+    """
+
+    __slots__ = (
+        'key', 'extractor_key', 'id', 'webpage_url', 'title', 'uploader', 'duration', 'view_count',
+        'like_count', 'thumbnail', 'subtitle_langs', 'caption_langs', 'formats', 'requested_formats',
+    )
+
+    def __init__(self, key, info):
+        self.key = key
+        for name in ('extractor_key', 'id', 'webpage_url', 'title', 'uploader', 'duration', 'view_count',
+                     'like_count', 'thumbnail'):
+            setattr(self, name, info.get(name))
+        self.subtitle_langs = tuple(info.get('subtitles') or ())
+        self.caption_langs = tuple(info.get('automatic_captions') or ())
+        self.formats = trim_formats(info.get('formats'))
+        # What yt-dlp picks by default; estimate_download_size() falls back to it
+        self.requested_formats = trim_formats(info.get('requested_formats')) or None
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None) if name in self.__slots__ else None
+        return default if value is None else value
+
+    def spill_formats(self):
+        """Drop the format table; returns the bytes freed"""
+        freed = approx_size(self.formats) if self.formats else 0
+        self.formats = None
+        return freed
+
+
+def approx_size(obj, seen=None):
+    """Deep size in bytes of plain containers, strings, numbers and slotted objects"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(approx_size(getattr(obj, name, None), seen) for name in obj.__slots__)
+    return size
+
+
+class SessionBudget:
+    """Keeps what each session holds in memory under max_bytes.
+
+    Over budget, the oldest history entries go first, then disposable keys
+    (results the session can rebuild), then the current video's format table
+    (it can be reloaded from the shared cache).
+    History is capped at history_max entries regardless.
+    """
+
+    def __init__(self, max_bytes, history_max=50):
+        self.max_bytes = max_bytes
+        self.history_max = history_max
+        self._lock = threading.Lock()
+        self.counters = {'checks': 0, 'over_budget': 0, 'history_evicted': 0, 'disposed': 0, 'formats_spilled': 0}
+        self._largest = 0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def enforce(self, state, keys, disposable=()):
+        """Evict from state (a session_state mapping) until keys and disposable fit. Returns their size"""
+        self._count('checks')
+        history = state.get('download_history')
+        if history and len(history) > self.history_max:
+            excess = len(history) - self.history_max
+            del history[:excess]
+            self._count('history_evicted', excess)
+        size = sum(approx_size(state.get(key)) for key in keys + disposable)
+        if size > self.max_bytes:
+            self._count('over_budget')
+        while size > self.max_bytes and history:
+            size -= approx_size(history.pop(0))
+            self._count('history_evicted')
+        for key in disposable:
+            if size <= self.max_bytes:
+                break
+            if state.get(key) is not None:
+                size -= approx_size(state[key])
+                state[key] = None
+                self._count('disposed')
+        summary = state.get('video_info')
+        if size > self.max_bytes and summary is not None and summary.formats:
+            size -= summary.spill_formats()
+            self._count('formats_spilled')
+        with self._lock:
+            self._largest = max(self._largest, size)
+        if size > self.max_bytes:
+            logger.info(f"Session state of {size} bytes is still over the {self.max_bytes} byte budget")
+        return size
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['largest_session'] = self._largest
+        return stats
@@ -0,0 +1,143 @@
+import html
+import io
+import logging
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import unique_arcname
+
+logger = logging.getLogger("UniversalDownloader")
+
+# Output formats and their mime types
+FORMATS = {'srt': 'application/x-subrip', 'vtt': 'text/vtt', 'txt': 'text/plain'}
+
+# Track extensions that can be parsed, most preferred first
+SOURCE_EXTS = ('vtt', 'srt')
+
+TIMESTAMP_RE = re.compile(r'^(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{1,3})$')
+TAG_RE = re.compile(r'<[^>]*>')
+
+
+def parse_timestamp(text):
+    match = TIMESTAMP_RE.match(text.strip())
+    if not match:
+        raise ValueError(f"bad timestamp {text!r}")
+    hours, minutes, seconds, millis = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis.ljust(3, '0')) / 1000
+
+
+def format_timestamp(seconds, decimal=','):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{decimal}{millis:03d}"
+
+
+def parse_cues(text):
+    """[(start, end, [lines])] from WebVTT or SRT text, with styling tags and header blocks dropped"""
+    cues = []
+    for block in re.split(r'\n{2,}', text.replace('\r\n', '\n').replace('\r', '\n')):
+        lines = block.strip('\n').split('\n')
+        timing = next((i for i, line in enumerate(lines) if '-->' in line), None)
+        if timing is None:
+            # WEBVTT header, NOTE, STYLE and REGION blocks
+            continue
+        start, _, rest = lines[timing].partition('-->')
+        try:
+            # VTT cue settings ("align:start position:0%") follow the end time
+            cue = (parse_timestamp(start), parse_timestamp(rest.split()[0]))
+        except (ValueError, IndexError):
+            continue
+        body = [html.unescape(TAG_RE.sub('', line)).strip() for line in lines[timing + 1:]]
+        cues.append(cue + ([line for line in body if line],))
+    return cues
+
+
+def collapse_rolling(cues):
+    """Drop lines repeated from the previous cue, as in auto-generated captions that scroll line by line"""
+    collapsed = []
+    previous = []
+    for start, end, lines in cues:
+        fresh = [line for line in lines if line not in previous]
+        previous = lines
+        if fresh:
+            collapsed.append((start, end, fresh))
+    return collapsed
+
+
+def to_srt(cues):
+    return ''.join(
+        f"{i}\n{format_timestamp(start)} --> {format_timestamp(end)}\n" + '\n'.join(lines) + '\n\n'
+        for i, (start, end, lines) in enumerate(cues, 1)
+    )
+
+
+def to_vtt(cues):
+    return 'WEBVTT\n\n' + ''.join(
+        f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n" + '\n'.join(lines) + '\n\n'
+        for start, end, lines in cues
+    )
+
+
+def to_text(cues):
+    return '\n'.join(line for _, _, lines in cues for line in lines) + '\n'
+
+
+WRITERS = {'srt': to_srt, 'vtt': to_vtt, 'txt': to_text}
+
+
+def convert(text, fmt, rolling=False):
+    """Convert VTT or SRT subtitle text to fmt ('srt', 'vtt' or 'txt') in-process"""
+    cues = parse_cues(text)
+    if rolling:
+        cues = collapse_rolling(cues)
+    return WRITERS[fmt](cues)
+
+
+def pick_track(tracks):
+    """The track of a language (info['subtitles'][lang]) in the most preferred parseable format, or None"""
+    by_ext = {track.get('ext'): track for track in tracks or [] if track.get('url')}
+    return next((by_ext[ext] for ext in SOURCE_EXTS if ext in by_ext), None)
+
+
+def fetch_subtitles(requests, fetch, fmt, max_workers=4):
+    """Download and convert subtitle tracks in parallel.
+
+    requests is [(name, track, automatic)] and fetch(url) returns the raw
+    bytes. Returns ([(name, converted text)], [errors]) in request order.
+    """
+    def one(request):
+        name, track, automatic = request
+        return name, convert(fetch(track['url']).decode('utf-8-sig', 'replace'), fmt, rolling=automatic)
+
+    start = time.time()
+    files, errors = [], []
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(requests)), 1),
+                            thread_name_prefix="subtitles") as executor:
+        futures = [(request[0], executor.submit(one, request)) for request in requests]
+        for name, future in futures:
+            try:
+                files.append(future.result())
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+    size = sum(len(text.encode('utf-8')) for _, text in files)
+    logger.info(
+        f"Fetched {len(files)} subtitle tracks as {fmt} ({size} bytes) in {(time.time() - start) * 1000:.0f} ms, "
+        f"{len(errors)} failed"
+    )
+    return files, errors
+
+
+def bundle(files, errors=None):
+    """ZIP bytes of [(arcname, text)] plus errors.txt when there were errors"""
+    out = io.BytesIO()
+    used = set()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for arcname, text in files:
+            zf.writestr(unique_arcname(arcname, used), text)
+        if errors:
+            zf.writestr(unique_arcname('errors.txt', used), '\n'.join(errors) + '\n')
+    return out.getvalue()
@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        media = self.server.media
+        data = media.files.get(self.path)
+        header = self.headers.get('Range')
+        with media.lock:
+            media.requests.append((self.path, header))
+        if data is None:
+            self.send_error(404)
+            return
+        match = re.match(r'bytes=(\d+)-(\d*)$', header or '') if media.ranges else None
+        if not match:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2)), len(data) - 1) if match.group(2) else len(data) - 1
+        body = data[start:end + 1]
+        with media.lock:
+            # The first response to each range in break_ranges stops halfway, like a dropped connection
+            broken = (start, end) in media.break_ranges and (start, end) not in media.broken
+            if broken:
+                media.broken.add((start, end))
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if broken:
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class MediaServer:
+    """Files served from memory on 127.0.0.1, recording every request's Range header"""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.ranges = True
+        self.break_ranges = set()
+        self.broken = set()
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _MediaHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.media = self
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def add(self, path, data):
+        self.files[path] = data
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}{path}"
+
+    def ranges_requested(self, path):
+        return [header for requested, header in self.requests if requested == path and header]
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def media_server():
+    server = MediaServer()
+    yield server
+    server.close()
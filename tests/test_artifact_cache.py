@@ -0,0 +1,80 @@
+import os
+import threading
+
+from artifact_cache import ArtifactCache
+
+
+def source(tmp_path, name, size, fill=b'x'):
+    path = tmp_path / name
+    path.write_bytes(fill * size)
+    return str(path)
+
+
+def test_replacing_a_key_frees_its_old_file(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 100)
+    cache.store('aa1', source(tmp_path, 'old.mp4', 60))
+    cache.store('bb2', source(tmp_path, 'other.mp4', 30))
+
+    path = cache.store('aa1', source(tmp_path, 'new.mkv', 60, b'y'))
+    assert cache.stats()['evictions'] == 0
+    assert cache.total_bytes() == 90
+    assert sorted(os.listdir(os.path.dirname(path))) == ['meta.json', 'new.mkv']
+    assert cache.lookup('aa1') == path and cache.lookup('bb2')
+
+
+def test_concurrent_stores_stay_within_the_cap(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 100)
+    sources = [source(tmp_path, f"{n}.mp4", 40) for n in range(5)]
+    # Stores copy only once all of them have made room (or found none)
+    attempts, ready = [], threading.Event()
+    make_room, write = cache._make_room, cache._write
+
+    def counted_make_room(incoming):
+        fits = make_room(incoming)
+        attempts.append(fits)
+        if len(attempts) == len(sources):
+            ready.set()
+        return fits
+
+    def slow_write(*args):
+        ready.wait(2)
+        return write(*args)
+
+    monkeypatch.setattr(cache, '_make_room', counted_make_room)
+    monkeypatch.setattr(cache, '_write', slow_write)
+    threads = [threading.Thread(target=cache.store, args=(f"k{n}", path)) for n, path in enumerate(sources)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert attempts.count(True) == 2
+    assert cache.total_bytes() == 80
+    assert cache.stats()['entries'] == 2
+    assert cache._reserved == 0
+
+
+def test_corrupted_file_is_dropped_on_its_first_hit(tmp_path):
+    root = str(tmp_path / 'cache')
+    path = ArtifactCache(root, 100).store('aa1', source(tmp_path, 'a.mp4', 50))
+    with open(path, 'r+b') as f:
+        f.write(b'z')
+
+    cache = ArtifactCache(root, 100)
+    assert cache.lookup('aa1') is None
+    assert cache.stats()['corrupt'] == 1
+    assert not os.path.exists(path)
+
+
+def test_shared_cache_rescans_at_most_every_interval(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 1000, shared=True)
+    scans = []
+    load = cache._load_index
+    monkeypatch.setattr(cache, '_load_index', lambda: scans.append(1) or load())
+    for n in range(3):
+        cache.store(f"k{n}", source(tmp_path, f"{n}.mp4", 10))
+    assert not scans
+
+    cache._scanned -= 60
+    cache.store('k3', source(tmp_path, '3.mp4', 10))
+    assert len(scans) == 1
@@ -0,0 +1,49 @@
+import pytest
+
+from core import clip_opts, parse_clip
+
+
+def test_parse_clip_reads_seconds_and_timestamps():
+    assert parse_clip('1:00', '1:30.5') == {'start': 60.0, 'end': 90.5, 'accurate': False}
+    assert parse_clip(5, 20, accurate=True) == {'start': 5.0, 'end': 20.0, 'accurate': True}
+    assert parse_clip(' 0:01:05 ', '') == {'start': 65.0, 'end': None, 'accurate': False}
+
+
+def test_parse_clip_returns_floats():
+    clip = parse_clip('10', 20)
+    assert type(clip['start']) is float and type(clip['end']) is float
+    # The same range typed either way makes the same artifact key
+    assert parse_clip('0:10', '0:20') == parse_clip(10.0, 20.0) == clip
+
+
+def test_whole_video_is_no_clip():
+    assert parse_clip() is None
+    assert parse_clip('', '') is None
+    assert parse_clip(0, 600, duration=600) is None
+
+
+def test_end_past_the_video_means_to_the_end():
+    assert parse_clip(30, 900, duration=600) == {'start': 30.0, 'end': None, 'accurate': False}
+
+
+@pytest.mark.parametrize('start, end, duration', [
+    ('soon', None, None),
+    (-5, None, None),
+    (0, 'later', None),
+    (30, 30.5, None),
+    (40, 20, None),
+    (600, None, 600),
+])
+def test_parse_clip_rejects_ranges_that_cant_be_cut(start, end, duration):
+    with pytest.raises(ValueError):
+        parse_clip(start, end, duration=duration)
+
+
+def test_clip_opts():
+    assert clip_opts(None) == {}
+    opts = clip_opts(parse_clip('1:00', '1:30', accurate=True))
+    assert opts['force_keyframes_at_cuts'] is True
+    assert list(opts['download_ranges']({'duration': 600}, None)) == [{'start_time': 60.0, 'end_time': 90.0}]
+    opts = clip_opts(parse_clip(90))
+    assert opts['force_keyframes_at_cuts'] is False
+    assert list(opts['download_ranges']({'duration': 600}, None)) == [{'start_time': 90.0, 'end_time': float('inf')}]
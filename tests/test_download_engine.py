@@ -0,0 +1,112 @@
+import os
+
+from download_engine import PARALLEL_CONNECTIONS, EngineYoutubeDL, ThroughputMeter, engine_options, is_transient
+
+CHUNK = 128 * 1024
+
+
+def download(url, path, connections=4, chunk_size=CHUNK, **params):
+    ydl = EngineYoutubeDL({
+        'quiet': True, 'noprogress': True,
+        **engine_options('parallel', connections=connections, chunk_size=chunk_size), **params,
+    })
+    with ydl:
+        return ydl.dl(path, {'id': 'x', 'title': 'x', 'ext': 'bin', 'url': url, 'protocol': 'http'})
+
+
+def test_engine_options():
+    assert PARALLEL_CONNECTIONS not in engine_options('native', connections=4)
+    assert PARALLEL_CONNECTIONS not in engine_options('parallel', connections=1)
+    assert engine_options('parallel', fragments=3, connections=4, chunk_size=CHUNK) == {
+        'concurrent_fragment_downloads': 3, 'parallel_connections': 4, 'parallel_chunk_size': CHUNK,
+    }
+
+
+def test_parallel_download_fetches_each_chunk_once(media_server, tmp_path):
+    data = os.urandom(CHUNK * 7 + 1000)
+    url = media_server.add('/video.bin', data)
+    path = tmp_path / 'video.bin'
+
+    assert download(url, str(path))
+    assert path.read_bytes() == data
+    # The probe, then one request per chunk
+    ranges = media_server.ranges_requested('/video.bin')
+    assert ranges[0] == 'bytes=0-0'
+    expected = {f"bytes={start}-{min(start + CHUNK, len(data)) - 1}" for start in range(0, len(data), CHUNK)}
+    assert sorted(ranges[1:]) == sorted(expected)
+    assert sorted(os.listdir(tmp_path)) == ['video.bin']
+
+
+def test_without_range_support_falls_back_to_one_request(media_server, tmp_path):
+    media_server.ranges = False
+    data = os.urandom(CHUNK * 4)
+    url = media_server.add('/video.bin', data)
+    path = tmp_path / 'video.bin'
+
+    assert download(url, str(path))
+    assert path.read_bytes() == data
+    # The ignored probe and the regular download
+    assert len([request for request in media_server.requests if request[0] == '/video.bin']) == 2
+
+
+def test_file_within_one_chunk_is_not_split(media_server, tmp_path):
+    data = os.urandom(CHUNK // 2)
+    url = media_server.add('/small.bin', data)
+    path = tmp_path / 'small.bin'
+
+    assert download(url, str(path))
+    assert path.read_bytes() == data
+    assert media_server.requests == [('/small.bin', 'bytes=0-0'), ('/small.bin', None)]
+
+
+def test_resume_fetches_only_missing_chunks(media_server, tmp_path):
+    data = os.urandom(CHUNK * 6)
+    url = media_server.add('/video.bin', data)
+    path = tmp_path / 'video.bin'
+    # An earlier attempt finished chunks 0, 1 and 4
+    done = [(0, CHUNK - 1), (CHUNK, 2 * CHUNK - 1), (4 * CHUNK, 5 * CHUNK - 1)]
+    partial = bytearray(len(data))
+    for start, end in done:
+        partial[start:end + 1] = data[start:end + 1]
+    (tmp_path / 'video.bin.part').write_bytes(bytes(partial))
+    (tmp_path / 'video.bin.part.chunks').write_text(''.join(f"{start}-{end}\n" for start, end in done))
+    meter = ThroughputMeter()
+
+    assert download(url, str(path), progress_hooks=[meter.hook])
+    assert path.read_bytes() == data
+    assert sorted(media_server.ranges_requested('/video.bin')[1:]) == sorted(
+        f"bytes={start}-{start + CHUNK - 1}" for start in (2 * CHUNK, 3 * CHUNK, 5 * CHUNK)
+    )
+    assert meter.bytes == 3 * CHUNK
+    assert sorted(os.listdir(tmp_path)) == ['video.bin']
+
+
+def test_partial_file_of_another_size_starts_over(media_server, tmp_path):
+    data = os.urandom(CHUNK * 3)
+    url = media_server.add('/video.bin', data)
+    path = tmp_path / 'video.bin'
+    (tmp_path / 'video.bin.part').write_bytes(b'\0' * CHUNK)
+    (tmp_path / 'video.bin.part.chunks').write_text(f"0-{CHUNK - 1}\n")
+
+    assert download(url, str(path))
+    assert path.read_bytes() == data
+    assert len(media_server.ranges_requested('/video.bin')) == 1 + 3
+
+
+def test_broken_range_continues_from_last_byte(media_server, tmp_path):
+    data = os.urandom(CHUNK * 4)
+    url = media_server.add('/video.bin', data)
+    path = tmp_path / 'video.bin'
+    media_server.break_ranges = {(CHUNK, 2 * CHUNK - 1)}
+
+    assert download(url, str(path), retry_sleep_functions={'http': lambda n: 0})
+    assert path.read_bytes() == data
+    ranges = media_server.ranges_requested('/video.bin')
+    assert ranges.count(f"bytes={CHUNK}-{2 * CHUNK - 1}") == 1
+    assert f"bytes={CHUNK + CHUNK // 2}-{2 * CHUNK - 1}" in ranges
+
+
+def test_is_transient():
+    assert is_transient(Exception("HTTP Error 503: Service Unavailable"))
+    assert is_transient(Exception("Read timed out"))
+    assert not is_transient(Exception("HTTP Error 404: Not Found"))
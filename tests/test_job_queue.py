@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import SharedJobManager
+from jobs import CANCELLED, DONE, FINISHED_STATES, QUEUED
+
+
+def work(job, value):
+    return {'value': value}
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def queue_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'queue.db'}"
+
+
+@pytest.fixture
+def managers():
+    started = []
+
+    def start(*args, **kwargs):
+        manager = SharedJobManager(*args, **kwargs)
+        started.append(manager)
+        return manager
+
+    yield start
+    for manager in started:
+        manager.close()
+
+
+def test_same_key_from_two_replicas_joins_one_job(queue_url, managers):
+    front = managers(queue_url, {'work': work}, 0, worker_id='front')
+    other = managers(queue_url, {'work': work}, 0, worker_id='other')
+
+    job_id = front.submit(work, 1, key='k', label='first')
+    assert other.submit(work, 1, key='k', label='second') == job_id
+    assert front.submit(work, 2, key='other') != job_id
+    assert other.get(job_id).requesters == 2
+    assert other.stats()['coalesced'] == 1
+
+    # The first cancel only withdraws one request
+    assert front.cancel(job_id)
+    assert front.get(job_id).state == QUEUED
+    assert front.get(job_id).requesters == 1
+    assert other.cancel(job_id)
+    assert front.get(job_id).state == CANCELLED
+
+    # A cancelled job is not joined again
+    assert front.submit(work, 1, key='k') != job_id
+
+
+def test_job_of_a_dead_replica_is_taken_over(queue_url, managers):
+    release = threading.Event()
+
+    def stuck(job, value):
+        release.wait(10)
+        return {'value': value, 'by': 'dead'}
+
+    dead = managers(queue_url, {'work': stuck}, 1, worker_id='dead', lease=0.5, heartbeat=0.05)
+    job_id = dead.submit(stuck, 1, key='k')
+    wait_for(lambda: dead.stats()['running_here'] == 1)
+    # The replica stops renewing its lease, as if the process had died
+    dead._stop.set()
+    dead._wake.set()
+    dead._thread.join()
+
+    def finish(job, value):
+        return {'value': value, 'by': 'alive'}
+
+    alive = managers(queue_url, {'work': finish}, 1, worker_id='alive', lease=0.5, heartbeat=0.05)
+    wait_for(lambda: alive.get(job_id).state in FINISHED_STATES)
+    release.set()
+    wait_for(lambda: dead.stats()['running_here'] == 0)
+
+    job = alive.get(job_id)
+    assert job.state == DONE
+    assert job.owner == 'alive'
+    assert job.result == {'value': 1, 'by': 'alive'}
+    assert alive.db.rows("SELECT attempts FROM jobs WHERE id = ?", (job_id,))[0][0] == 2
+    assert alive.stats()['recovered'] == 1
+
+
+def test_job_that_keeps_losing_its_worker_fails(queue_url, managers):
+    manager = managers(queue_url, {'work': work}, 0, worker_id='front', max_attempts=2)
+    job_id = manager.submit(work, 1)
+    manager.db.execute(
+        "UPDATE jobs SET state = 'running', owner = 'gone', attempts = 2, lease_expires = ? WHERE id = ?",
+        (time.time() - 1, job_id),
+    )
+    managers(queue_url, {'work': work}, 1, worker_id='alive', max_attempts=2, heartbeat=0.05)
+
+    wait_for(lambda: manager.get(job_id).state in FINISHED_STATES)
+    assert manager.get(job_id).error == "worker lost"
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from jobs import JobManager
+from prefetch import SpeculativePrefetcher
+
+
+def hold(job, release):
+    while not release.wait(0.02):
+        job.check_cancelled()
+
+
+def test_concurrent_speculations_respect_max_jobs():
+    manager = JobManager(8, platform_limits={'other': 8})
+    prefetcher = SpeculativePrefetcher('download', manager, max_bytes=100, max_jobs=1)
+    # The prefetcher runs two speculations at a time; both finish planning at the same moment
+    release, gate = threading.Event(), threading.Barrier(2, timeout=5)
+
+    def plan(info):
+        gate.wait()
+        return info, 10, lambda: start(info)
+
+    def start(info):
+        # Queueing takes a while, as it does on a shared queue
+        time.sleep(0.1)
+        return manager.submit(hold, release, label=info)
+
+    for n in range(2):
+        prefetcher.prefetch(f"key{n}", lambda n=n: f"video{n}", plan)
+    prefetcher._executor.shutdown(wait=True)
+    try:
+        stats = prefetcher.stats()
+        assert stats['downloads_started'] == 1
+        assert stats['skipped_busy'] == 1
+    finally:
+        release.set()
+    while manager.stats()['running_here']:
+        time.sleep(0.02)
+
+
+def test_info_mode_needs_no_job_manager():
+    prefetcher = SpeculativePrefetcher('info', None)
+    prefetcher.prefetch('key', lambda: {'id': 'x'}, lambda info: None)
+    assert prefetcher.wait_info('key', timeout=5)
+    assert prefetcher.claim('key', 'cache-key') is None
+    prefetcher.abandon('key')
+    assert prefetcher.stats()['info_used'] == 1
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+import time
+
+from scratch import DIR_PREFIX, OWNER_FILE, ScratchStorage
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def crashed_dir(root, owner, files, age=0):
+    """A job directory left behind by a process that died mid-download"""
+    path = root / f"{DIR_PREFIX}{owner}"
+    path.mkdir(parents=True)
+    (path / OWNER_FILE).write_text(str(dead_pid()))
+    written = time.time() - age
+    for name in files:
+        (path / name).write_bytes(b'x' * 10)
+        os.utime(path / name, (written, written))
+    return path
+
+
+def test_restart_resumes_recent_partial_downloads(tmp_path):
+    root = tmp_path / 'scratch'
+    recent = crashed_dir(root, 'recent', ['video.mp4.part', 'video.mp4.part.chunks'])
+    stale = crashed_dir(root, 'stale', ['video.mp4.part'], age=7200)
+    empty = crashed_dir(root, 'empty', ['video.mp4'])
+
+    scratch = ScratchStorage(str(root), reserve_bytes=0, resume_ttl=3600)
+    assert recent.exists()
+    assert not stale.exists() and not empty.exists()
+    assert scratch.stats()['orphans_kept'] == 1
+    assert scratch.stats()['orphans_removed'] == 2
+
+    # The restarted process gets the directory back, partial files included
+    assert scratch.allocate('recent') == str(recent)
+    assert (recent / 'video.mp4.part').exists()
@@ -0,0 +1,52 @@
+from core import build_audio_opts
+from ydl_pool import YoutubeDLPool
+
+FORMATS = [
+    {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 130, 'tbr': 130},
+    {'format_id': '251', 'ext': 'webm', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160, 'tbr': 160},
+    {'format_id': '136', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 2000},
+    {'format_id': '137', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'tbr': 4000},
+]
+
+
+def selected(ydl):
+    formats = [dict(f, url=f"http://127.0.0.1/{f['format_id']}", protocol='http') for f in FORMATS]
+    info = ydl.process_ie_result(
+        {'id': 'x', 'title': 'x', 'extractor': 'test', 'extractor_key': 'Test', 'formats': formats},
+        download=False,
+    )
+    return info['format_id']
+
+
+def test_planned_formats_share_one_instance():
+    pool = YoutubeDLPool(max_per_profile=1)
+    base = {'quiet': True, 'simulate': True}
+    planned = (
+        ('137+140', 'mp4', '137+140'),
+        ('136+251', 'mkv', '136+251'),
+    )
+    instances = set()
+    for selector, container, format_id in planned:
+        options = dict(base, format=f"{selector}/bestvideo+bestaudio/best", merge_output_format=container)
+        with pool.checkout('video', options) as ydl:
+            instances.add(id(ydl))
+            assert selected(ydl) == format_id
+            assert ydl.params.get('merge_output_format') == container
+    assert len(instances) == 1
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['reused'] == 1
+
+    # Back in the pool, the instance has forgotten the last request's format
+    with pool.checkout('video', base) as ydl:
+        assert 'format' not in ydl.params
+        assert selected(ydl) == '137+251'
+
+
+def test_planned_audio_selectors_share_one_instance():
+    pool = YoutubeDLPool(max_per_profile=1)
+    for selector, format_id in (('140/bestaudio/best', '140'), ('251/bestaudio/best', '251'), (None, '140')):
+        options = dict(build_audio_opts('m4a', '128', selector), quiet=True, simulate=True)
+        with pool.checkout('audio', options) as ydl:
+            assert selected(ydl) == format_id
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['reused'] == 2
@@ -0,0 +1,149 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+logger = logging.getLogger("UniversalDownloader")
+
+# Thumbnails larger than this upstream are not worth fetching
+MAX_SOURCE_BYTES = 5 * 1024 ** 2
+
+
+class ThumbnailCache:
+    """Video thumbnails fetched once, resized to width and re-encoded as JPEG.
+
+    Entries are keyed by video identity rather than URL, so a thumbnail keeps
+    rendering after the platform's signed URL expires or starts refusing
+    hotlinks. Encoded images live on disk (at most max_disk_entries, least
+    recently used go first) with the hottest max_memory_entries in memory.
+    A failed fetch is not retried for retry_after seconds.
+    """
+
+    def __init__(self, cache_dir, width=480, quality=80, max_memory_entries=128, max_disk_entries=2000,
+                 retry_after=300):
+        self.cache_dir = cache_dir
+        self.width = width
+        self.quality = quality
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.retry_after = retry_after
+        self._memory = OrderedDict()
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._stores_since_prune = 0
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'fetches': 0, 'failures': 0,
+                         'source_bytes': 0, 'served_bytes': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.jpg')
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key, url, fetch):
+        """JPEG bytes of the thumbnail for key, fetching url with fetch(url) -> bytes on a miss; None if unavailable"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                self.counters['served_bytes'] += len(data)
+                return data
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            self._remember(key, data)
+            with self._lock:
+                self.counters['disk_hits'] += 1
+                self.counters['served_bytes'] += len(data)
+            return data
+        except OSError:
+            pass
+        if not url:
+            return None
+        with self._lock:
+            if time.time() - self._failed.get(key, 0) < self.retry_after:
+                return None
+        try:
+            source = fetch(url)
+            data = self._encode(source)
+        except Exception as e:
+            logger.info(f"Thumbnail for {key} unavailable: {str(e)}")
+            now = time.time()
+            with self._lock:
+                if len(self._failed) >= 1000:
+                    self._failed = {k: t for k, t in self._failed.items() if now - t < self.retry_after}
+                self._failed[key] = now
+                self.counters['failures'] += 1
+            return None
+        self._store(key, data)
+        with self._lock:
+            self._failed.pop(key, None)
+            self.counters['fetches'] += 1
+            self.counters['source_bytes'] += len(source)
+            self.counters['served_bytes'] += len(data)
+        logger.info(f"Thumbnail for {key} cached: {len(source)} -> {len(data)} bytes")
+        return data
+
+    def _encode(self, source):
+        if len(source) > MAX_SOURCE_BYTES:
+            raise ValueError(f"thumbnail larger than {MAX_SOURCE_BYTES} bytes")
+        with Image.open(io.BytesIO(source)) as image:
+            image = image.convert('RGB')
+            if image.width > self.width:
+                image = image.resize((self.width, round(image.height * self.width / image.width)), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+    def _store(self, key, data):
+        self._remember(key, data)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.info(f"Thumbnail cache disk write failed for {key}: {e}")
+        with self._lock:
+            self._stores_since_prune += 1
+            should_prune = self._stores_since_prune >= 50
+            if should_prune:
+                self._stores_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """Remove the least recently used files beyond max_disk_entries"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort()
+        for _, path in files[:max(len(files) - self.max_disk_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self._memory)
+        return stats
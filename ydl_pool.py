@@ -0,0 +1,165 @@
+import json
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import yt_dlp
+
+logger = logging.getLogger("UniversalDownloader")
+
+# Per-request options that are applied at checkout instead of being part of the instance
+PER_REQUEST_OPTIONS = (
+    'progress_hooks', 'postprocessor_hooks', 'paths', 'download_ranges', 'force_keyframes_at_cuts',
+    'format', 'merge_output_format',
+)
+
+# Of those, the ones passed in the options and set on the instance's params for one checkout
+# (a time range or a planned format id would otherwise make nearly every download a profile of its own)
+REQUEST_PARAMS = ('download_ranges', 'force_keyframes_at_cuts', 'format', 'merge_output_format')
+
+
+def options_fingerprint(options):
+    return json.dumps(
+        {k: v for k, v in options.items() if k not in PER_REQUEST_OPTIONS},
+        sort_keys=True, default=repr,
+    )
+
+
+class _PooledYDL:
+    """A YoutubeDL plus the hook slots that are re-pointed for every checkout"""
+
+    def __init__(self, options, ydl_class=yt_dlp.YoutubeDL):
+        self.progress_hooks = []
+        self.postprocessor_hooks = []
+        options = {k: v for k, v in options.items() if k not in PER_REQUEST_OPTIONS}
+        options['progress_hooks'] = [self._dispatch_progress]
+        options['postprocessor_hooks'] = [self._dispatch_postprocessor]
+        self.ydl = ydl_class(options)
+        self.default_format_selector = self.ydl.format_selector
+
+    def select_format(self, format_spec):
+        """Select formats with format_spec; yt-dlp compiles params['format'] only when an instance is built"""
+        self.ydl.format_selector = (
+            format_spec if format_spec in (None, '-') or callable(format_spec)
+            else self.ydl.build_format_selector(format_spec)
+        )
+
+    def _dispatch_progress(self, d):
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def _dispatch_postprocessor(self, d):
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+    def close(self):
+        self.ydl.close()
+
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL instances, one idle queue per (profile, options) pair.
+
+    An instance keeps its extractors, cookies and HTTP sessions between
+    requests, so keep-alive connections to the same CDN are reused. Each
+    instance is used by one thread at a time; when every pooled instance of a
+    profile is busy an extra one is built and closed after use.
+    """
+
+    def __init__(self, max_per_profile=4, max_profiles=32, ydl_class=yt_dlp.YoutubeDL):
+        self.max_per_profile = max_per_profile
+        self.max_profiles = max_profiles
+        self.ydl_class = ydl_class
+        self._idle = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.counters = {'created': 0, 'reused': 0, 'overflow': 0, 'closed': 0}
+
+    def _acquire(self, key, options):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle is None:
+                idle = self._idle[key] = queue.LifoQueue()
+                self._sizes[key] = 0
+                self._evict_profiles()
+            self._idle.move_to_end(key)
+            try:
+                pooled = idle.get_nowait()
+                self.counters['reused'] += 1
+                return pooled, True
+            except queue.Empty:
+                pass
+            pooled_slot = self._sizes[key] < self.max_per_profile
+            if pooled_slot:
+                self._sizes[key] += 1
+                self.counters['created'] += 1
+            else:
+                self.counters['overflow'] += 1
+        try:
+            return _PooledYDL(options, self.ydl_class), pooled_slot
+        except Exception:
+            if pooled_slot:
+                with self._lock:
+                    self._sizes[key] -= 1
+            raise
+
+    def _evict_profiles(self):
+        while len(self._idle) > self.max_profiles:
+            key, idle = self._idle.popitem(last=False)
+            self._sizes.pop(key, None)
+            while not idle.empty():
+                self._close(idle.get_nowait())
+
+    def _close(self, pooled):
+        try:
+            pooled.close()
+        except Exception as e:
+            logger.info(f"Closing pooled YoutubeDL failed: {str(e)}")
+        self.counters['closed'] += 1
+
+    @contextmanager
+    def checkout(self, profile, options, paths=None, progress_hooks=(), postprocessor_hooks=()):
+        """Yield a YoutubeDL for options with per-request output paths and hooks applied"""
+        key = (profile, options_fingerprint(options))
+        pooled, returnable = self._acquire(key, options)
+        pooled.progress_hooks = list(progress_hooks)
+        pooled.postprocessor_hooks = list(postprocessor_hooks)
+        pooled.ydl.params['paths'] = dict(paths or {})
+        request_params = {k: options[k] for k in REQUEST_PARAMS if k in options}
+        pooled.ydl.params.update(request_params)
+        broken = False
+        try:
+            if 'format' in request_params:
+                pooled.select_format(request_params['format'])
+            yield pooled.ydl
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError):
+            # Ordinary extraction/download failures leave the instance reusable
+            raise
+        except BaseException:
+            # An aborted download can leave the instance mid-way; don't hand it out again
+            broken = True
+            raise
+        finally:
+            pooled.progress_hooks = []
+            pooled.postprocessor_hooks = []
+            pooled.ydl.params['paths'] = {}
+            for k in request_params:
+                pooled.ydl.params.pop(k, None)
+            pooled.ydl.format_selector = pooled.default_format_selector
+            with self._lock:
+                idle = self._idle.get(key)
+                keep = returnable and not broken and idle is not None
+                if returnable and not keep and idle is not None:
+                    self._sizes[key] -= 1
+            if keep:
+                idle.put(pooled)
+            else:
+                self._close(pooled)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['profiles'] = len(self._idle)
+            stats['idle'] = sum(q.qsize() for q in self._idle.values())
+        return stats